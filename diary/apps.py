@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class DiaryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'diary'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import file_serving, views
+
+        # ポートフォリオの PDF の実パスはリクエストを受ける前に探しておく
+        file_serving.preload_static_paths(f"portfolio/{name}" for name in views.PORTFOLIO_PDFS)
@@ -0,0 +1,282 @@
+# diary/async_views.py
+"""カレンダー・記録画面の async 版ビュー（ASGI で DIARY_ASYNC_VIEWS=True のときに使う）
+
+DB は async ORM（aget / afirst / async for など）で読み書きし、
+写真ファイルの読み書き・画像検証はスレッドプールに逃がしてイベントループを塞がない。
+振る舞い・画面は views.py の同名ビューと同じ。
+"""
+from datetime import date, timedelta
+from datetime import date as dt_date
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import Http404
+from django.shortcuts import redirect, render
+from django.urls import reverse
+
+from . import calendar_grid
+from . import moods as mood_registry
+from . import recorded_days as recorded_days_store
+from . import photo_upload, uploads
+from .forms import RecordForm
+from .instrumentation import query_budget
+from .models import Record
+from .month_cache import aget_month_state
+from .views import record_error_context
+
+# ファイル I/O 専用（DB に触れない処理だけを渡す）
+run_io = partial(sync_to_async, thread_sensitive=False)
+
+
+async def _get_user(request):
+    # テンプレートやフォームから request.user を触っても同期 DB アクセスにならないよう解決しておく
+    user = await request.auser()
+    request.user = user
+    return user
+
+
+async def _aget_own_record(user, pk):
+    try:
+        return await Record.objects.aget(pk=pk, user=user)
+    except Record.DoesNotExist:
+        raise Http404("No Record matches the given query.")
+
+
+#ログイン後操作可
+@query_budget(6)
+@login_required
+async def calendar_view(request):
+    user = await _get_user(request)
+    year = request.GET.get('year')
+    month = request.GET.get('month')
+
+    today = date.today()
+    if year and month:
+        year = int(year)
+        month = int(month)
+    else:
+        year = today.year
+        month = today.month
+
+    # このユーザーの表示範囲の記録（色・写真）を1クエリ＋キャッシュで取得
+    records_by_date, _ = await aget_month_state(user.pk, year, month)
+    recorded_dates = [dt_date.fromisoformat(d) for d in records_by_date]
+
+    # 前月・次月
+    first_day  = date(year, month, 1)
+    prev_month = first_day - timedelta(days=1)
+    next_month = date(year + (month // 12), (month % 12) + 1, 1)
+
+    context = {
+        "year": year,
+        "month": month,
+        # 日付の枠（月曜始まり）は全ユーザー共通の断片をキャッシュから
+        "grid": await calendar_grid.arender_fragment(year, month, today),
+        "today": today,
+        "prev_month": prev_month,
+        "next_month": next_month,
+        "recorded_dates": recorded_dates,
+        "records_by_date": records_by_date,
+        # 写真の名前 → URL（本人確認つきの photo_file）
+        "photo_base_url": Record._meta.get_field("photo").storage.base_url,
+    }
+
+    if await request.session.apop("show_login_tip", False):
+        messages.success(request, "今日の気分を記録しましょう！", extra_tags="hint")
+
+    return render(request, "diary/calendar.html", context)
+
+
+@query_budget(20)
+@login_required
+async def record_view(request, selected_date=None):
+    user = await _get_user(request)
+
+    async def _stage_photo(form):
+        """入力エラー時：写真を一時置き場へ移し、再表示画面からトークンで参照する"""
+        token = (request.POST.get("staged_photo") or "").strip()
+        # 一時置き場にも正規化（縮小・再圧縮）した写真を置く
+        uploaded = form.cleaned_data.get("photo") if "photo" in request.FILES else None
+        if uploaded and "photo" not in form.errors:
+            await run_io(uploads.discard)(user, token)
+            token = await run_io(uploads.stage_upload)(user, uploaded)
+        if not await run_io(uploads.staged_name)(user, token):
+            return {}
+        return {
+            "staged_photo_token": token,
+            "staged_photo_url": reverse("staged_photo", args=[token]),
+        }
+
+    async def _render_error(form, existing):
+        return render(request, "diary/record.html", record_error_context(request, form, existing, {
+            "moods": moods,
+            "display_date": initial_date,
+            "recorded_days": recorded_days,
+            **await _stage_photo(form),
+        }))
+
+    # --- 日付の取得（?date=YYYY-MM-DD） ---
+    date_str = request.GET.get("date", "") or selected_date or ""
+    initial_date = None
+    try:
+        if date_str:
+            initial_date = dt_date.fromisoformat(date_str)
+    except ValueError:
+        pass
+
+    # --- 既存レコード（編集判定） ---
+    existing = None
+    if initial_date:
+        existing = await Record.objects.filter(user=user, date=initial_date).afirst()
+
+    # --- 気分（5色）：プロセス内レジストリから（初回だけ DB から読む） ---
+    moods = await sync_to_async(mood_registry.all_moods)()
+
+    # 上書き確認用：表示中の年の記録済み日（ビットマップ）
+    recorded_year = (initial_date or date.today()).year
+    recorded_days = {
+        "years": {
+            str(recorded_year): recorded_days_store.encode(
+                await recorded_days_store.ayear_bitmap(user.pk, recorded_year)
+            ),
+        },
+        "url": reverse("recorded_days_api"),
+    }
+
+    if request.method == "POST":
+        # ★ 記録削除処理
+        if "delete_record" in request.POST:
+            if existing:
+                await existing.adelete()  # 写真ファイルはジョブで消す（signals / photo_tasks）
+                messages.success(request, "記録を削除しました")
+            else:
+                messages.info(request, "削除する記録はありません")
+            return redirect("calendar")
+
+        # ★ 写真削除処理
+        if "remove_photo" in request.POST:
+            if existing and existing.photo:
+                existing.photo = None
+                await existing.asave(update_fields=["photo"])
+                messages.success(request, "写真を削除しました")
+            if initial_date:
+                return redirect("record_with_date", selected_date=initial_date.isoformat())
+            else:
+                return redirect("record")
+
+        # 通常の保存処理
+        form = RecordForm(request.POST, request.FILES, instance=existing)
+        # 検証（画像ファイルの読み込み・気分の確認）は同期スレッドで先に済ませる。
+        # 以降の add_error / is_valid は検証済みの結果を触るだけなので、そのまま呼ぶ
+        await sync_to_async(form.full_clean)()
+        # 大きすぎて受信中に捨てた写真（photo_upload.MaxSizeUploadHandler）
+        for field, message in photo_upload.rejected_uploads(request).items():
+            form.add_error(field, message)
+
+        # “日付未入力”を検出
+        post_date_str = (request.POST.get("date") or "").strip()
+        if not post_date_str:
+            form.add_error("date", "日付を入力してください")
+            messages.error(request, "入力内容にエラーがあります")
+            return await _render_error(form, existing)
+
+        #  気分必須チェック（レジストリの読み直しは DB を読むので同期スレッドで）
+        mood_id = (request.POST.get("mood") or "").strip()
+        mood_obj = await sync_to_async(mood_registry.get_mood)(mood_id)
+        if not mood_id:
+            form.add_error("mood", "気分を選択してください")
+        elif mood_obj is None:
+            form.add_error("mood", "もう一度選び直してください")
+
+        if not form.is_valid():
+            messages.error(request, "入力内容にエラーがあります")
+            return await _render_error(form, existing)
+        # ここで必ず存在するMoodを使う（なければ404）
+        if mood_obj is None:
+            raise Http404("Mood not found")
+
+        data = form.cleaned_data
+        save_date = data.get("date")
+
+        # 日付範囲制限
+        if save_date and save_date > date.today():
+            form.add_error("date", "未来の日付は記録できません")
+            messages.error(request, "未来の日付は記録できません", extra_tags="modal future-date")
+            return await _render_error(form, existing)
+        if not save_date:
+            form.add_error("date", "日付を入力してください")
+            return await _render_error(form, existing)
+
+        note_value = (data.get("note") or "").strip()
+        uploaded   = data.get("photo") if "photo" in request.FILES else None  # 正規化済み（RecordForm.clean_photo）
+        staged_token = (request.POST.get("staged_photo") or "").strip()
+        if not uploaded and staged_token:
+            # 前回エラー時に一時保存した写真を再アップロードなしで使う
+            uploaded = await run_io(uploads.open_staged)(user, staged_token)
+
+        if existing and existing.date and save_date != existing.date:
+            form.add_error("date", "日付は変更できません（別日で記録したい場合は、その日付を開いて記録してください）")
+            messages.error(request, "入力内容にエラーがあります")
+            return await _render_error(form, existing)
+
+        # DBを更新or新規作成
+        instance, created = await Record.objects.aupdate_or_create(
+            user=user,
+            date=save_date,
+            defaults={
+                "mood": mood_obj,
+                "note": note_value,
+            },
+        )
+
+        if uploaded:
+            # 写真ファイルの書き込みだけ行い、加工と古い写真の削除はジョブに回す（signals / photo_tasks）
+            instance.photo = uploaded
+            await instance.asave(update_fields=["photo"])
+
+        if staged_token:
+            if uploaded:
+                uploaded.close()
+            await run_io(uploads.discard)(user, staged_token)
+
+        messages.success(request, "記録を保存しました")
+        return redirect("calendar")
+
+    form = RecordForm(instance=existing) if existing else RecordForm(initial={"date": initial_date})
+    selected_mood_id = str(existing.mood_id) if (existing and existing.mood_id) else None
+
+    return render(request, "diary/record.html", {
+        "form": form,
+        "moods": moods,
+        "selected_mood_id": selected_mood_id,
+        "has_record": bool(existing),
+        "display_date": initial_date,
+        "current_photo": (existing.photo if (existing and existing.photo) else None),
+        "recorded_days": recorded_days,
+    })
+
+
+@query_budget(12)
+@login_required
+async def record_delete(request, pk):
+    user = await _get_user(request)
+    record = await _aget_own_record(user, pk)
+    await record.adelete()
+    messages.success(request, "記録を削除しました")
+    return redirect("calendar")
+
+
+@query_budget(12)
+@login_required
+async def photo_delete(request, pk):
+    user = await _get_user(request)
+    record = await _aget_own_record(user, pk)
+    if record.photo:
+        record.photo = None
+        await record.asave()
+        messages.success(request, "写真を削除しました")
+    else:
+        messages.info(request, "削除できる写真がありません")
+    return redirect("calendar")
@@ -1,19 +1,32 @@
 # diary/auth_backends.py
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
+from django.db.models.functions import Lower
 
 UserModel = get_user_model()
 
+
+def users_with_email(email):
+    """メールアドレス（大文字小文字を無視）で絞り込む。LOWER(email) の索引が効く形で比較する"""
+    return (
+        UserModel._default_manager
+        .alias(email_lower=Lower("email"))
+        .filter(email_lower=(email or "").strip().lower())
+    )
+
+
 class EmailBackend(ModelBackend):
-    """email と password で認証"""
+    """email と password で認証（1クエリ・ハッシュ計算1回）"""
     def authenticate(self, request, email=None, username=None, password=None, **kwargs):
         login_id = (email or username or "").strip()
         if not login_id or not password:
             return None
-        try:
-            user = UserModel.objects.get(email__iexact=login_id)
-        except UserModel.DoesNotExist:
+        user = users_with_email(login_id).order_by("-id").first()
+        if user is None:
+            # 存在しないアドレスでも同じだけ時間をかける（ユーザー有無の推測対策）
+            UserModel().set_password(password)
             return None
+        # 反復回数などが変わっていれば check_password がその場で再ハッシュして保存する
         if user.check_password(password) and self.user_can_authenticate(user):
             return user
         return None
@@ -0,0 +1,54 @@
+# diary/calendar_grid.py
+"""月表示の日付の枠（ユーザーによらない部分）
+
+表の枠（週の行・日付・今日の印）は (年, 月, 今日) が同じなら誰でも同じなので、
+描画済みの HTML 断片をキャッシュして使い回す。ユーザーごとの記録（色・写真）は
+records-by-date の JSON から画面側で重ねる（calendar.js）。
+"""
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from .month_cache import month_window
+
+# テンプレート（_calendar_grid.html）を変えたら上げる
+KEY_PREFIX = "diary:calgrid:v1"
+CACHE_TIMEOUT = getattr(settings, "DIARY_CALENDAR_GRID_CACHE_TIMEOUT", 60 * 60 * 24)
+
+
+def _key(year, month, today):
+    return f"{KEY_PREFIX}:{year}:{month:02d}:{today:%Y%m%d}"
+
+
+def render_fragment(year, month, today=None):
+    """月の枠の HTML 断片（今日の印があるので日付が変わると別のキー）"""
+    today = today or date.today()
+    key = _key(year, month, today)
+    html = cache.get(key)
+    if html is None:
+        html = _render(year, month, today)
+        cache.set(key, html, CACHE_TIMEOUT)
+    return html
+
+
+async def arender_fragment(year, month, today=None):
+    """render_fragment の async 版（キャッシュの読み書きだけ await する）"""
+    today = today or date.today()
+    key = _key(year, month, today)
+    html = await cache.aget(key)
+    if html is None:
+        html = _render(year, month, today)
+        await cache.aset(key, html, CACHE_TIMEOUT)
+    return html
+
+
+def _render(year, month, today):
+    month_days, _, _ = month_window(year, month)
+    return render_to_string("diary/_calendar_grid.html", {
+        "year": year,
+        "month": month,
+        "month_days": month_days,
+        "today": today,
+    })
@@ -0,0 +1,115 @@
+# diary/db_router.py
+"""読み取りをレプリカに振り分ける DB ルーター（書き込みは常にプライマリ）
+
+- レプリカを読むのは ReplicaRoutingMiddleware が「読んでよい」とした GET / HEAD のリクエストの中だけ。
+  ジョブ・管理コマンド・シグナルなどリクエストの外はすべてプライマリを読む（遅れた内容で処理しない）。
+- POST などの書き込みのリクエストは、読み取りも最初からプライマリ（読んでから書く処理で古い行を見ない）。
+- GET の途中で書き込んだら（セッションの延長など）、そのリクエストの残りはプライマリを読む。
+- 書き込んだリクエストの応答にはクッキーを付け、DIARY_DB_PIN_SECONDS 秒はその利用者をプライマリに固定する
+  （保存直後のカレンダーに、まだレプリカに届いていない記録が出ない：read-your-writes）。
+  この秒数はレプリカの遅れより長くしておく。
+
+レプリカは DATABASES の "default" 以外の別名（DIARY_DB_REPLICAS）。未設定なら何もしない。
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICAS = list(getattr(settings, "DIARY_DB_REPLICAS", []))
+PIN_SECONDS = getattr(settings, "DIARY_DB_PIN_SECONDS", 10)
+PIN_COOKIE = "diary_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# このコンテキスト（リクエスト）でレプリカを読んでよいか / プライマリに書いたか
+_replica_reads = ContextVar("diary_replica_reads", default=False)
+_wrote = ContextVar("diary_wrote_primary", default=False)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """この中の読み取りをレプリカに回す（書き込みがあるまで）。enabled=False ならプライマリ"""
+    reads, wrote = _replica_reads.set(enabled and bool(REPLICAS)), _wrote.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(reads)
+        _wrote.reset(wrote)
+
+
+@contextmanager
+def use_primary():
+    """この中の読み取りはプライマリ（レプリカの遅れを許せない処理用）"""
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def wrote_primary():
+    return _wrote.get()
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # トランザクションの中はプライマリの内容と揃える
+            return DEFAULT_DB_ALIAS
+        return random.choice(REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        if _replica_reads.get():
+            # 書いたあとは、このリクエストの残りもプライマリを読む
+            _replica_reads.set(False)
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # どの別名も同じデータ
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # レプリカはプライマリから複製する
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    """リクエストごとに読み先を決め、書き込んだら利用者をしばらくプライマリに固定する（WSGI/ASGI 両対応）
+
+    SessionMiddleware より前に置く（応答時のセッション保存も「書き込み」として数える）。
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _use_replicas(self, request):
+        return request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with replica_reads(self._use_replicas(request)):
+            response = self.get_response(request)
+            return self._finish(response, wrote_primary())
+
+    async def __acall__(self, request):
+        with replica_reads(self._use_replicas(request)):
+            response = await self.get_response(request)
+            return self._finish(response, wrote_primary())
+
+    def _finish(self, response, wrote):
+        if wrote and REPLICAS:
+            response.set_cookie(
+                PIN_COOKIE, "1", max_age=PIN_SECONDS, httponly=True, samesite="Lax",
+                secure=settings.SESSION_COOKIE_SECURE,
+            )
+        return response
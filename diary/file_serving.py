@@ -0,0 +1,160 @@
+# diary/file_serving.py
+"""ファイル配信（写真・一時写真・ポートフォリオの PDF）
+
+- ETag（サイズ + 更新時刻）と Last-Modified を付け、If-None-Match / If-Modified-Since には 304 を返す。
+- DIARY_SENDFILE が "xsendfile"（Apache / lighttpd）か "xaccel"（nginx）なら、中身は前段のサーバーに
+  送らせる（Django はヘッダーだけ返す。Range も前段が処理する）。
+  X-Accel-Redirect は DIARY_SENDFILE_LOCATIONS（実ディレクトリ → nginx の internal な location）で変換する。
+- 送らせない場合は Python から送り、単一の Range（bytes=a-b）には 206 で返す。
+- 静的ファイルのパスは起動時（DiaryConfig.ready の preload_static_paths）に探して覚えておく
+  （リクエストごとに finders.find() しない）。
+"""
+import mimetypes
+import os
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.encoding import iri_to_uri
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+SENDFILE = getattr(settings, "DIARY_SENDFILE", "")
+SENDFILE_LOCATIONS = getattr(settings, "DIARY_SENDFILE_LOCATIONS", {})
+CHUNK_SIZE = 64 * 1024
+# 名前に内容ハッシュが入っている本人用のファイル（写真）
+IMMUTABLE_PRIVATE = "private, max-age=31536000, immutable"
+PDF_CACHE_CONTROL = getattr(settings, "DIARY_PDF_CACHE_CONTROL", "public, max-age=86400")
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+@lru_cache(maxsize=None)
+def static_path(name):
+    """静的ファイルの実パス（collectstatic 済みなら STATIC_ROOT、なければ finders）。なければ None"""
+    root = getattr(settings, "STATIC_ROOT", None)
+    if root:
+        candidate = os.path.join(root, name)
+        if os.path.isfile(candidate):
+            return candidate
+    return finders.find(name)
+
+
+def preload_static_paths(names):
+    """names の静的ファイルのパスを探して static_path に覚えさせる（起動時に呼ぶ）"""
+    for name in names:
+        static_path(name)
+
+
+def etag_for(stat):
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """単一の Range を (start, end) で返す。解釈できなければ None、範囲外なら (size, size)"""
+    m = RANGE_RE.match((header or "").strip())
+    if not m or size == 0:
+        return None
+    first, last = m.groups()
+    if first == "":
+        if not last or int(last) == 0:
+            return None
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        return size, size
+    if start > end:
+        return None
+    return start, end
+
+
+def _if_range_matches(request, etag, mtime):
+    value = request.headers.get("If-Range")
+    if not value:
+        return True
+    if value.strip() == etag:
+        return True
+    since = parse_http_date_safe(value)
+    return since is not None and int(mtime) <= since
+
+
+def _iter_range(f, start, length):
+    try:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(CHUNK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        f.close()
+
+
+def _sendfile_location(path):
+    # 一番長く一致する実ディレクトリの location に置き換える
+    best = None
+    for root, location in SENDFILE_LOCATIONS.items():
+        root = os.path.join(os.path.abspath(root), "")
+        if path.startswith(root) and (best is None or len(root) > len(best[0])):
+            best = (root, location)
+    if best is None:
+        return None
+    return best[1].rstrip("/") + "/" + iri_to_uri(path[len(best[0]):].replace(os.sep, "/"))
+
+
+def _offload(path, content_type):
+    if SENDFILE == "xsendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = path
+        return response
+    if SENDFILE == "xaccel":
+        location = _sendfile_location(path)
+        if location:
+            response = HttpResponse(content_type=content_type)
+            response["X-Accel-Redirect"] = location
+            return response
+    return None
+
+
+def serve_file(request, path, content_type=None, filename=None, cache_control="private, no-cache"):
+    """path のファイルを返す（FileNotFoundError はそのまま上げる）"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    etag = etag_for(stat)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        not_modified["Cache-Control"] = cache_control
+        return not_modified
+
+    content_type = content_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+    response = _offload(path, content_type)
+    if response is None:
+        size = stat.st_size
+        byte_range = None
+        if "Range" in request.headers and _if_range_matches(request, etag, stat.st_mtime):
+            byte_range = parse_range(request.headers["Range"], size)
+        if byte_range == (size, size):
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+        if byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                _iter_range(open(path, "rb"), start, end - start + 1), status=206, content_type=content_type,
+            )
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+            response["Content-Length"] = str(end - start + 1)
+        else:
+            response = FileResponse(open(path, "rb"), content_type=content_type)
+        response["Accept-Ranges"] = "bytes"
+
+    if filename:
+        response["Content-Disposition"] = content_disposition_header(False, filename)
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    response["Cache-Control"] = cache_control
+    return response
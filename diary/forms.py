@@ -1,20 +1,48 @@
 from django import forms
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
 from .models import Record, Mood
+from . import moods as mood_registry
+from . import photo_upload
+
+
+class MoodChoiceField(forms.ModelChoiceField):
+    """選択された気分はレジストリ（メモリ）から引く：検証時に Mood を問い合わせない"""
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        mood = mood_registry.get_mood(value)
+        if mood is None:
+            raise ValidationError(
+                self.error_messages["invalid_choice"],
+                code="invalid_choice",
+                params={"value": value},
+            )
+        return mood
 
 
 class RecordForm(forms.ModelForm):
+    # 気分は MoodChoiceField で検証済みなので Meta.fields に入れない
+    # （モデル側の検証で ForeignKey の存在確認クエリを出させない）。インスタンスへは clean() で載せる
+    mood = MoodChoiceField(
+        queryset=Mood.objects.all(),
+        required=False,
+        empty_label="（未選択）",
+        label="気分",
+        widget=forms.Select(attrs={"id": "mood"}),
+    )
+
     class Meta:
         model = Record
-        fields = ["date", "mood", "note", "photo"]
+        fields = ["date", "note", "photo"]
         labels = {
             "date": "Date",
-            "mood": "気分",
             "note": "メモ",
             "photo": "写真",
         }
         widgets = {
             "date":  forms.DateInput(attrs={"type": "date"}),
-            "mood":  forms.Select(attrs={"id": "mood"}),
             "note":  forms.Textarea(attrs={"rows": 4, "placeholder": "メモ"}),
             "photo": forms.ClearableFileInput(attrs={
                 "id": "photo-input",
@@ -24,16 +52,26 @@ class RecordForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # 気分は任意（未選択OK）
-        self.fields["mood"].required = False
-        # 並びやすく取得（赤→橙→黄→緑→青の順整列は views でやっていれば不要）
-        self.fields["mood"].queryset = Mood.objects.all().order_by("id")
-        self.fields["mood"].empty_label = "（未選択）"
+        if self.instance.mood_id is not None:
+            self.initial.setdefault("mood", self.instance.mood_id)
         # 念のため（モデルが blank=True でもフォーム側でも任意に）
         if "photo" in self.fields:
             self.fields["photo"].required = False
 
+    # 新しくアップロードされた写真は縮小・再圧縮してから保存する
+    def clean_photo(self):
+        photo = self.cleaned_data.get("photo")
+        if isinstance(photo, UploadedFile):
+            return photo_upload.normalize(photo)
+        return photo
+
     # 空文字が来たら None にして保存する（ForeignKey で安全）
     def clean_mood(self):
         m = self.cleaned_data.get("mood")
         return m or None
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if "mood" in cleaned_data:
+            self.instance.mood = cleaned_data["mood"]
+        return cleaned_data
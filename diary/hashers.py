@@ -0,0 +1,14 @@
+# diary/hashers.py
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    反復回数を DIARY_PBKDF2_ITERATIONS で調整できる PBKDF2（アルゴリズム名は標準と同じ）
+    回数を変えると、既存ユーザーは次回ログイン成功時に新しい回数で再ハッシュされる
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, "DIARY_PBKDF2_ITERATIONS", PBKDF2PasswordHasher.iterations)
@@ -0,0 +1,213 @@
+# diary/instrumentation.py
+"""リクエストごとの処理時間・DB時間・クエリ数の計測
+
+QueryInstrumentationMiddleware が URL 名ごとにプロセス内で集計する。
+ビューには @query_budget(n) で「1リクエストあたりのクエリ数の上限」を、
+@latency_budget(ms) で「処理時間の上限」を宣言でき、
+超えた場合はログに警告を出す（テストでは diary.testing のヘルパーで失敗にする）。
+DIARY_JOBS_EAGER でリクエスト中に動いたジョブ（diary.jobs）のクエリは uncounted() で数えない。
+
+StreamingHttpResponse（records_export など）は本文を返し終わるまで数え続け、集計・上限の確認は
+本文の最後で行う。Server-Timing ヘッダは本文より先に送るので、ヘッダを返すまでの値になる
+（response.query_count なども本文を読み終えるまではヘッダまでの値）。
+"""
+import contextvars
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# 処理時間・クエリ数を外に見せるので、既定は開発中（DEBUG）だけ
+SERVER_TIMING = getattr(settings, "DIARY_SERVER_TIMING", settings.DEBUG)
+
+_lock = threading.Lock()
+_stats = {}
+_paused = contextvars.ContextVar("diary_instrumentation_paused", default=False)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(limit):
+    """ビューの1リクエストあたりのクエリ数の上限を宣言する"""
+    def decorator(view_func):
+        view_func.query_budget = limit
+        return view_func
+    return decorator
+
+
+def latency_budget(ms):
+    """ビューの1リクエストあたりの処理時間の上限（ミリ秒）を宣言する"""
+    def decorator(view_func):
+        view_func.latency_budget = ms
+        return view_func
+    return decorator
+
+
+class QueryCounter:
+    """connection.execute_wrapper 用：クエリ数と DB 時間を数える"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        if _paused.get():
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+def record(name, total, db, queries):
+    with _lock:
+        s = _stats.get(name)
+        if s is None:
+            s = _stats[name] = {
+                "requests": 0, "total_ms": 0.0, "db_ms": 0.0,
+                "queries": 0, "max_queries": 0, "max_ms": 0.0,
+            }
+        s["requests"] += 1
+        s["total_ms"] += total * 1000
+        s["db_ms"] += db * 1000
+        s["queries"] += queries
+        s["max_queries"] = max(s["max_queries"], queries)
+        s["max_ms"] = max(s["max_ms"], total * 1000)
+
+
+def snapshot():
+    """URL 名ごとの集計（平均値つき）"""
+    with _lock:
+        items = {name: dict(s) for name, s in _stats.items()}
+    for s in items.values():
+        n = s["requests"] or 1
+        s["avg_ms"] = round(s["total_ms"] / n, 2)
+        s["avg_db_ms"] = round(s["db_ms"] / n, 2)
+        s["avg_queries"] = round(s["queries"] / n, 2)
+        s["total_ms"] = round(s["total_ms"], 2)
+        s["db_ms"] = round(s["db_ms"], 2)
+        s["max_ms"] = round(s["max_ms"], 2)
+    return items
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+@contextmanager
+def uncounted():
+    """この中のクエリはリクエストの集計・上限に入れない（DIARY_JOBS_EAGER でその場で動くジョブなど）"""
+    token = _paused.set(True)
+    try:
+        yield
+    finally:
+        _paused.reset(token)
+
+
+@contextmanager
+def _counting(counter):
+    with ExitStack() as stack:
+        for conn in connections.all():
+            stack.enter_context(conn.execute_wrapper(counter))
+        yield
+
+
+class QueryInstrumentationMiddleware:
+    """処理時間・DB時間・クエリ数を計測し、Server-Timing ヘッダと集計に反映する（WSGI/ASGI 両対応）"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with _counting(counter):
+            response = self.get_response(request)
+        return self._finish(request, response, counter, start)
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with _counting(counter):
+            response = await self.get_response(request)
+        return self._finish(request, response, counter, start)
+
+    def _finish(self, request, response, counter, start):
+        total = time.perf_counter() - start
+        if SERVER_TIMING:
+            response["Server-Timing"] = (
+                f'total;dur={total * 1000:.1f}, '
+                f'db;dur={counter.duration * 1000:.1f};desc="{counter.count} queries"'
+            )
+        if response.streaming:
+            # 本文を作りながらクエリを出すので、返し終わってから集計する（それまではヘッダまでの値を載せておく）
+            self._annotate(request, response, counter, total)
+            stream = self._astream if response.is_async else self._stream
+            response.streaming_content = stream(request, response, response.streaming_content, counter, start)
+            return response
+        self._account(request, response, counter, total)
+        return response
+
+    def _stream(self, request, response, content, counter, start):
+        try:
+            with _counting(counter):
+                yield from content
+        finally:
+            self._account(request, response, counter, time.perf_counter() - start)
+
+    async def _astream(self, request, response, content, counter, start):
+        try:
+            with _counting(counter):
+                async for chunk in content:
+                    yield chunk
+        finally:
+            self._account(request, response, counter, time.perf_counter() - start)
+
+    def _annotate(self, request, response, counter, total):
+        response.query_count = counter.count
+        response.query_budget = getattr(request, "query_budget", None)
+        response.latency_ms = total * 1000
+        response.latency_budget = getattr(request, "latency_budget", None)
+
+    def _account(self, request, response, counter, total):
+        match = getattr(request, "resolver_match", None)
+        name = (match.view_name if match else None) or "<unresolved>"
+        record(name, total, counter.duration, counter.count)
+        self._annotate(request, response, counter, total)
+
+        budget = response.query_budget
+        if budget is not None and counter.count > budget:
+            logger.warning(
+                "query budget exceeded: %s issued %d queries (budget %d)",
+                name, counter.count, budget,
+            )
+
+        latency = response.latency_budget
+        if latency is not None and total * 1000 > latency:
+            logger.warning(
+                "latency budget exceeded: %s took %.1f ms (budget %d ms)",
+                name, total * 1000, latency,
+            )
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, "query_budget", None)
+        request.latency_budget = getattr(view_func, "latency_budget", None)
+        return None
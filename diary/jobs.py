@@ -0,0 +1,129 @@
+# diary/jobs.py
+"""DB を使った軽いジョブキュー（外部のブローカーなし）
+
+- enqueue() は Job を1行入れるだけ（リクエストでは「やること」を記録するだけにする）。
+  key が同じ待ち/実行中のジョブがあれば入れない（冪等）。
+- manage.py run_jobs（ワーカー）が、期限の来たジョブを条件付き UPDATE で取り合って実行する。
+  失敗したら間隔を倍にしながら max_attempts 回まで再試行し、それでも失敗したら failed で残す。
+  実行中のまま LOCK_TIMEOUT を過ぎたもの（ワーカーが落ちた）は取り直す。
+- DIARY_JOBS_EAGER=True ならキューに入れず、コミット後にその場で実行する（開発・ワーカーなしの環境用）。
+
+ハンドラはキーワード引数（payload）を受け取り、何度実行しても同じ結果になるように書く。
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .instrumentation import uncounted
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+EAGER = getattr(settings, "DIARY_JOBS_EAGER", False)
+RETRY_DELAY = getattr(settings, "DIARY_JOBS_RETRY_DELAY", 30)  # 秒。2回目以降は倍ずつ
+LOCK_TIMEOUT = getattr(settings, "DIARY_JOBS_LOCK_TIMEOUT", 300)
+MAX_ATTEMPTS = 5
+
+# 種類 → ハンドラ（遅延 import）
+HANDLERS = {
+    "photo.process": "diary.photo_tasks.process_photo",
+    "photo.delete": "diary.photo_tasks.delete_files",
+    "photo.purge": "diary.photo_tasks.purge_blob",
+}
+
+
+def _handler(kind):
+    return import_string(HANDLERS[kind])
+
+
+def _run_now(kind, payload):
+    # ワーカーで動くはずの処理なので、呼び出したリクエストのクエリ数には入れない
+    try:
+        with uncounted():
+            _handler(kind)(**payload)
+    except Exception:
+        logger.exception("job %s failed: %r", kind, payload)
+
+
+def enqueue(kind, payload, key=None, delay=0):
+    """ジョブを登録する（同じ key が待ち/実行中なら何もしない）"""
+    if kind not in HANDLERS:
+        raise ValueError(f"unknown job kind: {kind}")
+    if EAGER:
+        transaction.on_commit(lambda: _run_now(kind, payload))
+        return
+    Job.objects.bulk_create(
+        [Job(
+            kind=kind, payload=payload, key=key, max_attempts=MAX_ATTEMPTS,
+            run_after=timezone.now() + timedelta(seconds=delay),
+        )],
+        ignore_conflicts=True,
+    )
+
+
+def _due(now):
+    # 期限の来た待ちジョブと、ロックが切れた実行中のジョブ
+    return Q(status=Job.PENDING, run_after__lte=now) | Q(status=Job.RUNNING, locked_until__lt=now)
+
+
+def claim(batch=10, now=None):
+    """実行するジョブを最大 batch 件取る（他のワーカーに取られたものは飛ばす）"""
+    now = now or timezone.now()
+    candidates = list(
+        Job.objects.filter(_due(now)).order_by("run_after", "pk").values_list("pk", flat=True)[:batch]
+    )
+    claimed = []
+    for pk in candidates:
+        taken = Job.objects.filter(_due(now), pk=pk).update(
+            status=Job.RUNNING,
+            locked_until=now + timedelta(seconds=LOCK_TIMEOUT),
+            attempts=F("attempts") + 1,
+        )
+        if taken:
+            claimed.append(pk)
+    return list(Job.objects.filter(pk__in=claimed).order_by("run_after", "pk"))
+
+
+def run_job(job):
+    """1件実行する。成功したら消して True"""
+    try:
+        _handler(job.kind)(**job.payload)
+    except Exception:
+        logger.exception("job %s failed (attempt %s/%s)", job, job.attempts, job.max_attempts)
+        job.last_error = traceback.format_exc()[-4000:]
+        job.locked_until = None
+        if job.attempts >= job.max_attempts:
+            job.status = Job.FAILED
+        else:
+            job.status = Job.PENDING
+            job.run_after = timezone.now() + timedelta(seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+        job.save(update_fields=["status", "run_after", "locked_until", "last_error"])
+        return False
+    job.delete()
+    return True
+
+
+def run_pending(batch=10):
+    """期限の来たジョブを1回分（最大 batch 件）実行し、(成功数, 失敗数) を返す"""
+    done = failed = 0
+    for job in claim(batch):
+        if run_job(job):
+            done += 1
+        else:
+            failed += 1
+    return done, failed
+
+
+def retry_failed(kind=None):
+    """failed のジョブを待ちに戻す。戻した件数を返す"""
+    active = Job.objects.filter(status__in=[Job.PENDING, Job.RUNNING], key__isnull=False).values("key")
+    qs = Job.objects.filter(status=Job.FAILED).exclude(key__in=active)
+    if kind:
+        qs = qs.filter(kind=kind)
+    return qs.update(status=Job.PENDING, attempts=0, run_after=timezone.now(), last_error="")
@@ -0,0 +1,159 @@
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+from .loadtest import _percentile
+
+CREATE_SQL = (
+    "CREATE TABLE bench_record ("
+    " id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, day INTEGER NOT NULL, note TEXT NOT NULL,"
+    " UNIQUE (user_id, day))"
+)
+
+
+def _register(alias, settings_dict):
+    # 計測用の接続を settings.DATABASES に書かずに追加する（スレッドごとに別の接続になる）
+    connections.settings[alias] = connections.configure_settings(
+        {DEFAULT_DB_ALIAS: settings_dict}
+    )[DEFAULT_DB_ALIAS]
+
+
+def _is_locked(error):
+    return "locked" in str(error) or "busy" in str(error)
+
+
+class Command(BaseCommand):
+    help = (
+        "SQLite の既定設定（ロールバックジャーナル・接続は毎回開き直し）と settings.DATABASES の設定"
+        "（WAL・PRAGMA・IMMEDIATE・接続の再利用）で、同時の読み書きのスループットと「database is locked」の件数を比べる。"
+        "一時ファイルの DB を使う（本物の DB には触らない）"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=8, help="書き込みスレッド数（既定: 8）")
+        parser.add_argument("--readers", type=int, default=8, help="読み取りスレッド数（既定: 8）")
+        parser.add_argument("--duration", type=float, default=5.0, help="各設定での計測秒数")
+        parser.add_argument("--users", type=int, default=20, help="書き込みを分散させるユーザー数")
+
+    def handle(self, *args, **options):
+        configured = settings.DATABASES[DEFAULT_DB_ALIAS]
+        if configured["ENGINE"] != "django.db.backends.sqlite3":
+            raise CommandError("DATABASES['default'] が SQLite ではありません")
+        if options["writers"] < 1 or options["readers"] < 0:
+            raise CommandError("--writers は 1 以上、--readers は 0 以上にしてください")
+
+        profiles = [
+            ("default", {"ENGINE": configured["ENGINE"]}, False),
+            ("tuned", {
+                "ENGINE": configured["ENGINE"],
+                "OPTIONS": configured.get("OPTIONS", {}),
+            }, bool(configured.get("CONN_MAX_AGE"))),
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            for label, profile, persistent in profiles:
+                alias = f"bench_{label}"
+                _register(alias, {**profile, "NAME": os.path.join(directory, f"{label}.sqlite3")})
+                try:
+                    result = self._run(alias, persistent, options)
+                finally:
+                    connections[alias].close()
+                    del connections.settings[alias]
+                self.stdout.write(
+                    f"{label:8} 書き込み {result['writes']:>7,} 件（{result['write_ops']:.0f}/s, "
+                    f"p99 {result['write_p99_ms']:.1f} ms） 読み取り {result['reads']:>7,} 件（{result['read_ops']:.0f}/s） "
+                    f"locked {result['locked']:,} 件"
+                )
+
+    def _run(self, alias, persistent, options):
+        with connections[alias].cursor() as cursor:
+            cursor.execute(CREATE_SQL)
+        connections[alias].close()
+
+        lock = threading.Lock()
+        totals = {"writes": 0, "reads": 0, "locked": 0}
+        write_samples = []
+        start_barrier = threading.Barrier(options["writers"] + options["readers"] + 1)
+        deadline = [0.0]
+
+        def write(n, worker):
+            # record_view と同じ形：今日の記録を読んでから更新 / 作成する
+            user_id, day = (worker * 7919 + n) % options["users"], n % 365
+            with transaction.atomic(using=alias):
+                with connections[alias].cursor() as cursor:
+                    cursor.execute(
+                        "SELECT id FROM bench_record WHERE user_id = %s AND day = %s", [user_id, day],
+                    )
+                    row = cursor.fetchone()
+                    if row:
+                        cursor.execute("UPDATE bench_record SET note = %s WHERE id = %s", [f"note {n}", row[0]])
+                    else:
+                        cursor.execute(
+                            "INSERT INTO bench_record (user_id, day, note) VALUES (%s, %s, %s)",
+                            [user_id, day, f"note {n}"],
+                        )
+
+        def read(n, worker):
+            # カレンダーと同じ形：1ユーザーの1か月分
+            user_id, first = (worker + n) % options["users"], (n * 31) % 365
+            with connections[alias].cursor() as cursor:
+                cursor.execute(
+                    "SELECT day, note FROM bench_record WHERE user_id = %s AND day BETWEEN %s AND %s",
+                    [user_id, first, first + 30],
+                )
+                cursor.fetchall()
+
+        def worker(op, kind, index):
+            done = locked = n = 0
+            samples = []
+            start_barrier.wait()
+            try:
+                while time.perf_counter() < deadline[0]:
+                    n += 1
+                    t0 = time.perf_counter()
+                    try:
+                        op(n, index)
+                    except OperationalError as e:
+                        if not _is_locked(e):
+                            raise
+                        locked += 1
+                    else:
+                        done += 1
+                        samples.append(time.perf_counter() - t0)
+                    if not persistent:
+                        # CONN_MAX_AGE=0 と同じく、リクエストごとに接続を閉じる
+                        connections[alias].close()
+            finally:
+                connections[alias].close()
+            with lock:
+                totals[kind] += done
+                totals["locked"] += locked
+                if kind == "writes":
+                    write_samples.extend(samples)
+
+        threads = [
+            threading.Thread(target=worker, args=(write, "writes", i), daemon=True)
+            for i in range(options["writers"])
+        ] + [
+            threading.Thread(target=worker, args=(read, "reads", i), daemon=True)
+            for i in range(options["readers"])
+        ]
+        for t in threads:
+            t.start()
+        deadline[0] = time.perf_counter() + options["duration"]
+        began = time.perf_counter()
+        start_barrier.wait()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - began
+
+        return {
+            **totals,
+            "write_ops": totals["writes"] / elapsed,
+            "read_ops": totals["reads"] / elapsed,
+            "write_p99_ms": _percentile(sorted(write_samples), 99) * 1000,
+        }
@@ -0,0 +1,279 @@
+import json
+import math
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import date, timedelta
+from io import BytesIO
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from PIL import Image
+
+from diary import mood_stats
+from diary import moods as mood_registry
+from diary import thumbnails
+from diary.models import Record
+
+BENCH_PASSWORD = "bench-pass-1234"
+SCENARIOS = ["calendar", "calendar_past", "year", "record_get", "record_post", "login", "signup"]
+
+
+class WriteCounter:
+    """execute_wrapper 用：クエリ数・書き込み数・セッション書き込み数を数える"""
+
+    def __init__(self):
+        self.queries = self.writes = self.session_writes = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        head = sql.lstrip()[:6].upper()
+        if head in ("INSERT", "UPDATE", "DELETE"):
+            self.writes += 1
+            if "django_session" in sql:
+                self.session_writes += 1
+        return execute(sql, params, many, context)
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    # nearest-rank 法
+    k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def _git_revision():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        )
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "カレンダー・記録画面・ログイン・新規登録のベンチマーク。"
+        "使い捨ての SQLite テスト DB に合成データを入れて Django テストクライアントで計測し、JSON を出力する"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50, help="計測回数（シナリオごと）")
+        parser.add_argument("--warmup", type=int, default=5, help="計測前の空回し回数")
+        parser.add_argument("--years", type=int, nargs="+", default=[1, 5, 20],
+                            help="合成ユーザーの記録年数（既定: 1 5 20）")
+        parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+        parser.add_argument("--cold-cache", action="store_true",
+                            help="毎リクエスト前にキャッシュを空にする")
+        parser.add_argument("--session-save-every-request", action="store_true",
+                            help="旧設定（SESSION_SAVE_EVERY_REQUEST=True）で計測する（セッション書き込みの比較用）")
+        parser.add_argument("--output", help="結果 JSON の出力先（既定: 標準出力）")
+        parser.add_argument("--compare", help="以前の結果 JSON と比較して差分を表示する")
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 1:
+            raise CommandError("--iterations は 1 以上にしてください")
+
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        media_root = tempfile.mkdtemp(prefix="diary-bench-")
+        try:
+            # 同じ IP・アカウントで何十回もログイン・登録するので試行回数の制限は外す（計るのはビュー本体）
+            with override_settings(MEDIA_ROOT=media_root, DEBUG=False, DIARY_THROTTLE_ENABLED=False,
+                                   SESSION_SAVE_EVERY_REQUEST=options["session_save_every_request"]):
+                cache.clear()
+                mood_registry.invalidate()
+                results = self._run(options)
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        report = {
+            "meta": {
+                "revision": _git_revision(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "iterations": options["iterations"],
+                "warmup": options["warmup"],
+                "cold_cache": options["cold_cache"],
+                "session_engine": settings.SESSION_ENGINE,
+                "session_save_every_request": options["session_save_every_request"],
+            },
+            "results": results,
+        }
+        text = json.dumps(report, indent=2, sort_keys=True, ensure_ascii=False)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+            self.stderr.write(f"結果を {options['output']} に書き出しました")
+        else:
+            self.stdout.write(text)
+
+        if options["compare"]:
+            self._compare(options["compare"], results)
+
+    # ---- データ作成 ----
+    def _sample_photo(self):
+        buf = BytesIO()
+        Image.new("RGB", (3024, 4032), (200, 120, 80)).save(buf, format="JPEG", quality=90)
+        name = default_storage.save("photos/bench.jpg", ContentFile(buf.getvalue()))
+        return name, thumbnails.generate_renditions(default_storage, name)
+
+    def _seed_user(self, years, with_photos, photo):
+        username = f"bench-{years}y-{'photo' if with_photos else 'plain'}"
+        user = User.objects.create_user(username=username, email=f"{username}@example.com",
+                                        password=BENCH_PASSWORD)
+        moods = mood_registry.all_moods()
+        photo_name, renditions = photo if with_photos else ("", {})
+        today = date.today()
+        Record.objects.bulk_create(
+            [
+                Record(
+                    user=user,
+                    date=today - timedelta(days=i + 1),
+                    mood=moods[i % len(moods)],
+                    note=f"ベンチマーク用のメモ {i}",
+                    photo=photo_name,
+                    photo_renditions=renditions,
+                )
+                for i in range(years * 365)
+            ],
+            batch_size=1000,
+        )
+        # bulk_create はシグナルを送らないので集計（統計・年表示用）は作り直す
+        mood_stats.rebuild_user(user.pk)
+        return user
+
+    # ---- 計測 ----
+    def _measure(self, request, iterations, warmup, expected, cold):
+        for i in range(warmup):
+            request(-1 - i)
+        samples, counters = [], []
+        for i in range(iterations):
+            if cold:
+                cache.clear()
+                mood_registry.invalidate()
+            counter = WriteCounter()
+            with connection.execute_wrapper(counter):
+                start = time.perf_counter()
+                response = request(i)
+                samples.append(time.perf_counter() - start)
+            if response.status_code != expected:
+                raise CommandError(f"unexpected status {response.status_code} (expected {expected})")
+            counters.append(counter)
+
+        total = sum(samples)
+        ordered = sorted(samples)
+        n = len(samples)
+        return {
+            "iterations": n,
+            "throughput_rps": round(n / total, 2) if total else None,
+            "mean_ms": round(total / n * 1000, 3),
+            "p50_ms": round(_percentile(ordered, 50) * 1000, 3),
+            "p99_ms": round(_percentile(ordered, 99) * 1000, 3),
+            "queries_per_request": round(sum(c.queries for c in counters) / n, 2),
+            "writes_per_request": round(sum(c.writes for c in counters) / n, 2),
+            "session_writes_per_request": round(sum(c.session_writes for c in counters) / n, 2),
+        }
+
+    def _run(self, options):
+        scenarios = options["scenarios"]
+        iterations, warmup, cold = options["iterations"], options["warmup"], options["cold_cache"]
+        results = []
+        photo = self._sample_photo()
+        today = date.today()
+
+        for years in options["years"]:
+            for with_photos in (False, True):
+                user = self._seed_user(years, with_photos, photo)
+                dataset = {"years": years, "photos": with_photos, "records": years * 365}
+                client = Client()
+                client.force_login(user)
+                past = today - timedelta(days=years * 365 // 2)
+                target = (today - timedelta(days=1)).isoformat()
+
+                requests = {
+                    "calendar": (lambda i: client.get("/calendar/"), 200),
+                    "calendar_past": (
+                        lambda i: client.get(f"/calendar/?year={past.year}&month={past.month}"), 200),
+                    "year": (lambda i: client.get(f"/diary/year/?year={past.year}"), 200),
+                    "record_get": (lambda i: client.get(f"/diary/record/?date={target}"), 200),
+                    "record_post": (
+                        lambda i: client.post(f"/diary/record/?date={target}", {
+                            "date": target,
+                            "mood": mood_registry.all_moods()[i % 5].pk,
+                            "note": f"更新 {i}",
+                        }),
+                        302,
+                    ),
+                }
+                for name, (request, expected) in requests.items():
+                    if name not in scenarios:
+                        continue
+                    self.stderr.write(f"{name} {years}y photos={with_photos} ...")
+                    results.append({
+                        "scenario": name, **dataset,
+                        **self._measure(request, iterations, warmup, expected, cold),
+                    })
+
+        if "login" in scenarios:
+            user = User.objects.order_by("pk").first()
+
+            def login(i):
+                return Client().post("/login/", {"email": user.email, "password": BENCH_PASSWORD})
+
+            self.stderr.write("login ...")
+            results.append({"scenario": "login", **self._measure(login, iterations, warmup, 302, cold)})
+
+        if "signup" in scenarios:
+            def signup(i):
+                name = f"signup{i + warmup}"
+                return Client().post("/signup/", {
+                    "username": name,
+                    "email": f"{name}@example.com",
+                    "password": BENCH_PASSWORD,
+                    "confirm_password": BENCH_PASSWORD,
+                })
+
+            self.stderr.write("signup ...")
+            results.append({"scenario": "signup", **self._measure(signup, iterations, warmup, 302, cold)})
+
+        return results
+
+    def _compare(self, path, results):
+        with open(path, encoding="utf-8") as f:
+            previous = json.load(f)["results"]
+
+        def key(r):
+            return (r["scenario"], r.get("years"), r.get("photos"))
+
+        before = {key(r): r for r in previous}
+        self.stderr.write(f"{'scenario':<16}{'years':>6}{'photos':>8}{'p50 ms':>18}{'p99 ms':>18}{'queries':>14}{'session writes':>18}")
+        for r in results:
+            old = before.get(key(r))
+            if old is None:
+                continue
+            self.stderr.write(
+                f"{r['scenario']:<16}{str(r.get('years', '-')):>6}{str(r.get('photos', '-')):>8}"
+                f"{old['p50_ms']:>8.2f} → {r['p50_ms']:<7.2f}"
+                f"{old['p99_ms']:>8.2f} → {r['p99_ms']:<7.2f}"
+                f"{old['queries_per_request']:>6} → {r['queries_per_request']:<5}"
+                f"{old['session_writes_per_request']:>8} → {r['session_writes_per_request']:<5}"
+            )
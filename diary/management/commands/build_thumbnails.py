@@ -0,0 +1,53 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from diary import thumbnails
+from diary.models import Record
+
+
+def _init_worker():
+    # spawn 方式でも動くように子プロセスで Django を初期化し、親の接続は使わない
+    django.setup()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "既存の写真のサイズ違い（カレンダー用など）をまとめて生成する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="並列プロセス数（既定: CPU数）")
+        parser.add_argument("--force", action="store_true",
+                            help="生成済みのものも作り直す")
+
+    def handle(self, *args, **options):
+        qs = Record.objects.exclude(photo="").exclude(photo__isnull=True)
+        pks = [
+            pk for pk, photo, renditions in qs.values_list("pk", "photo", "photo_renditions")
+            if options["force"] or (renditions or {}).get("source") != photo
+        ]
+        if not pks:
+            self.stdout.write("対象の写真はありません")
+            return
+
+        workers = max(1, options["workers"])
+        self.stdout.write(f"{len(pks)} 件を {workers} プロセスで処理します")
+
+        # 子プロセスへ DB 接続を引き継がない
+        connections.close_all()
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            futures = {pool.submit(thumbnails.backfill_record, pk, options["force"]): pk for pk in pks}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"record {futures[future]}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(f"完了: {done} 件 / 失敗: {failed} 件"))
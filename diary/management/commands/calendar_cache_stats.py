@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from diary import month_cache
+
+
+class Command(BaseCommand):
+    help = "カレンダー月サマリーキャッシュのヒット/ミス数を表示する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="表示後にカウンタをリセットする")
+
+    def handle(self, *args, **options):
+        stats = month_cache.cache_stats()
+        if not stats["enabled"]:
+            self.stdout.write("DIARY_MONTH_CACHE_STATS が False のため数えていません（settings で True にすると数え始めます）")
+        ratio = stats["hit_ratio"]
+        self.stdout.write(
+            f"hits={stats['hits']} misses={stats['misses']} "
+            f"hit_ratio={'-' if ratio is None else f'{ratio:.2%}'}"
+        )
+        if options["reset"]:
+            month_cache.reset_stats()
+            self.stdout.write("カウンタをリセットしました")
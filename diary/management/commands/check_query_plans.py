@@ -0,0 +1,63 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from diary.month_cache import month_window, window_queryset
+from diary.models import Record
+
+COVER_INDEX = "diary_record_user_date_cover"
+
+
+def _expectations(vendor):
+    """(説明, クエリセット, 実行計画に含まれるべき文字列) の一覧"""
+    _, first_display, last_display = month_window(2025, 10)
+    calendar_qs = window_queryset(1, first_display, last_display)
+    year_qs = (
+        Record.objects
+        .filter(user_id=1, date__gte=date(2025, 1, 1), date__lte=date(2025, 12, 31))
+        .values_list("date", flat=True)
+    )
+    if vendor == "sqlite":
+        return [
+            ("calendar window", calendar_qs, f"COVERING INDEX {COVER_INDEX}"),
+            ("recorded days (year)", year_qs, "COVERING INDEX"),
+        ]
+    if vendor == "postgresql":
+        return [
+            ("calendar window", calendar_qs, f"Index Only Scan using {COVER_INDEX}"),
+            ("recorded days (year)", year_qs, "Index Only Scan"),
+        ]
+    return []
+
+
+class Command(BaseCommand):
+    help = "カレンダーの表示範囲クエリなどがインデックスだけで処理される実行計画になっているか確認する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        alias = options["database"]
+        connection = connections[alias]
+        checks = _expectations(connection.vendor)
+        if not checks:
+            self.stdout.write(f"{connection.vendor} は確認対象外です")
+            return
+
+        failures = []
+        with transaction.atomic(using=alias):
+            if connection.vendor == "postgresql":
+                # 行数の少ない開発 DB でも索引を使った場合の計画を見る
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+            for label, qs, expected in checks:
+                plan = qs.using(alias).explain()
+                ok = expected in plan
+                self.stdout.write(f"[{'OK' if ok else 'NG'}] {label}\n{plan}\n")
+                if not ok:
+                    failures.append(f"{label}: 実行計画に '{expected}' がありません")
+
+        if failures:
+            raise CommandError("\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("実行計画は想定どおりです"))
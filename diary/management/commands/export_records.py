@@ -0,0 +1,33 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from diary import transfer
+
+
+class Command(BaseCommand):
+    help = "ユーザーの記録を CSV / JSON Lines で書き出す（少しずつ読むので件数が多くてもメモリは一定）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--format", choices=sorted(transfer.FORMATS), default="csv")
+        parser.add_argument("--output", help="出力先ファイル（既定: 標準出力）")
+        parser.add_argument("--chunk-size", type=int, default=transfer.CHUNK_SIZE,
+                            help="DB から一度に読む件数")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"ユーザーが見つかりません: {options['username']}")
+
+        chunks = transfer.export_stream(user.pk, options["format"], chunk_size=options["chunk_size"])
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8", newline="") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            self.stderr.write(f"{options['output']} に書き出しました")
+        else:
+            for chunk in chunks:
+                sys.stdout.write(chunk)
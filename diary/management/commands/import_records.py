@@ -0,0 +1,45 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from diary import transfer
+
+
+class Command(BaseCommand):
+    help = "CSV / JSON Lines の記録をユーザーに取り込む（同じ日付は上書き。batch-size 件ずつ upsert）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=sorted(transfer.FORMATS),
+                            help="既定: 拡張子から判定（.jsonl / .ndjson は JSON Lines、それ以外は CSV）")
+        parser.add_argument("--batch-size", type=int, default=transfer.BATCH_SIZE)
+        parser.add_argument("--keep-photo-paths", action="store_true",
+                            help="写真パスを確認せずにそのまま入れる（ファイルを別途コピーした場合など）")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size は 1 以上にしてください")
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"ユーザーが見つかりません: {options['username']}")
+
+        fmt = options["format"] or transfer.guess_format(options["path"])
+        start = time.perf_counter()
+        with open(options["path"], encoding="utf-8-sig", newline="") as f:
+            result = transfer.import_records(
+                user, transfer.read_rows(f, fmt),
+                batch_size=options["batch_size"], keep_photo_paths=options["keep_photo_paths"],
+            )
+        elapsed = time.perf_counter() - start
+
+        for lineno, reason in result.errors[:20]:
+            self.stderr.write(f"{lineno}行目: {reason}")
+        if len(result.errors) > 20:
+            self.stderr.write(f"ほか {len(result.errors) - 20} 行")
+        rate = result.imported / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{result.imported} 件を取り込みました（エラー {len(result.errors)} 行, {elapsed:.2f}s, {rate:,.0f} 行/s）"
+        ))
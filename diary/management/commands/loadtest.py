@@ -0,0 +1,149 @@
+import http.client
+import json
+import math
+import re
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+CSRF_INPUT_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    # nearest-rank 法
+    k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+class Session:
+    """1接続ぶんの HTTP クライアント（Cookie を持ち回る）"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        conn_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self.conn = conn_class(parts.hostname, parts.port, timeout=30)
+        self.host = parts.netloc
+        self.cookies = {}
+
+    def request(self, method, path, body=None, headers=None):
+        headers = {"Host": self.host, **(headers or {})}
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            # keep-alive 切れは1回だけ張り直す
+            self.conn.close()
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+        data = response.read()
+        for value in response.headers.get_all("Set-Cookie") or []:
+            cookie = SimpleCookie(value)
+            for key, morsel in cookie.items():
+                self.cookies[key] = morsel.value
+        return response.status, data
+
+    def login(self, email, password):
+        status, body = self.request("GET", "/login/")
+        match = CSRF_INPUT_RE.search(body.decode("utf-8", "replace"))
+        if status != 200 or not match:
+            raise CommandError(f"ログイン画面を取得できません（status {status}）")
+        form = urlencode({"csrfmiddlewaretoken": match.group(1), "email": email, "password": password})
+        status, _ = self.request("POST", "/login/", body=form, headers={
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Referer": f"http://{self.host}/login/",
+        })
+        if status != 302 or "sessionid" not in self.cookies:
+            raise CommandError(f"ログインに失敗しました（status {status}）")
+
+
+class Command(BaseCommand):
+    help = (
+        "起動中のサーバーに同時接続で GET を投げ、スループットと p50/p99 を測る。"
+        "WSGI（runserver / gunicorn）と ASGI（uvicorn, DJANGO_ASYNC_VIEWS=true）の比較用"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("url", help="サーバーの URL（例: http://127.0.0.1:8000）")
+        parser.add_argument("--email", required=True, help="ログインに使うユーザーのメールアドレス")
+        parser.add_argument("--password", required=True)
+        parser.add_argument("--path", action="append", dest="paths",
+                            help="計測するパス（複数指定可。既定: /calendar/ と /diary/record/）")
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32],
+                            help="同時接続数（既定: 1 8 32）")
+        parser.add_argument("--duration", type=float, default=10.0, help="各同時接続数での計測秒数")
+        parser.add_argument("--output", help="結果 JSON の出力先（既定: 標準出力）")
+
+    def handle(self, *args, **options):
+        paths = options["paths"] or ["/calendar/", "/diary/record/"]
+        results = []
+        for concurrency in options["concurrency"]:
+            if concurrency < 1:
+                raise CommandError("--concurrency は 1 以上にしてください")
+            self.stderr.write(f"concurrency={concurrency} ...")
+            results.append({"concurrency": concurrency, **self._run(options, paths, concurrency)})
+
+        text = json.dumps({"url": options["url"], "paths": paths, "results": results},
+                          indent=2, ensure_ascii=False)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+            self.stderr.write(f"結果を {options['output']} に書き出しました")
+        else:
+            self.stdout.write(text)
+
+    def _run(self, options, paths, concurrency):
+        sessions = []
+        for _ in range(concurrency):
+            session = Session(options["url"])
+            session.login(options["email"], options["password"])
+            sessions.append(session)
+
+        lock = threading.Lock()
+        samples, errors = [], []
+        start_barrier = threading.Barrier(concurrency + 1)
+        deadline = [0.0]
+
+        def worker(session):
+            local, failed = [], 0
+            i = 0
+            start_barrier.wait()
+            while time.perf_counter() < deadline[0]:
+                path = paths[i % len(paths)]
+                i += 1
+                t0 = time.perf_counter()
+                try:
+                    status, _ = session.request("GET", path)
+                except (http.client.HTTPException, OSError):
+                    status = None
+                local.append(time.perf_counter() - t0)
+                if status != 200:
+                    failed += 1
+            with lock:
+                samples.extend(local)
+                errors.append(failed)
+
+        threads = [threading.Thread(target=worker, args=(s,), daemon=True) for s in sessions]
+        for t in threads:
+            t.start()
+        deadline[0] = time.perf_counter() + options["duration"]
+        began = time.perf_counter()
+        start_barrier.wait()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - began
+
+        ordered = sorted(samples)
+        return {
+            "requests": len(samples),
+            "errors": sum(errors),
+            "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else None,
+            "p50_ms": round(_percentile(ordered, 50) * 1000, 2),
+            "p99_ms": round(_percentile(ordered, 99) * 1000, 2),
+        }
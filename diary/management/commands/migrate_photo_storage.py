@@ -0,0 +1,83 @@
+import posixpath
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from diary import month_cache, thumbnails
+from diary.models import Record
+from diary.storage import ContentAddressedStorage, blob_name, digest_of, file_digest, photo_storage, recount
+
+
+def _mb(size):
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+class Command(BaseCommand):
+    help = (
+        "既存の写真（photos/ 直下の名前）を内容アドレス保存（photos/ab/cd/<sha256>）へ移し、"
+        "同じ写真を1つにまとめる。移す前後の容量（元写真のみ）を表示する"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true",
+                            help="移さずに、まとめられる件数と容量だけを表示する")
+
+    def handle(self, *args, **options):
+        storage = photo_storage()
+        if not isinstance(storage, ContentAddressedStorage):
+            raise CommandError('STORAGES["photos"] が diary.storage.ContentAddressedStorage ではありません')
+        dry_run = options["dry_run"]
+
+        names = [
+            name for name in (
+                Record.objects.exclude(photo="").exclude(photo__isnull=True)
+                .order_by("photo").values_list("photo", flat=True).distinct()
+            )
+            if digest_of(name) is None
+        ]
+        if not names:
+            self.stdout.write("移す写真はありません")
+            return
+
+        before = after = missing = 0
+        targets = set()
+        for name in names:
+            if not storage.exists(name):
+                missing += 1
+                self.stderr.write(f"見つかりません: {name}")
+                continue
+            size = storage.size(name)
+            before += size
+            with storage.open(name, "rb") as f:
+                target = blob_name(file_digest(f), posixpath.splitext(name)[1].lower())
+                # 既に同じ内容があれば書き込まない（その分が節約になる）
+                if target not in targets and not storage.exists(target):
+                    after += size
+                    if not dry_run:
+                        storage.save(target, f)
+            targets.add(target)
+            if dry_run:
+                continue
+
+            with transaction.atomic():
+                old_renditions = list(
+                    Record.objects.filter(photo=name).values_list("photo_renditions", flat=True).distinct()
+                )
+                Record.objects.filter(photo=name).update(photo=target, photo_renditions={})
+                recount([target])
+            for renditions in old_renditions:
+                thumbnails.delete_renditions(storage, renditions)
+            storage.delete(name)
+            Record.objects.filter(photo=target).update(
+                photo_renditions=thumbnails.generate_renditions(storage, target),
+            )
+
+        if not dry_run:
+            # 月表示のキャッシュには写真の URL が入っている
+            month_cache.invalidate_all()
+
+        verb = "まとめられます" if dry_run else "まとめました"
+        self.stdout.write(f"写真 {len(names) - missing} 件 → {len(targets)} 件に{verb}（見つからない写真: {missing} 件）")
+        self.stdout.write(self.style.SUCCESS(
+            f"容量: {_mb(before)} → {_mb(after)}（{_mb(before - after)} 節約）"
+        ))
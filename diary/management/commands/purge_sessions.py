@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from diary import sessions
+
+
+class Command(BaseCommand):
+    help = "期限切れセッションを少しずつ削除する（clearsessions の一括 DELETE で表をロックしないように）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="1回の DELETE で消す件数")
+        parser.add_argument("--pause", type=float, default=0.0, help="バッチ間に待つ秒数")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size は 1 以上にしてください")
+        deleted = sessions.purge_expired(batch_size=options["batch_size"], pause=options["pause"])
+        if deleted is None:
+            self.stdout.write(self.style.SUCCESS("期限切れセッションを削除しました（バックエンドの clear_expired）"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{deleted} 件の期限切れセッションを削除しました"))
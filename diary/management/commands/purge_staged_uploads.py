@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from diary import uploads
+
+
+class Command(BaseCommand):
+    help = "期限切れの一時保存写真（入力エラー時のもの）を削除する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-age", type=int, default=None,
+                            help=f"この秒数より古いものを削除（既定: {uploads.MAX_AGE}）")
+
+    def handle(self, *args, **options):
+        removed = uploads.purge_stale(max_age=options["max_age"])
+        self.stdout.write(self.style.SUCCESS(f"{removed} 件の一時保存写真を削除しました"))
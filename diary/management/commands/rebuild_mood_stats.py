@@ -0,0 +1,27 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from diary import mood_stats
+
+
+class Command(BaseCommand):
+    help = "気分の集計（MonthlyMoodSummary）を記録から作り直す"
+
+    def add_arguments(self, parser):
+        parser.add_argument("usernames", nargs="*", help="対象ユーザー（省略時は全員）")
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by("pk")
+        if options["usernames"]:
+            users = users.filter(username__in=options["usernames"])
+            missing = set(options["usernames"]) - set(users.values_list("username", flat=True))
+            if missing:
+                raise CommandError(f"ユーザーが見つかりません: {', '.join(sorted(missing))}")
+
+        total = 0
+        for user_id, username in users.values_list("pk", "username").iterator():
+            rows = mood_stats.rebuild_user(user_id)
+            total += rows
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{username}: {rows} 行")
+        self.stdout.write(self.style.SUCCESS(f"気分の集計を作り直しました（{total} 行）"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from diary import search
+
+
+class Command(BaseCommand):
+    help = (
+        "メモ検索の索引を作り直す（SQLite の FTS5 表とトリガー / PostgreSQL の trigram インデックス）。"
+        "Record の表を作り直すマイグレーションの後などに実行する"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        conn = connections[options["database"]]
+        search.drop_index(conn)
+        if not search.install_index(conn):
+            raise CommandError(f"{conn.vendor} では検索用の索引を作れませんでした（LIKE 検索のまま動きます）")
+        self.stdout.write(self.style.SUCCESS("検索用の索引を作り直しました"))
@@ -0,0 +1,92 @@
+import os
+
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from diary import photo_upload
+from diary.models import Record
+from diary.storage import photo_storage
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff", ".heic", ".heif", ".avif"}
+
+
+def _mb(size):
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+def _walk(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for filename in sorted(files):
+                    if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                        yield os.path.join(root, filename)
+        else:
+            yield path
+
+
+class Command(BaseCommand):
+    help = (
+        "写真をアップロード時と同じ設定（DIARY_PHOTO_*）で正規化した場合の容量を表示する（ファイルは書き換えない）。"
+        "パスを省略すると、記録に使われている写真を対象にする"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*", help="画像ファイルまたはディレクトリ")
+        parser.add_argument("--verbose-files", action="store_true", help="ファイルごとの結果も表示する")
+
+    def _sources(self, paths):
+        if paths:
+            for path in _walk(paths):
+                yield path, open(path, "rb")
+            return
+        storage = photo_storage()
+        names = (
+            Record.objects.exclude(photo="").exclude(photo__isnull=True)
+            .order_by("photo").values_list("photo", flat=True).distinct()
+        )
+        for name in names:
+            try:
+                yield name, storage.open(name, "rb")
+            except FileNotFoundError:
+                self.stderr.write(f"見つかりません: {name}")
+
+    def handle(self, *args, **options):
+        before = after = count = failed = 0
+        formats = {}
+        for label, f in self._sources(options["paths"]):
+            with f:
+                upload = File(f, name=os.path.basename(label))
+                size = upload.size
+                try:
+                    result = photo_upload.normalize(upload)
+                except ValidationError as e:
+                    failed += 1
+                    self.stderr.write(f"変換できません: {label}（{e.messages[0]}）")
+                    continue
+                new_size = result.size
+                ext = os.path.splitext(result.name)[1].lstrip(".").lower()
+            count += 1
+            before += size
+            after += new_size
+            formats[ext] = formats.get(ext, 0) + 1
+            if options["verbose_files"]:
+                self.stdout.write(f"{label}: {size:,} → {new_size:,} bytes（{ext}）")
+
+        if not count:
+            self.stdout.write("対象の写真はありません")
+            return
+        ratio = after / before if before else 1
+        self.stdout.write(
+            f"写真 {count} 件（変換できない写真: {failed} 件）、形式: "
+            + ", ".join(f"{ext} {n} 件" for ext, n in sorted(formats.items()))
+        )
+        self.stdout.write(
+            f"長辺 {photo_upload.MAX_DIMENSION}px・品質 {photo_upload.QUALITY}・形式 {','.join(photo_upload.FORMATS)}"
+        )
+        # 元写真は保存したものをそのまま配信するので、保存容量の削減分がそのまま転送量の削減になる
+        self.stdout.write(self.style.SUCCESS(
+            f"容量・転送量: {_mb(before)} → {_mb(after)}（{(1 - ratio) * 100:.0f}% 削減、1枚あたり平均 "
+            f"{before / count / 1024:.0f} KB → {after / count / 1024:.0f} KB）"
+        ))
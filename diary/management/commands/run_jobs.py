@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from diary import jobs
+from diary.models import Job
+
+
+class Command(BaseCommand):
+    help = (
+        "バックグラウンドジョブ（写真の加工・削除）を実行するワーカー。"
+        "--once なら期限の来たジョブを片付けて終わる"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="待ちのジョブがなくなったら終わる")
+        parser.add_argument("--batch", type=int, default=10, help="1回に取るジョブ数")
+        parser.add_argument("--sleep", type=float, default=2.0, help="ジョブがないときの待ち秒数")
+        parser.add_argument("--retry-failed", action="store_true", help="failed のジョブを待ちに戻してから始める")
+
+    def handle(self, *args, **options):
+        if options["retry_failed"]:
+            self.stdout.write(f"failed を {jobs.retry_failed()} 件戻しました")
+
+        total_done = total_failed = 0
+        try:
+            while True:
+                close_old_connections()
+                done, failed = jobs.run_pending(batch=max(1, options["batch"]))
+                total_done += done
+                total_failed += failed
+                if done or failed:
+                    self.stdout.write(f"成功: {done} 件 / 失敗: {failed} 件")
+                    continue
+                if options["once"]:
+                    break
+                time.sleep(options["sleep"])
+        except KeyboardInterrupt:
+            pass
+
+        remaining = Job.objects.filter(status__in=[Job.PENDING, Job.RUNNING]).count()
+        self.stdout.write(self.style.SUCCESS(
+            f"完了: 成功 {total_done} 件 / 失敗 {total_failed} 件（残り {remaining} 件）"
+        ))
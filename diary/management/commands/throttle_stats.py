@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from diary import throttle
+
+
+class Command(BaseCommand):
+    help = "ログイン・登録・パスワード変更で試行回数の上限により断った件数を表示する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="表示後にカウンタをリセットする")
+
+    def handle(self, *args, **options):
+        for rule, rejected in throttle.stats().items():
+            limit, period = throttle.rates()[rule]
+            self.stdout.write(f"{rule:16} rejected={rejected}（上限 {limit} 回 / {period} 秒）")
+        if options["reset"]:
+            throttle.reset_stats()
+            self.stdout.write("カウンタをリセットしました")
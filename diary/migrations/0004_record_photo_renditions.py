@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diary', '0003_alter_record_options_alter_record_unique_together_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='record',
+            name='photo_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
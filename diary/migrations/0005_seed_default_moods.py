@@ -0,0 +1,23 @@
+from django.db import migrations
+
+# diary.moods.DEFAULT_COLORS のこの時点の値（マイグレーションはアプリのコードを読まないので写しておく）
+DEFAULT_COLORS = ["red", "orange", "yellow", "green", "blue"]
+
+
+def seed_moods(apps, schema_editor):
+    # 以前は記録画面の初回アクセス時に投入していた初期データ
+    Mood = apps.get_model("diary", "Mood")
+    db_alias = schema_editor.connection.alias
+    if not Mood.objects.using(db_alias).exists():
+        Mood.objects.using(db_alias).bulk_create([Mood(color=c) for c in DEFAULT_COLORS])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diary', '0004_record_photo_renditions'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_moods, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+INDEX_NAME = "diary_record_user_date_cover"
+
+
+def create_cover_index(apps, schema_editor):
+    # カレンダーの表示範囲検索（user_id + date の範囲）をインデックスだけで返すための索引。
+    # PostgreSQL は INCLUDE で非キー列を持たせ、それ以外は列を末尾に足して同じ効果を得る
+    quote = schema_editor.quote_name
+    table = quote("diary_record")
+    if schema_editor.connection.features.supports_covering_indexes:
+        sql = (
+            f"CREATE INDEX {quote(INDEX_NAME)} ON {table} ({quote('user_id')}, {quote('date')}) "
+            f"INCLUDE ({quote('mood_id')}, {quote('photo')}, {quote('photo_renditions')})"
+        )
+    elif schema_editor.connection.vendor == "sqlite":
+        sql = (
+            f"CREATE INDEX {quote(INDEX_NAME)} ON {table} "
+            f"({quote('user_id')}, {quote('date')}, {quote('mood_id')}, {quote('photo')}, {quote('photo_renditions')})"
+        )
+    else:
+        # JSON 列を索引に入れられない DB では uniq_record_user_date に任せる
+        return
+    schema_editor.execute(sql)
+
+
+def drop_cover_index(apps, schema_editor):
+    schema_editor.execute(f"DROP INDEX IF EXISTS {schema_editor.quote_name(INDEX_NAME)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diary', '0005_seed_default_moods'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cover_index, drop_cover_index),
+    ]
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+INDEX_NAME = "diary_user_email_lower"
+
+
+def _index():
+    return models.Index(Lower("email"), name=INDEX_NAME)
+
+
+def _user_model(apps):
+    return apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+
+
+# ログイン時の LOWER(email) = ? 検索用の式インデックス（User は auth アプリのモデルなのでここで作る）
+def create_index(apps, schema_editor):
+    if schema_editor.connection.features.supports_expression_indexes:
+        schema_editor.add_index(_user_model(apps), _index())
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.features.supports_expression_indexes:
+        schema_editor.remove_index(_user_model(apps), _index())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diary', '0006_record_user_date_cover_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
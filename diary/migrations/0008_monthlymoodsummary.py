@@ -0,0 +1,54 @@
+# Generated by Django 5.2.4 on 2026-10-18 20:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_summaries(apps, schema_editor):
+    # 既存の記録から集計を作る（以降は Record の保存/削除で差分更新）
+    Record = apps.get_model("diary", "Record")
+    MonthlyMoodSummary = apps.get_model("diary", "MonthlyMoodSummary")
+    db_alias = schema_editor.connection.alias
+    masks = {}
+    rows = (
+        Record.objects.using(db_alias)
+        .values_list("user_id", "date", "mood_id")
+        .iterator(chunk_size=2000)
+    )
+    for user_id, day, mood_id in rows:
+        key = (user_id, day.year, day.month, mood_id)
+        masks[key] = masks.get(key, 0) | (1 << (day.day - 1))
+    MonthlyMoodSummary.objects.using(db_alias).bulk_create(
+        [
+            MonthlyMoodSummary(user_id=u, year=y, month=m, mood_id=mood, day_mask=mask)
+            for (u, y, m, mood), mask in masks.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diary', '0007_user_email_lower_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyMoodSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('day_mask', models.IntegerField(default=0)),
+                ('mood', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='diary.mood')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mood_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'year', 'month', 'mood'), name='uniq_mood_summary')],
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+from django.db import DatabaseError, migrations, transaction
+
+FTS_TABLE = "diary_record_fts"
+
+# diary.search の SQL をこの時点の内容で写しておく（マイグレーションはアプリのコードを読まない）
+SQLITE_INDEX_SQL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"note, content='diary_record', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON diary_record BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, note) VALUES (new.id, new.note); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON diary_record BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, note) VALUES ('delete', old.id, old.note); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF note ON diary_record BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, note) VALUES ('delete', old.id, old.note); "
+    f"INSERT INTO {FTS_TABLE}(rowid, note) VALUES (new.id, new.note); END",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+SQLITE_DROP_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+POSTGRES_INDEX_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS diary_record_note_trgm ON diary_record USING gin (note gin_trgm_ops)",
+]
+POSTGRES_DROP_SQL = ["DROP INDEX IF EXISTS diary_record_note_trgm"]
+
+# DB ごとに (作る SQL, 消す SQL)。RunSQL は DB を選べないので RunPython で振り分ける
+SEARCH_INDEX_SQL = {
+    "sqlite": (SQLITE_INDEX_SQL, SQLITE_DROP_SQL),
+    "postgresql": (POSTGRES_INDEX_SQL, POSTGRES_DROP_SQL),
+}
+
+
+def create_search_index(apps, schema_editor):
+    # SQLite: FTS5（trigram）＋同期用トリガー / PostgreSQL: pg_trgm の GIN インデックス
+    # 作れない環境（trigram トークナイザのない SQLite・拡張を作る権限がない等）では何もしない（検索は LIKE で動く）
+    connection = schema_editor.connection
+    statements, _ = SEARCH_INDEX_SQL.get(connection.vendor, ([], []))
+    try:
+        with transaction.atomic(using=connection.alias):
+            for sql in statements:
+                schema_editor.execute(sql)
+    except DatabaseError:
+        pass
+
+
+def drop_search_index(apps, schema_editor):
+    _, statements = SEARCH_INDEX_SQL.get(schema_editor.connection.vendor, ([], []))
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diary', '0008_monthlymoodsummary'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.db import migrations
+
+import diary.models
+
+INDEX_NAME = "diary_record_user_date_cover"
+FTS_TABLE = "diary_record_fts"
+
+# 0009 と同じトリガー（マイグレーションはアプリのコードを読まないので写しておく）
+SQLITE_TRIGGER_SQL = [
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON diary_record BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, note) VALUES (new.id, new.note); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON diary_record BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, note) VALUES ('delete', old.id, old.note); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF note ON diary_record BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, note) VALUES ('delete', old.id, old.note); "
+    f"INSERT INTO {FTS_TABLE}(rowid, note) VALUES (new.id, new.note); END",
+    # トリガーがなかった間の追加・変更を索引に入れ直す
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+
+# SQLite では 0010 の AlterField（Record.photo）が diary_record を作り直し、
+# 0006 の生 SQL の索引と 0009 の FTS 同期トリガーが消えていた。
+# 索引は Record.Meta.indexes に移して Django に管理させ（作り直しでも残る）、トリガーはここで作り直す。
+def restore_search_triggers(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite" or FTS_TABLE not in connection.introspection.table_names():
+        # FTS5 を作れなかった環境（LIKE 検索）と PostgreSQL（GIN 索引は作り直しの対象外）
+        return
+    for sql in SQLITE_TRIGGER_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diary', '0011_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # PostgreSQL などでは 0006 の索引が残っているので、同じ名前で作る前に消す
+        migrations.RunSQL(f"DROP INDEX IF EXISTS {INDEX_NAME}", migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='record',
+            # PostgreSQL は 0006 と同じ INCLUDE 付き、SQLite は列を末尾に足した複合索引（CoveringIndex）
+            index=diary.models.CoveringIndex(
+                fields=['user', 'date'], include=['mood', 'photo', 'photo_renditions'], name=INDEX_NAME,
+            ),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,26 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .storage import photo_storage
+
+
+class CoveringIndex(models.Index):
+    """include の列を持たせた索引（PostgreSQL は INCLUDE）
+
+    INCLUDE のない SQLite では include の列をキーの末尾に足して、同じく索引だけで返せるようにする
+    （それ以外の DB では Django の既定どおり include を無視する）。
+    """
+
+    def create_sql(self, model, schema_editor, using="", **kwargs):
+        connection = schema_editor.connection
+        if self.include and connection.vendor == "sqlite" and not connection.features.supports_covering_indexes:
+            composite = models.Index(
+                fields=[*self.fields, *self.include], name=self.name,
+                db_tablespace=self.db_tablespace, condition=self.condition,
+            )
+            return composite.create_sql(model, schema_editor, using=using, **kwargs)
+        return super().create_sql(model, schema_editor, using=using, **kwargs)
 
 
 class Mood(models.Model):
@@ -15,10 +36,119 @@ class Record(models.Model):
     date = models.DateField()
     mood = models.ForeignKey(Mood, on_delete=models.SET_NULL, null=True, blank=True, related_name="records")
     note = models.TextField(blank=True)
-    photo = models.ImageField(upload_to="photos/", blank=True, null=True)
+    photo = models.ImageField(upload_to="photos/", storage=photo_storage, blank=True, null=True)
+    # 写真のサイズ違い（カレンダー用など）。{"source": 元写真名, "cell": ..., "preview": ..., "full": ...}
+    photo_renditions = models.JSONField(default=dict, blank=True, editable=False)
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=["user", "date"], name="uniq_record_user_date"),
         ]
+        indexes = [
+            # カレンダーの表示範囲検索（user_id + date の範囲）をインデックスだけで返すための索引
+            # （month_cache.window_queryset が読む列をすべて含める）
+            CoveringIndex(
+                fields=["user", "date"], include=["mood", "photo", "photo_renditions"],
+                name="diary_record_user_date_cover",
+            ),
+        ]
         ordering = ["-date"]  # 任意：新しい日付が上に来るように
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 気分の集計（mood_stats）用：DB 上の日付・気分を覚えておき、保存時に差分だけ反映する
+        if "date" in instance.__dict__ and "mood_id" in instance.__dict__:
+            instance._stats_key = (instance.date, instance.mood_id)
+        # 写真の参照数（storage.PhotoBlob）用：DB 上の写真名
+        if "photo" in instance.__dict__:
+            instance._photo_key = instance.__dict__["photo"] or ""
+        return instance
+
+    def save(self, *args, **kwargs):
+        # 写真の書き込み（storage._save が参照を数える）から post_save での参照数の更新までを
+        # 1つのトランザクションにする（途中で数え直されて参照を取りこぼさないように）
+        using = kwargs.get("using") or router.db_for_write(Record, instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
+    def rendition_url(self, rendition):
+        """サイズ違いの URL（未生成なら元写真の URL）"""
+        if not self.photo:
+            return ""
+        name = (self.photo_renditions or {}).get(rendition)
+        if name:
+            return self.photo.storage.url(name)
+        return self.photo.url
+
+    @property
+    def photo_preview_url(self):
+        return self.rendition_url("preview")
+
+
+class MonthlyMoodSummary(models.Model):
+    """ユーザー×月×気分ごとの集計（統計画面はこの表だけを読む）
+
+    day_mask は「その気分だった日」のビット（1日 = bit 0）。日数は立っているビットの数。
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="mood_summaries")
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    mood = models.ForeignKey(Mood, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    day_mask = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "year", "month", "mood"], name="uniq_mood_summary"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.year}-{self.month:02d} {self.mood_id}: {self.day_mask.bit_count()}"
+
+
+class PhotoBlob(models.Model):
+    """内容アドレスで保存した写真1つ分（diary.storage）。refcount は参照している Record の数"""
+    name = models.CharField(max_length=255, unique=True)
+    digest = models.CharField(max_length=64, db_index=True)
+    size = models.BigIntegerField(default=0)
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
+
+
+class Job(models.Model):
+    """バックグラウンド処理（diary.jobs）。終わったら消し、失敗し続けたものは failed で残す
+
+    key は重複防止用：同じ key の pending / running は1件だけ（既にあれば登録しない）。
+    """
+    PENDING = "pending"
+    RUNNING = "running"
+    FAILED = "failed"
+    STATUS_CHOICES = [(PENDING, "待ち"), (RUNNING, "実行中"), (FAILED, "失敗")]
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    key = models.CharField(max_length=255, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="diary_job_due"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["key"], condition=models.Q(status__in=["pending", "running"]),
+                name="uniq_active_job_key",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
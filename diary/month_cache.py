@@ -0,0 +1,211 @@
+# diary/month_cache.py
+"""カレンダー（月表示）用の記録サマリーキャッシュ
+
+(user, year, month) 単位で records_by_date を1クエリで作ってキャッシュする。
+Record の保存/削除シグナルで、その日付を表示範囲に含む月だけを破棄する。
+破棄はコミット後に行う（書き込み中に別リクエストがコミット前の内容でキャッシュを作り直し、
+それが TTL の間残るのを防ぐ）。
+キャッシュに入れる内容はプライマリから読む（レプリカの遅れた内容を TTL の間配り続けない）。
+ヒット/ミスの件数は DIARY_MONTH_CACHE_STATS=True のときだけ数える（毎リクエストでキャッシュに書くので既定は OFF）。
+"""
+import calendar
+import hashlib
+import json
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import db_router
+from .models import Record
+
+KEY_PREFIX = "diary:month"
+CACHE_TIMEOUT = getattr(settings, "DIARY_MONTH_CACHE_TIMEOUT", 60 * 60 * 24)
+GENERATION_KEY = f"{KEY_PREFIX}:gen"
+STATS_KEYS = {
+    "hits": f"{KEY_PREFIX}:stats:hits",
+    "misses": f"{KEY_PREFIX}:stats:misses",
+}
+
+
+def month_window(year, month):
+    """月曜始まりの表示グリッドと、その最初/最後の日付を返す"""
+    month_days = calendar.Calendar(firstweekday=0).monthdatescalendar(year, month)
+    return month_days, month_days[0][0], month_days[-1][-1]
+
+
+def _generation():
+    # Mood の色変更など「全月に効く」変更は世代番号を上げてまとめて無効化する
+    gen = cache.get(GENERATION_KEY)
+    if gen is None:
+        cache.add(GENERATION_KEY, 1, timeout=None)
+        gen = cache.get(GENERATION_KEY, 1)
+    return gen
+
+
+def _key(user_id, year, month, gen=None):
+    if gen is None:
+        gen = _generation()
+    return f"{KEY_PREFIX}:v{gen}:{user_id}:{year}:{month:02d}"
+
+
+def stats_enabled():
+    return getattr(settings, "DIARY_MONTH_CACHE_STATS", False)
+
+
+def _count(name):
+    if not stats_enabled():
+        return
+    key = STATS_KEYS[name]
+    if cache.add(key, 1, timeout=None):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        # 他プロセスとの競合で消えていた場合
+        cache.set(key, 1, timeout=None)
+
+
+def window_queryset(user_id, first_display, last_display):
+    """表示範囲の記録（カバリングインデックス diary_record_user_date_cover で完結する列だけ）"""
+    return (
+        Record.objects
+        .filter(user_id=user_id, date__gte=first_display, date__lte=last_display)
+        .values("date", "mood__color", "photo", "photo_renditions")
+    )
+
+
+def _cell(row):
+    return {
+        "color": row["mood__color"],
+        # マスには小さいサイズ違いを使う（未生成なら元写真）
+        "photo": (row["photo_renditions"] or {}).get("cell") or row["photo"],
+    }
+
+
+def _etag(summary):
+    payload = json.dumps(summary, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def _build_summary(user_id, year, month):
+    _, first_display, last_display = month_window(year, month)
+    rows = window_queryset(user_id, first_display, last_display)
+    return {r["date"].isoformat(): _cell(r) for r in rows}
+
+
+def get_month_state(user_id, year, month):
+    """(records_by_date, etag) を返す。etag は月の記録内容から作る強い検証子"""
+    key = _key(user_id, year, month)
+    state = cache.get(key)
+    if state is not None:
+        _count("hits")
+        return state
+
+    _count("misses")
+    with db_router.use_primary():
+        summary = _build_summary(user_id, year, month)
+    state = (summary, _etag(summary))
+    cache.set(key, state, CACHE_TIMEOUT)
+    return state
+
+
+async def _acount(name):
+    if not stats_enabled():
+        return
+    key = STATS_KEYS[name]
+    if await cache.aadd(key, 1, timeout=None):
+        return
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aset(key, 1, timeout=None)
+
+
+async def aget_month_state(user_id, year, month):
+    """get_month_state の async 版（ASGI 用ビューから使う）"""
+    gen = await cache.aget(GENERATION_KEY)
+    if gen is None:
+        await cache.aadd(GENERATION_KEY, 1, timeout=None)
+        gen = await cache.aget(GENERATION_KEY, 1)
+    key = _key(user_id, year, month, gen)
+    state = await cache.aget(key)
+    if state is not None:
+        await _acount("hits")
+        return state
+
+    await _acount("misses")
+    _, first_display, last_display = month_window(year, month)
+    with db_router.use_primary():
+        summary = {
+            r["date"].isoformat(): _cell(r)
+            async for r in window_queryset(user_id, first_display, last_display)
+        }
+    state = (summary, _etag(summary))
+    await cache.aset(key, state, CACHE_TIMEOUT)
+    return state
+
+
+def get_month_summary(user_id, year, month):
+    """表示範囲（前後月を含む）の records_by_date を返す"""
+    return get_month_state(user_id, year, month)[0]
+
+
+def months_showing(day):
+    """day が表示グリッドに含まれる (year, month) を列挙（当月＋前後月のはみ出し分）"""
+    candidates = [
+        (day.year - 1, 12) if day.month == 1 else (day.year, day.month - 1),
+        (day.year, day.month),
+        (day.year + 1, 1) if day.month == 12 else (day.year, day.month + 1),
+    ]
+    result = []
+    for year, month in candidates:
+        _, first_display, last_display = month_window(year, month)
+        if first_display <= day <= last_display:
+            result.append((year, month))
+    return result
+
+
+def invalidate_date(user_id, day):
+    """day を表示している月のキャッシュだけを破棄する（コミット後）"""
+    if not user_id or not isinstance(day, date):
+        return
+    invalidate_months(user_id, months_showing(day))
+
+
+def invalidate_months(user_id, months):
+    """(year, month) の集合をまとめて破棄する（コミット後。一括取り込みなどシグナルが飛ばない更新にも使う）"""
+    if not user_id or not months:
+        return
+    months = list(months)
+    transaction.on_commit(
+        lambda: cache.delete_many([_key(user_id, y, m, _generation()) for y, m in months])
+    )
+
+
+def invalidate_all():
+    """全ユーザー・全月を無効化（コミット後に世代番号を進める）"""
+    transaction.on_commit(_bump_generation)
+
+
+def _bump_generation():
+    if cache.add(GENERATION_KEY, 2, timeout=None):
+        return
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 2, timeout=None)
+
+
+def cache_stats():
+    values = cache.get_many(list(STATS_KEYS.values()))
+    stats = {name: values.get(key, 0) for name, key in STATS_KEYS.items()}
+    total = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / total, 4) if total else None
+    stats["enabled"] = stats_enabled()
+    return stats
+
+
+def reset_stats():
+    cache.delete_many(list(STATS_KEYS.values()))
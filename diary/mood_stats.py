@@ -0,0 +1,229 @@
+# diary/mood_stats.py
+"""気分の統計（月ごとの分布・連続記録・曜日の傾向・前年比較）
+
+集計は MonthlyMoodSummary（ユーザー×月×気分の日付ビット）に持ち、
+Record の保存/削除ではビットを1つ立てる/落とすだけの差分更新をする。
+統計の計算と年表示（year_heatmap）はこの表だけを読み、Record は読まない。
+集計が変わったら年表示のキャッシュも破棄する。
+"""
+import calendar
+from datetime import date, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from . import moods as mood_registry
+from . import year_heatmap
+from .models import MonthlyMoodSummary, Record
+
+NO_MOOD = "none"
+
+
+def _bit(day):
+    return 1 << (day.day - 1)
+
+
+def _month_rows(user_id, year, month, mood_id):
+    qs = MonthlyMoodSummary.objects.filter(user_id=user_id, year=year, month=month)
+    return qs.filter(mood__isnull=True) if mood_id is None else qs.filter(mood_id=mood_id)
+
+
+def _clear(user_id, day, mood_id):
+    _month_rows(user_id, day.year, day.month, mood_id).update(
+        day_mask=F("day_mask").bitand(~_bit(day))
+    )
+
+
+def _set(user_id, day, mood_id):
+    rows = _month_rows(user_id, day.year, day.month, mood_id)
+    if rows.update(day_mask=F("day_mask").bitor(_bit(day))):
+        return
+    try:
+        with transaction.atomic():
+            MonthlyMoodSummary.objects.create(
+                user_id=user_id, year=day.year, month=day.month, mood_id=mood_id, day_mask=_bit(day),
+            )
+    except IntegrityError:
+        # 同時に作られた行があればそちらにビットを立てる
+        rows.update(day_mask=F("day_mask").bitor(_bit(day)))
+
+
+def apply_change(user_id, old, new):
+    """(date, mood_id) が old → new に変わったことを集計に反映する（None は「なし」）"""
+    if old == new or not user_id:
+        return
+    years = set()
+    if old is not None and old[0] is not None:
+        _clear(user_id, old[0], old[1])
+        years.add(old[0].year)
+    if new is not None and new[0] is not None:
+        _set(user_id, new[0], new[1])
+        years.add(new[0].year)
+    year_heatmap.invalidate(user_id, years)
+
+
+def rebuild_months(user_id, months):
+    """(year, month) の集計を Record から作り直す（bulk_create など差分が取れない更新用）"""
+    for year, month in sorted(months):
+        _, days = calendar.monthrange(year, month)
+        masks = {}
+        rows = Record.objects.filter(
+            user_id=user_id, date__gte=date(year, month, 1), date__lte=date(year, month, days),
+        ).values_list("date", "mood_id")
+        for day, mood_id in rows:
+            masks[mood_id] = masks.get(mood_id, 0) | _bit(day)
+        with transaction.atomic():
+            MonthlyMoodSummary.objects.filter(user_id=user_id, year=year, month=month).delete()
+            MonthlyMoodSummary.objects.bulk_create([
+                MonthlyMoodSummary(user_id=user_id, year=year, month=month, mood_id=m, day_mask=mask)
+                for m, mask in masks.items()
+            ])
+    year_heatmap.invalidate(user_id, {year for year, _ in months})
+
+
+def rebuild_user(user_id, batch_size=1000):
+    """ユーザーの集計をすべて作り直す。作った行数を返す"""
+    masks = {}
+    rows = (
+        Record.objects.filter(user_id=user_id)
+        .values_list("date", "mood_id")
+        .iterator(chunk_size=2000)
+    )
+    for day, mood_id in rows:
+        key = (day.year, day.month, mood_id)
+        masks[key] = masks.get(key, 0) | _bit(day)
+    years = {y for y, _, _ in masks}
+    years.update(MonthlyMoodSummary.objects.filter(user_id=user_id).values_list("year", flat=True).distinct())
+    with transaction.atomic():
+        MonthlyMoodSummary.objects.filter(user_id=user_id).delete()
+        MonthlyMoodSummary.objects.bulk_create(
+            [
+                MonthlyMoodSummary(user_id=user_id, year=y, month=m, mood_id=mood, day_mask=mask)
+                for (y, m, mood), mask in masks.items()
+            ],
+            batch_size=batch_size,
+        )
+    year_heatmap.invalidate(user_id, years)
+    return len(masks)
+
+
+# ---- 統計の計算（集計表だけを読む） ----
+
+def load_masks(user_id):
+    """{(year, month): {気分の色: day_mask}}"""
+    colors = {m.pk: m.color or NO_MOOD for m in mood_registry.all_moods()}
+    result = {}
+    rows = MonthlyMoodSummary.objects.filter(user_id=user_id).values_list(
+        "year", "month", "mood_id", "day_mask",
+    )
+    for year, month, mood_id, mask in rows:
+        if not mask:
+            continue
+        color = colors.get(mood_id, NO_MOOD)
+        by_color = result.setdefault((year, month), {})
+        by_color[color] = by_color.get(color, 0) | mask
+    return result
+
+
+def _color_order(masks):
+    order = [m.color or NO_MOOD for m in mood_registry.all_moods()]
+    seen = {c for by_color in masks.values() for c in by_color}
+    return [c for c in order if c in seen] + sorted(seen - set(order))
+
+
+def _weekday_masks(first_weekday):
+    """月初の曜日ごとに、各曜日（月=0）に当たる日のビット"""
+    masks = [0] * 7
+    for d in range(31):
+        masks[(first_weekday + d) % 7] |= 1 << d
+    return masks
+
+
+WEEKDAY_MASKS = [_weekday_masks(w) for w in range(7)]
+
+
+def _streaks(recorded, today):
+    """recorded: {(year, month): その月の記録日ビット}"""
+    longest = current = run = 0
+    longest_end = None
+    prev_day = None
+    for year, month in sorted(recorded):
+        mask = recorded[(year, month)]
+        _, days = calendar.monthrange(year, month)
+        first = date(year, month, 1)
+        if mask == (1 << days) - 1:
+            # 丸ごと記録した月は日ごとに見ない
+            run = run + days if prev_day == first - timedelta(days=1) else days
+            prev_day = date(year, month, days)
+            if run > longest:
+                longest, longest_end = run, prev_day
+            continue
+        while mask:
+            low = mask & -mask
+            mask ^= low
+            day = first + timedelta(days=low.bit_length() - 1)
+            run = run + 1 if prev_day == day - timedelta(days=1) else 1
+            prev_day = day
+            if run > longest:
+                longest, longest_end = run, day
+    # 今日（まだなら昨日）まで続いている連続記録
+    if prev_day is not None and prev_day >= today - timedelta(days=1):
+        current = run
+    return {
+        "longest": longest,
+        "longest_end": longest_end.isoformat() if longest_end else None,
+        "current": current,
+    }
+
+
+def user_stats(user_id, today=None):
+    today = today or date.today()
+    masks = load_masks(user_id)
+    colors = _color_order(masks)
+
+    months = []
+    weekdays = {c: [0] * 7 for c in colors}
+    years = {}
+    recorded = {}
+    for (year, month) in sorted(masks):
+        by_color = masks[(year, month)]
+        first_weekday, _ = calendar.monthrange(year, month)
+        counts = {c: by_color.get(c, 0).bit_count() for c in colors}
+        months.append({"year": year, "month": month, "total": sum(counts.values()), "moods": counts})
+
+        y = years.setdefault(year, {c: 0 for c in colors})
+        for c, n in counts.items():
+            y[c] += n
+
+        union = 0
+        wmasks = WEEKDAY_MASKS[first_weekday]
+        for c, mask in by_color.items():
+            union |= mask
+            for w in range(7):
+                weekdays[c][w] += (mask & wmasks[w]).bit_count()
+        recorded[(year, month)] = union
+
+    yearly, prev_share = [], None
+    for year in sorted(years):
+        counts = years[year]
+        total = sum(counts.values())
+        share = {c: round(n / total * 100, 1) if total else 0.0 for c, n in counts.items()}
+        yearly.append({
+            "year": year,
+            "total": total,
+            "moods": counts,
+            "share": share,
+            # 前年からの構成比の変化（ポイント）
+            "change": (
+                {c: round(share[c] - prev_share[c], 1) for c in colors} if prev_share is not None else None
+            ),
+        })
+        prev_share = share
+
+    return {
+        "colors": colors,
+        "months": months,
+        "weekdays": weekdays,
+        "years": yearly,
+        "streaks": _streaks(recorded, today),
+    }
@@ -0,0 +1,86 @@
+# diary/moods.py
+"""気分（Mood）のプロセス内レジストリ
+
+Mood はほぼ固定の参照データなので、一度だけ読み込んでメモリに持つ。
+管理画面などで Mood が変わったらコミット後にキャッシュ上の世代番号を進め、
+各プロセスは次のアクセスで読み直す（DB には問い合わせない）。
+"""
+import threading
+
+from django.core.cache import cache
+from django.db import transaction
+
+from . import db_router
+from .models import Mood
+
+# 表示順（赤→橙→黄→緑→青）。初期データはマイグレーションで投入する
+DEFAULT_COLORS = ["red", "orange", "yellow", "green", "blue"]
+
+GENERATION_KEY = "diary:moods:gen"
+
+_lock = threading.Lock()
+_loaded_gen = None
+_moods = ()
+_by_pk = {}
+
+
+def _sort_key(mood):
+    try:
+        rank = DEFAULT_COLORS.index(mood.color)
+    except ValueError:
+        rank = len(DEFAULT_COLORS)
+    return (rank, mood.pk)
+
+
+def _generation():
+    gen = cache.get(GENERATION_KEY)
+    if gen is None:
+        cache.add(GENERATION_KEY, 1, timeout=None)
+        gen = cache.get(GENERATION_KEY, 1)
+    return gen
+
+
+def _ensure_loaded():
+    global _loaded_gen, _moods, _by_pk
+    gen = _generation()
+    if _loaded_gen == gen:
+        return
+    with _lock:
+        if _loaded_gen == gen:
+            return
+        # 次に世代番号が変わるまで持ち続けるのでプライマリから読む
+        with db_router.use_primary():
+            moods = tuple(sorted(Mood.objects.all(), key=_sort_key))
+        _moods = moods
+        _by_pk = {str(m.pk): m for m in moods}
+        _loaded_gen = gen
+
+
+def all_moods():
+    """表示順に並んだ Mood のタプル"""
+    _ensure_loaded()
+    return _moods
+
+
+def get_mood(pk):
+    """pk（文字列可）に対応する Mood。なければ None"""
+    if pk in (None, ""):
+        return None
+    _ensure_loaded()
+    return _by_pk.get(str(pk).strip())
+
+
+def invalidate():
+    """全プロセスに読み直しをさせる（コミット後。コミット前の内容を読み込ませない）"""
+    transaction.on_commit(_bump_generation)
+
+
+def _bump_generation():
+    global _loaded_gen
+    _loaded_gen = None
+    if cache.add(GENERATION_KEY, 2, timeout=None):
+        return
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 2, timeout=None)
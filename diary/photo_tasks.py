@@ -0,0 +1,86 @@
+# diary/photo_tasks.py
+"""写真まわりの後処理（diary.jobs のハンドラ）
+
+リクエストでは写真を保存してジョブを登録するだけにし、重い処理・ファイル削除はワーカーで行う。
+- photo.process: EXIF を落として向きを直し（thumbnails.normalize_photo）、サイズ違いを作る
+- photo.delete: 使われなくなったファイル（移行前の名前の写真・サイズ違い）を消す
+- photo.purge: 参照が 0 になった内容アドレスの写真とサイズ違いを消す（storage.release から）
+
+どのハンドラも、実行時点の DB を見て「まだやる必要があるか」を確かめる（再試行・重複実行しても安全）。
+"""
+import posixpath
+
+from . import jobs, month_cache, thumbnails
+from . import storage as photo_store
+from .models import Record
+
+
+def photo_changed(record):
+    """保存後に呼ぶ：写真が変わっていれば古いサイズ違いを外し、加工をジョブに回す"""
+    current = record.photo_renditions or {}
+    name = record.photo.name if record.photo else ""
+    if current.get("source", "") == name:
+        return False
+
+    if current:
+        # 加工が終わるまでは元写真を表示する（古い写真のサイズ違いを見せない）
+        Record.objects.filter(pk=record.pk).update(photo_renditions={})
+        record.photo_renditions = {}
+        discard([t for k, t in current.items() if k != "source"])
+    if name:
+        jobs.enqueue(
+            "photo.process", {"record": record.pk, "name": name}, key=f"photo.process:{record.pk}:{name}",
+        )
+    return True
+
+
+def discard(names):
+    """names のファイルを（使われていなければ）後で消す
+
+    内容アドレスの名前は参照数で消える（storage.release）ので登録しない。
+    """
+    names = sorted({n for n in names if n and photo_store.digest_of(n) is None})
+    if names:
+        jobs.enqueue("photo.delete", {"names": names})
+
+
+def process_photo(record, name):
+    """record の写真がまだ name なら、EXIF 除去・向き補正をしてサイズ違いを作る"""
+    row = Record.objects.filter(pk=record, photo=name).values("user_id", "date").first()
+    if row is None:
+        return
+    storage = photo_store.photo_storage()
+
+    # 保存し直す名前はアップロード時と同じ規則で決める（内容アドレスなら中身のハッシュになる）
+    upload_name = Record._meta.get_field("photo").generate_filename(None, posixpath.basename(name))
+    normalized = thumbnails.normalize_photo(storage, name, upload_name)
+    if normalized != name:
+        if not Record.objects.filter(pk=record, photo=name).update(photo=normalized):
+            # 処理中に写真が変わった
+            photo_store.recount([normalized])
+            return
+        photo_store.recount([name, normalized])
+        discard([name])
+        name = normalized
+
+    renditions = thumbnails.generate_renditions(storage, name)
+    Record.objects.filter(pk=record, photo=name).update(photo_renditions=renditions)
+    # 月表示のキャッシュには写真の URL が入っている
+    month_cache.invalidate_date(row["user_id"], row["date"])
+
+
+def delete_files(names):
+    """記録が使っていないファイルだけを消す（サイズ違いは元写真が使われていれば残す）"""
+    storage = photo_store.photo_storage()
+    in_use = set(Record.objects.filter(photo__in=names).values_list("photo", flat=True))
+    for name in names:
+        if name in in_use:
+            continue
+        stem = thumbnails.source_stem(name)
+        if stem and Record.objects.filter(photo__startswith=stem + ".").exists():
+            continue
+        storage.delete(name)
+
+
+def purge_blob(digest):
+    photo_store.purge_if_unreferenced(digest)
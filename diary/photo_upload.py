@@ -0,0 +1,139 @@
+# diary/photo_upload.py
+"""アップロードされた写真の正規化（Pillow）
+
+- MaxSizeUploadHandler: 写真のフィールド（PHOTO_FIELDS）だけ受信しながら大きさを数え、
+  DIARY_PHOTO_MAX_UPLOAD_BYTES を超えた写真はその場で捨てる（本文を最後まで溜めてから断らない）。
+  捨てたことは request.rejected_uploads に残し、ビューがフォームのエラーにする。
+  記録の取り込み（records_file）や管理画面など、ほかのアップロードには触らない。
+- normalize(): 向きを直し、長辺を DIARY_PHOTO_MAX_DIMENSION に収め、メタデータ（EXIF・撮影位置など）を
+  落として DIARY_PHOTO_FORMATS の順に使える形式（既定 WebP、だめなら JPEG）で再圧縮する。
+  再圧縮で大きくなるだけなら元のファイルを使う（既に小さく、メタデータもない写真）。
+- HEIC / HEIF は pillow-heif が入っていれば読める（なければ画像として受け付けない）。
+"""
+import posixpath
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+try:
+    from pillow_heif import register_heif_opener
+except ImportError:  # 任意：HEIC を読むときだけ必要
+    register_heif_opener = None
+else:
+    register_heif_opener()
+
+MAX_UPLOAD_BYTES = getattr(settings, "DIARY_PHOTO_MAX_UPLOAD_BYTES", 20 * 1024 * 1024)
+MAX_DIMENSION = getattr(settings, "DIARY_PHOTO_MAX_DIMENSION", 2048)
+MAX_PIXELS = getattr(settings, "DIARY_PHOTO_MAX_PIXELS", 60_000_000)
+QUALITY = getattr(settings, "DIARY_PHOTO_QUALITY", 80)
+FORMATS = getattr(settings, "DIARY_PHOTO_FORMATS", ["WEBP", "JPEG"])
+
+# 上限を当てるフィールド名（RecordForm.photo）
+PHOTO_FIELDS = ("photo",)
+
+EXTENSIONS = {"AVIF": "avif", "WEBP": "webp", "JPEG": "jpg"}
+CONTENT_TYPES = {"AVIF": "image/avif", "WEBP": "image/webp", "JPEG": "image/jpeg"}
+
+
+def too_large_message():
+    return f"写真は {MAX_UPLOAD_BYTES // (1024 * 1024)}MB までです"
+
+
+class MaxSizeUploadHandler(FileUploadHandler):
+    """FILE_UPLOAD_HANDLERS の先頭に置く。上限を超えた写真は以降のハンドラに渡さず捨てる"""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.limited = self.field_name in PHOTO_FIELDS
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.limited:
+            return raw_data
+        self.received += len(raw_data)
+        if self.received > MAX_UPLOAD_BYTES:
+            rejected = getattr(self.request, "rejected_uploads", None)
+            if rejected is None:
+                rejected = self.request.rejected_uploads = {}
+            rejected[self.field_name] = too_large_message()
+            raise SkipFile()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def rejected_uploads(request):
+    """{フィールド名: エラーメッセージ}（上限を超えて捨てたアップロード）"""
+    return getattr(request, "rejected_uploads", None) or {}
+
+
+def _available(fmt):
+    Image.init()
+    return fmt in Image.SAVE
+
+
+def _encode(image, fmt):
+    if fmt == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buf = BytesIO()
+    params = {"quality": QUALITY}
+    if fmt == "JPEG":
+        params.update(optimize=True, progressive=True)
+    elif fmt == "WEBP":
+        params["method"] = 4
+    image.save(buf, format=fmt, **params)
+    return buf.getvalue()
+
+
+def normalize(uploaded):
+    """uploaded（File）を縮小・再圧縮した SimpleUploadedFile を返す。画像として読めなければ ValidationError"""
+    uploaded.seek(0)
+    try:
+        image = Image.open(uploaded)
+        width, height = image.size
+        if width * height > MAX_PIXELS:
+            raise ValidationError("写真の画素数が大きすぎます", code="too_many_pixels")
+        source_format = image.format
+        has_metadata = bool(image.getexif()) or any(
+            k in image.info for k in ("exif", "xmp", "XML:com.adobe.xmp", "icc_profile")
+        )
+        # JPEG は縮小後の大きさに近い解像度で読み込む（全画素を展開しない）
+        image.draft("RGB", (MAX_DIMENSION, MAX_DIMENSION))
+        image = ImageOps.exif_transpose(image)
+        if image.mode == "P":
+            image = image.convert("RGBA")
+        elif image.mode not in ("RGB", "RGBA", "L"):
+            image = image.convert("RGB")
+        image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.Resampling.LANCZOS)
+
+        data = fmt = None
+        for candidate in FORMATS:
+            if not _available(candidate):
+                continue
+            try:
+                data = _encode(image, candidate)
+            except (OSError, KeyError, ValueError):
+                continue
+            fmt = candidate
+            break
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        raise ValidationError("画像として読み込めませんでした", code="invalid_image")
+    if data is None:
+        raise ValidationError("写真を変換できませんでした", code="encode_failed")
+
+    original_size = getattr(uploaded, "size", None)
+    if (
+        original_size is not None and original_size <= len(data)
+        and not has_metadata and source_format in FORMATS
+        and max(width, height) <= MAX_DIMENSION
+    ):
+        uploaded.seek(0)
+        return uploaded
+
+    stem = posixpath.splitext(posixpath.basename(uploaded.name or "photo"))[0] or "photo"
+    return SimpleUploadedFile(f"{stem}.{EXTENSIONS[fmt]}", data, content_type=CONTENT_TYPES[fmt])
@@ -0,0 +1,101 @@
+# diary/recorded_days.py
+"""記録済みの日を「年ごとのビットマップ」で持つ（上書き確認ダイアログ用）
+
+1年 = 366ビット（46バイト）。ビット位置は元日からの日数（0始まり）。
+ユーザーの記録年数に関係なく、ページに載るのは1年分だけになる。
+キャッシュ済みのビットマップは Record の保存/削除のコミット後に捨てる（次回アクセスで作り直す）。
+作り直すときはプライマリを読む（レプリカの遅れた内容をキャッシュしない）。
+"""
+import base64
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import db_router
+from .models import Record
+
+KEY_PREFIX = "diary:recorded"
+CACHE_TIMEOUT = getattr(settings, "DIARY_RECORDED_DAYS_CACHE_TIMEOUT", 60 * 60 * 24)
+BITMAP_BYTES = 46  # 366 ビット
+
+
+def _key(user_id, year):
+    return f"{KEY_PREFIX}:{user_id}:{year}"
+
+
+def _index(day):
+    return day.toordinal() - date(day.year, 1, 1).toordinal()
+
+
+def _build(user_id, year):
+    bits = bytearray(BITMAP_BYTES)
+    days = (
+        Record.objects
+        .filter(user_id=user_id, date__gte=date(year, 1, 1), date__lte=date(year, 12, 31))
+        .values_list("date", flat=True)
+    )
+    for day in days:
+        i = _index(day)
+        bits[i >> 3] |= 1 << (i & 7)
+    return bytes(bits)
+
+
+def year_bitmap(user_id, year):
+    """year の記録済みビットマップ（bytes）"""
+    key = _key(user_id, year)
+    bits = cache.get(key)
+    if bits is None:
+        with db_router.use_primary():
+            bits = _build(user_id, year)
+        cache.set(key, bits, CACHE_TIMEOUT)
+    return bits
+
+
+async def ayear_bitmap(user_id, year):
+    """year_bitmap の async 版"""
+    key = _key(user_id, year)
+    bits = await cache.aget(key)
+    if bits is None:
+        buf = bytearray(BITMAP_BYTES)
+        days = (
+            Record.objects
+            .filter(user_id=user_id, date__gte=date(year, 1, 1), date__lte=date(year, 12, 31))
+            .values_list("date", flat=True)
+        )
+        with db_router.use_primary():
+            async for day in days:
+                i = _index(day)
+                buf[i >> 3] |= 1 << (i & 7)
+        bits = bytes(buf)
+        await cache.aset(key, bits, CACHE_TIMEOUT)
+    return bits
+
+
+def encode(bits):
+    return base64.b64encode(bits).decode("ascii")
+
+
+def is_recorded(bits, day):
+    i = _index(day)
+    return bool(bits[i >> 3] & (1 << (i & 7)))
+
+
+def invalidate_years(user_id, years):
+    """year のビットマップを破棄する（一括取り込み用。次回アクセスで作り直す）"""
+    if user_id and years:
+        keys = [_key(user_id, year) for year in years]
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate(user_id, day):
+    """day の年のビットマップを捨てる（次回アクセスで作り直す）
+
+    get → ビット書き換え → set だと、同時に2件保存されたときに片方の書き換えが消えるので、
+    キャッシュの中身は書き換えずに delete だけにする。コミット前に消すと、その間に別リクエストが
+    コミット前の内容で作り直してしまうので、消すのはコミット後。
+    """
+    if not user_id or not isinstance(day, date):
+        return
+    invalidate_years(user_id, [day.year])
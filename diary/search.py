@@ -0,0 +1,267 @@
+# diary/search.py
+"""メモ（Record.note）の全文検索
+
+- SQLite: FTS5（trigram トークナイザ）の diary_record_fts。Record と DB トリガーで同期する
+  （bulk_create / 一括取り込みでもずれない）。並びは bm25 → 日付の新しい順。
+- PostgreSQL: pg_trgm の GIN インデックス（diary_record_note_trgm）で ILIKE を速くし、
+  word_similarity の高い順に並べる（pg_trgm がなければ ILIKE で日付の新しい順）。
+- 3文字未満の語（「仕事」など）は trigram では引けないので、長い語で絞った結果に LIKE をかける。
+  短い語しかなければ、そのユーザーの記録だけを LIKE で探す。
+
+スニペットはどのバックエンドでも Python 側で作る（HTML はエスケープしてから <mark> で囲む）。
+"""
+import logging
+import re
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.dateparse import parse_date
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from . import moods as mood_registry
+from .models import Record
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "diary_record_fts"
+MIN_TRIGRAM = 3
+PER_PAGE = 20
+SNIPPET_CHARS = 40
+MAX_TERMS = 8
+
+_fts_available = None
+_trgm_available = None
+
+SQLITE_INDEX_SQL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"note, content='diary_record', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON diary_record BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, note) VALUES (new.id, new.note); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON diary_record BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, note) VALUES ('delete', old.id, old.note); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF note ON diary_record BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, note) VALUES ('delete', old.id, old.note); "
+    f"INSERT INTO {FTS_TABLE}(rowid, note) VALUES (new.id, new.note); END",
+]
+FTS_TRIGGERS = [f"{FTS_TABLE}_ai", f"{FTS_TABLE}_ad", f"{FTS_TABLE}_au"]
+SQLITE_DROP_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+POSTGRES_INDEX_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS diary_record_note_trgm ON diary_record USING gin (note gin_trgm_ops)",
+]
+POSTGRES_DROP_SQL = ["DROP INDEX IF EXISTS diary_record_note_trgm"]
+
+
+def install_index(conn):
+    """検索用の索引（とトリガー）を作り、既存の記録を索引に入れる。作れなければ False
+
+    SQLite は FTS5 と trigram トークナイザ（3.34 以降）が必要。
+    PostgreSQL は pg_trgm 拡張を作る権限が必要。どちらもなければ LIKE 検索のまま動く。
+    """
+    global _fts_available, _trgm_available
+    _fts_available = _trgm_available = None
+    if conn.vendor == "sqlite":
+        statements = SQLITE_INDEX_SQL + [f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"]
+    elif conn.vendor == "postgresql":
+        statements = POSTGRES_INDEX_SQL
+    else:
+        return False
+    try:
+        with transaction.atomic(using=conn.alias), conn.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+    except DatabaseError:
+        return False
+    return True
+
+
+def drop_index(conn):
+    global _fts_available, _trgm_available
+    _fts_available = _trgm_available = None
+    statements = {"sqlite": SQLITE_DROP_SQL, "postgresql": POSTGRES_DROP_SQL}.get(conn.vendor, [])
+    with conn.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+class Page:
+    """検索結果の1ページ（hits は {"pk", "date", "color", "snippet"} の dict）"""
+
+    def __init__(self, hits, total, page, per_page):
+        self.hits = hits
+        self.total = total
+        self.page = page
+        self.per_page = per_page
+
+    @property
+    def has_previous(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page * self.per_page < self.total
+
+    @property
+    def num_pages(self):
+        return max(1, -(-self.total // self.per_page))
+
+
+def terms_of(query):
+    """空白（全角含む）で区切った検索語。重複を除き最大 MAX_TERMS 個"""
+    seen = []
+    for term in re.split(r"\s+", (query or "").strip()):
+        if term and term not in seen:
+            seen.append(term)
+    return seen[:MAX_TERMS]
+
+
+def _sqlite_objects(kind):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = %s", [kind])
+        return {name for (name,) in cursor.fetchall()}
+
+
+def fts_available():
+    """FTS5 の表と同期用トリガーがそろっているか（トリガーがないと新しい記録が引けないので LIKE にする）"""
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = False
+        if connection.vendor == "sqlite" and FTS_TABLE in _sqlite_objects("table"):
+            _fts_available = set(FTS_TRIGGERS) <= _sqlite_objects("trigger")
+            if not _fts_available:
+                logger.warning("%s の同期トリガーがありません（manage.py rebuild_search_index で作り直せます）", FTS_TABLE)
+    return _fts_available
+
+
+def trgm_available():
+    """PostgreSQL に pg_trgm 拡張が入っているか（word_similarity で並べられるか）"""
+    global _trgm_available
+    if _trgm_available is None:
+        _trgm_available = False
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                _trgm_available = cursor.fetchone() is not None
+    return _trgm_available
+
+
+def snippet(note, terms, width=SNIPPET_CHARS):
+    """最初に見つかった語のまわりを切り出し、語を <mark> で囲んだ安全な HTML"""
+    note = note or ""
+    lowered = note.lower()
+    positions = [lowered.find(t.lower()) for t in terms]
+    positions = [p for p in positions if p >= 0]
+    start = max(0, min(positions) - width // 4) if positions else 0
+    end = min(len(note), start + width)
+    text = note[start:end]
+    pattern = re.compile("|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    parts, last = [], 0
+    for m in pattern.finditer(text):
+        parts.append(escape(text[last:m.start()]))
+        parts.append(f"<mark>{escape(m.group(0))}</mark>")
+        last = m.end()
+    parts.append(escape(text[last:]))
+    html = "".join(parts)
+    if start > 0:
+        html = "…" + html
+    if end < len(note):
+        html += "…"
+    return mark_safe(html)
+
+
+def _fts_query(terms):
+    # 語ごとにフレーズとして引用し、AND で結ぶ（FTS5 の演算子や記号をそのまま解釈させない）
+    return " AND ".join('"' + t.replace('"', '""') + '"' for t in terms)
+
+
+def _sqlite_fts(user_id, terms, short_terms, offset, limit):
+    match = _fts_query(terms)
+    # 3文字未満の語は FTS で絞った行に LIKE をかける
+    # CROSS JOIN で結合順を固定する（FTS から引く。ユーザーの全記録を1件ずつ MATCH させない）
+    where = f"{FTS_TABLE} MATCH %s AND r.user_id = %s"
+    params = [match, user_id]
+    for t in short_terms:
+        where += " AND r.note LIKE %s ESCAPE '\\'"
+        params.append("%" + _escape_like(t) + "%")
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT count(*) FROM {FTS_TABLE} f CROSS JOIN diary_record r ON r.id = f.rowid WHERE {where}",
+            params,
+        )
+        total = cursor.fetchone()[0]
+        cursor.execute(
+            f"SELECT r.id, r.date, r.mood_id, r.note FROM {FTS_TABLE} f "
+            f"CROSS JOIN diary_record r ON r.id = f.rowid WHERE {where} "
+            f"ORDER BY bm25({FTS_TABLE}), r.date DESC LIMIT %s OFFSET %s",
+            params + [limit, offset],
+        )
+        rows = cursor.fetchall()
+    return total, [
+        (pk, parse_date(day) if isinstance(day, str) else day, mood_id, note)
+        for pk, day, mood_id, note in rows
+    ]
+
+
+def _escape_like(term):
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _ilike(term):
+    # icontains は UPPER(note) LIKE になり trigram インデックスが使えないので ILIKE を直接書く
+    pattern = "%" + _escape_like(term) + "%"
+    return RawSQL("diary_record.note ILIKE %s", (pattern,), output_field=BooleanField())
+
+
+def _like(user_id, terms, offset, limit):
+    qs = Record.objects.filter(user_id=user_id)
+    postgres = connection.vendor == "postgresql"
+    if postgres:
+        for t in terms:
+            qs = qs.filter(_ilike(t))
+    else:
+        cond = Q()
+        for t in terms:
+            cond &= Q(note__icontains=t)
+        qs = qs.filter(cond)
+    total = qs.count()
+    if postgres and trgm_available():
+        qs = qs.annotate(rank=RawSQL("word_similarity(%s, diary_record.note)", (" ".join(terms),)))
+        qs = qs.order_by("-rank", "-date")
+    else:
+        qs = qs.order_by("-date")
+    rows = list(qs.values_list("pk", "date", "mood_id", "note")[offset:offset + limit])
+    return total, rows
+
+
+def search(user_id, query, page=1, per_page=PER_PAGE):
+    """ユーザーのメモを検索して Page を返す（語がなければ 0 件）"""
+    terms = terms_of(query)
+    page = max(1, page)
+    if not terms:
+        return Page([], 0, page, per_page)
+
+    offset = (page - 1) * per_page
+    long_terms = [t for t in terms if len(t) >= MIN_TRIGRAM]
+    short_terms = [t for t in terms if len(t) < MIN_TRIGRAM]
+    if fts_available() and long_terms:
+        total, rows = _sqlite_fts(user_id, long_terms, short_terms, offset, per_page)
+    else:
+        total, rows = _like(user_id, terms, offset, per_page)
+
+    hits = []
+    for pk, day, mood_id, note in rows:
+        mood = mood_registry.get_mood(mood_id)
+        hits.append({
+            "pk": pk,
+            "date": day,
+            "color": mood.color if mood else "",
+            "snippet": snippet(note, terms),
+        })
+    return Page(hits, total, page, per_page)
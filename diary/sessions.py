@@ -0,0 +1,67 @@
+# diary/sessions.py
+"""セッションの有効期限を「一定間隔ごとにだけ」延長する（スライディング期限＋書き込みの間引き）
+
+SESSION_SAVE_EVERY_REQUEST だと月送りなど毎リクエストで django_session を更新してしまう。
+SlidingSessionMiddleware は最後に延長した時刻をセッションに持ち、
+DIARY_SESSION_REFRESH_INTERVAL 秒を過ぎたときだけセッションを保存し直す（期限とクッキーが延びる）。
+"""
+import time
+
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+REFRESHED_AT_KEY = "_refreshed_at"
+REFRESH_INTERVAL = getattr(settings, "DIARY_SESSION_REFRESH_INTERVAL", 60 * 60)
+
+
+class SlidingSessionMiddleware(MiddlewareMixin):
+    """SessionMiddleware より後ろに置く（レスポンス処理はこちらが先に動く）"""
+
+    def process_response(self, request, response):
+        session = getattr(request, "session", None)
+        # セッションを読んでいないリクエスト（匿名ページ等）では何もしない：読み込みのクエリも増やさない
+        if session is None or not session.accessed or response.status_code == 500:
+            return response
+        now = int(time.time())
+        if session.modified:
+            # どうせ保存されるので時刻だけ載せておく（ログイン直後など）
+            if not session.is_empty():
+                session[REFRESHED_AT_KEY] = now
+            return response
+        if session.is_empty():
+            return response
+        refreshed_at = session.get(REFRESHED_AT_KEY, 0)
+        if now - refreshed_at >= REFRESH_INTERVAL:
+            session[REFRESHED_AT_KEY] = now
+        return response
+
+
+def purge_expired(batch_size=1000, pause=0.0, engine=None):
+    """期限切れセッションを batch_size 件ずつ削除し、削除件数を返す
+
+    DB を使うバックエンド（db / cached_db）以外はバックエンドの clear_expired に任せる（件数は None）。
+    """
+    from importlib import import_module
+
+    from django.utils import timezone
+
+    store_class = import_module(engine or settings.SESSION_ENGINE).SessionStore
+    get_model_class = getattr(store_class, "get_model_class", None)
+    if get_model_class is None:
+        store_class.clear_expired()
+        return None
+
+    model = get_model_class()
+    now = timezone.now()
+    deleted = 0
+    while True:
+        keys = list(
+            model.objects.filter(expire_date__lt=now)
+            .order_by("expire_date")
+            .values_list("session_key", flat=True)[:batch_size]
+        )
+        if not keys:
+            return deleted
+        deleted += model.objects.filter(session_key__in=keys).delete()[0]
+        if pause:
+            time.sleep(pause)
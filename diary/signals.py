@@ -0,0 +1,104 @@
+# diary/signals.py
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import month_cache, mood_stats, moods, photo_tasks, recorded_days, storage, year_heatmap
+from .models import Mood, Record
+
+
+# 写真が変わったら古いサイズ違いを外し、加工（EXIF 除去・向き補正・サイズ違い生成）をジョブに回す
+@receiver(post_save, sender=Record)
+def queue_photo_processing(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    photo_tasks.photo_changed(instance)
+
+
+# この保存で写真をアップロードするか（アップロードした写真の参照は storage の _save が数える）
+@receiver(pre_save, sender=Record)
+def note_photo_upload(sender, instance, **kwargs):
+    instance._photo_uploaded = bool(instance.photo) and not instance.photo._committed
+
+
+# 写真の参照数（内容アドレス保存）：読み込み時の写真との差分だけ増減する
+# 外れた写真は使われていなければジョブで消す（移行前の名前の写真）
+@receiver(post_save, sender=Record)
+def update_photo_refs(sender, instance, created=False, raw=False, **kwargs):
+    new = instance.photo.name if instance.photo else ""
+    old = "" if created else getattr(instance, "_photo_key", None)
+    uploaded = getattr(instance, "_photo_uploaded", False)
+    if raw or old is None:
+        # 読み込み時の写真が分からないときは数え直す
+        storage.recount([new] if new else [])
+    elif old != new or uploaded:
+        if not uploaded:
+            storage.acquire(new)
+        # 同じ写真を上げ直したときは _save で数えた分をここで戻す
+        storage.release(old)
+        if old != new:
+            photo_tasks.discard([old])
+    instance._photo_key = new
+    instance._photo_uploaded = False
+
+
+@receiver(post_delete, sender=Record)
+def release_photo_ref(sender, instance, **kwargs):
+    old = getattr(instance, "_photo_key", None)
+    if old is None:
+        old = instance.photo.name if instance.photo else ""
+    storage.release(old)
+    renditions = instance.photo_renditions or {}
+    photo_tasks.discard([old] + [t for k, t in renditions.items() if k != "source"])
+
+
+# 記録の保存/削除 → その日付を表示している月のキャッシュを破棄
+@receiver(post_save, sender=Record)
+@receiver(post_delete, sender=Record)
+def invalidate_month_cache(sender, instance, **kwargs):
+    month_cache.invalidate_date(instance.user_id, instance.date)
+
+
+# 上書き確認用の記録済みビットマップを破棄（作成/削除で変わる）
+@receiver(post_save, sender=Record)
+def mark_recorded_day(sender, instance, created=False, **kwargs):
+    if created:
+        recorded_days.invalidate(instance.user_id, instance.date)
+
+
+@receiver(post_delete, sender=Record)
+def unmark_recorded_day(sender, instance, **kwargs):
+    recorded_days.invalidate(instance.user_id, instance.date)
+
+
+# 気分の集計：読み込み時の（日付, 気分）との差分だけビットを付け替える
+@receiver(post_save, sender=Record)
+def update_mood_summary(sender, instance, created=False, raw=False, **kwargs):
+    new = (instance.date, instance.mood_id)
+    old = None if created else getattr(instance, "_stats_key", None)
+    if raw or (old is None and not created):
+        # 読み込み時の値が分からない（fixture や pk 指定の保存）ときはその月を作り直す
+        mood_stats.rebuild_months(instance.user_id, {(instance.date.year, instance.date.month)})
+    else:
+        mood_stats.apply_change(instance.user_id, old, new)
+    instance._stats_key = new
+
+
+@receiver(post_delete, sender=Record)
+def remove_from_mood_summary(sender, instance, **kwargs):
+    old = getattr(instance, "_stats_key", None) or (instance.date, instance.mood_id)
+    mood_stats.apply_change(instance.user_id, old, None)
+
+
+# 気分（色）の変更は全ての月に影響する
+@receiver(post_save, sender=Mood)
+@receiver(post_delete, sender=Mood)
+def invalidate_all_month_cache(sender, instance, **kwargs):
+    month_cache.invalidate_all()
+    year_heatmap.invalidate_all()
+
+
+# 管理画面などでの Mood 変更 → 各プロセスのレジストリを読み直させる
+@receiver(post_save, sender=Mood)
+@receiver(post_delete, sender=Mood)
+def invalidate_mood_registry(sender, instance, **kwargs):
+    moods.invalidate()
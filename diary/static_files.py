@@ -0,0 +1,125 @@
+# diary/static_files.py
+"""静的ファイル（CSS / JS）の配信
+
+- CompressedManifestStaticFilesStorage: collectstatic で中身のハッシュ入りの名前（base.3f2a….css）を作り、
+  テキスト系のファイルは .gz（と brotli が入っていれば .br）も書いておく（リクエストごとに圧縮しない）。
+  collectstatic 前（開発・テスト）は元の名前の URL を返す。
+- StaticFilesMiddleware: 前段のプロキシがない構成で STATIC_ROOT のファイルを返す。
+  ハッシュ入りの名前は中身が変わらないので1年キャッシュさせ、Accept-Encoding に合わせて .br / .gz を返す。
+  ETag / 304 / Range / X-Sendfile は file_serving.serve_file に任せる。
+"""
+import gzip
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.utils._os import safe_join
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import cached_property
+
+from . import file_serving
+
+try:
+    import brotli
+except ImportError:  # 任意：なければ .gz だけ作る
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".mjs", ".json", ".map", ".svg", ".txt", ".xml", ".html"}
+MIN_COMPRESS_SIZE = 256
+IMMUTABLE_PUBLIC = "public, max-age=31536000, immutable"
+STATIC_CACHE_CONTROL = getattr(settings, "DIARY_STATIC_CACHE_CONTROL", "public, max-age=300")
+# 優先順（Accept-Encoding のトークン, 拡張子）
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+
+def _compress_file(path):
+    """path の隣に .gz / .br を書く（小さくならなければ書かない）"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return
+    variants = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(data, mode=brotli.MODE_TEXT)
+    for ext, compressed in variants.items():
+        if len(compressed) < len(data):
+            with open(path + ext, "wb") as f:
+                f.write(compressed)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # collectstatic 前で STATIC_ROOT にファイルがない（開発・テスト）
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS and self.exists(name):
+                _compress_file(self.path(name))
+
+
+def _accepts(request, token):
+    for part in request.headers.get("Accept-Encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip().lower() == token:
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+class StaticFilesMiddleware(MiddlewareMixin):
+    """STATIC_URL 以下を STATIC_ROOT から返す（SecurityMiddleware の直後に置く）
+
+    DIARY_SERVE_STATIC=False（前段の nginx などが返す構成）なら外れる。
+    STATIC_ROOT にないファイルは後ろに流す（開発中は staticfiles の finders が返す）。
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "DIARY_SERVE_STATIC", True) or not settings.STATIC_ROOT:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.prefix = settings.STATIC_URL if settings.STATIC_URL.startswith("/") else "/" + settings.STATIC_URL
+        self.root = str(settings.STATIC_ROOT)
+
+    @cached_property
+    def immutable_names(self):
+        # manifest に載っているハッシュ入りの名前（collectstatic 後に起動し直せば読み直す）
+        return set(getattr(staticfiles_storage, "hashed_files", {}).values())
+
+    def process_request(self, request):
+        if request.method not in ("GET", "HEAD") or not request.path_info.startswith(self.prefix):
+            return None
+        name = request.path_info[len(self.prefix):]
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not name or not os.path.isfile(path):
+            return None
+
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type == "application/javascript":
+            content_type += "; charset=utf-8"
+        cache_control = IMMUTABLE_PUBLIC if name in self.immutable_names else STATIC_CACHE_CONTROL
+
+        served, encoding = path, None
+        for token, ext in ENCODINGS:
+            if os.path.isfile(path + ext) and _accepts(request, token):
+                served, encoding = path + ext, token
+                break
+        response = file_serving.serve_file(request, served, content_type=content_type, cache_control=cache_control)
+        if encoding:
+            response["Content-Encoding"] = encoding
+        if os.path.isfile(path + ".gz") or os.path.isfile(path + ".br"):
+            response["Vary"] = "Accept-Encoding"
+        return response
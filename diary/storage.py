@@ -0,0 +1,231 @@
+# diary/storage.py
+"""写真の保存先：内容（SHA-256）で名前を決め、同じ写真は1つのファイルにまとめる
+
+- 元写真は photos/ab/cd/<sha256>.<拡張子>（ハッシュの先頭2桁ずつで2段に分ける）。
+  記録・ユーザーをまたいで同じ内容なら同じファイルを指し、2回目以降は書き込まない。
+- サイズ違い（thumbnails）は save_derived() で元写真の隣に <元名>.<hash>.<種類>.jpg のまま置く。
+- 参照数は PhotoBlob に持ち、Record のシグナル（acquire / release）で増減する。
+  新しく保存する元写真は _save() が書き込みの前に参照を1つ数える（Record のシグナルはその分を数えない）。
+  storage.delete() は参照が残っている元写真・サイズ違いを消さない。参照が 0 になったら
+  コミット後に photo.purge ジョブ（diary.jobs）で元写真とサイズ違いをまとめて消す。
+- 参照数の増減・ファイルの有無の確認・削除は blob_lock(digest) の中で行う。
+  消す直前に参照を見直すので、消すまでの間に同じ写真がアップロードされても、そのファイルは消えない。
+- 内容アドレスでない名前（移行前の photos/xxx.jpg）は従来どおり普通のファイルとして扱う。
+"""
+import hashlib
+import logging
+import posixpath
+import re
+from contextlib import contextmanager
+
+from django.core.files.storage import FileSystemStorage, InvalidStorageError, default_storage, storages
+from django.core.files.utils import validate_file_name
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "photos"
+CHUNK_SIZE = 64 * 1024
+ADDRESSED_RE = re.compile(rf"^{PREFIX}/([0-9a-f]{{2}})/([0-9a-f]{{2}})/([0-9a-f]{{64}})(?:\.|$)")
+
+
+def blob_name(digest, ext=""):
+    return f"{PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+
+def digest_of(name):
+    """内容アドレスの名前（サイズ違いを含む）ならその SHA-256、違えば None"""
+    m = ADDRESSED_RE.match(name or "")
+    return m.group(3) if m else None
+
+
+def is_blob_name(name):
+    """内容アドレスの元写真の名前か（サイズ違いは含まない）"""
+    digest = digest_of(name)
+    return digest is not None and posixpath.splitext(name)[0] == blob_name(digest)
+
+
+@contextmanager
+def blob_lock(digest):
+    """digest の写真の参照数・ファイルを触る間のロック（外側のトランザクションの終わりまで持つ）
+
+    SQLite は atomic() が最初に書き込みロックを取る（transaction_mode=IMMEDIATE）ので DB 全体で1つ、
+    PostgreSQL は digest ごとのアドバイザリロック。
+    """
+    from .models import PhotoBlob
+
+    using = router.db_for_write(PhotoBlob)
+    # 入れ子ではセーブポイントを作らない（ロックが要るだけなので、失敗したら外側ごと戻す）
+    with transaction.atomic(using=using, savepoint=False):
+        connection = connections[using]
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", [int(digest[:15], 16)])
+        yield
+
+
+def file_digest(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks(CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+@deconstructible(path="diary.storage.ContentAddressedStorage")
+class ContentAddressedStorage(FileSystemStorage):
+    def __init__(self, **kwargs):
+        # 同じ名前なら中身も同じなので、同時に保存されても上書きでよい（名前をずらさない）
+        kwargs.setdefault("allow_overwrite", True)
+        super().__init__(**kwargs)
+
+    def _save(self, name, content):
+        if digest_of(name) is None:
+            ext = posixpath.splitext(name)[1].lower()
+            name = blob_name(file_digest(content), ext)
+        # サイズ違い・移行済みの名前はそのまま。既にあれば書き込まない
+        if not is_blob_name(name):
+            return self._write_missing(name, content)
+        # 参照を先に数えてから（ロックの中で）ファイルを見る。数える前に見ると、
+        # 参照 0 の古いファイルを「ある」として書き込みを省き、その後の photo.purge に消される
+        with blob_lock(digest_of(name)):
+            acquire(name, size=getattr(content, "size", None))
+            return self._write_missing(name, content)
+
+    def _write_missing(self, name, content):
+        if self.exists(name):
+            return name
+        if hasattr(content, "seek"):
+            content.seek(0)
+        return super()._save(name, content)
+
+    def save_derived(self, name, content):
+        """元写真から作ったファイル（サイズ違い）を、内容アドレスにせずこの名前で保存する"""
+        validate_file_name(name, allow_relative_path=True)
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+    def delete(self, name):
+        digest = digest_of(name)
+        if digest and is_referenced(digest):
+            return
+        super().delete(name)
+
+    def purge_file(self, name):
+        """参照数を見ずに消す（サイズ違いの作り直し用）"""
+        super().delete(name)
+
+    def purge(self, digest):
+        """digest の元写真とサイズ違いを消す（参照数は見ない）"""
+        directory = posixpath.dirname(blob_name(digest))
+        try:
+            _, files = self.listdir(directory)
+        except FileNotFoundError:
+            return 0
+        removed = 0
+        for filename in files:
+            if filename.startswith(digest):
+                super().delete(posixpath.join(directory, filename))
+                removed += 1
+        return removed
+
+
+def photo_storage():
+    """Record.photo の保存先（STORAGES["photos"]、なければ default）"""
+    try:
+        return storages["photos"]
+    except InvalidStorageError:
+        return default_storage
+
+
+def is_referenced(digest):
+    from .models import PhotoBlob
+
+    return PhotoBlob.objects.filter(digest=digest, refcount__gt=0).exists()
+
+
+def purge_if_unreferenced(digest):
+    from .models import PhotoBlob
+
+    storage = photo_storage()
+    if not isinstance(storage, ContentAddressedStorage):
+        return
+    with blob_lock(digest):
+        # 消すまでの間に同じ写真がまた使われていたら残す（アップロード中のものは _save が数え済み）
+        if PhotoBlob.objects.filter(digest=digest).exists():
+            return
+        try:
+            storage.purge(digest)
+        except OSError:
+            logger.warning("failed to purge photo %s", digest)
+
+
+def _schedule_purge(digest):
+    # ファイルの削除はコミット後にジョブで行う（diary.jobs / photo_tasks.purge_blob）
+    from . import jobs
+
+    transaction.on_commit(
+        lambda: jobs.enqueue("photo.purge", {"digest": digest}, key=f"photo.purge:{digest}")
+    )
+
+
+def _size(name):
+    try:
+        return photo_storage().size(name)
+    except OSError:
+        return 0
+
+
+def acquire(name, size=None):
+    """name（内容アドレスの元写真）の参照を1つ増やす"""
+    digest = digest_of(name)
+    if digest is None:
+        return
+    from .models import PhotoBlob
+
+    with blob_lock(digest):
+        # 行がなければ作り（同時に作られていれば何もしない）、それから増やす
+        PhotoBlob.objects.bulk_create(
+            [PhotoBlob(name=name, digest=digest, size=_size(name) if size is None else size, refcount=0)],
+            ignore_conflicts=True,
+        )
+        PhotoBlob.objects.filter(name=name).update(refcount=F("refcount") + 1)
+
+
+def release(name):
+    """name の参照を1つ減らし、0 になったらファイルの削除をジョブに回す"""
+    digest = digest_of(name)
+    if digest is None:
+        return
+    from .models import PhotoBlob
+
+    with blob_lock(digest):
+        rows = PhotoBlob.objects.filter(name=name)
+        rows.update(refcount=F("refcount") - 1)
+        deleted, _ = rows.filter(refcount__lte=0).delete()
+    if deleted:
+        _schedule_purge(digest)
+
+
+def recount(names):
+    """names の参照数を Record から数え直す（bulk_create / update で増減が取れない更新用）"""
+    from .models import PhotoBlob, Record
+
+    for name in set(names):
+        digest = digest_of(name)
+        if digest is None:
+            continue
+        with blob_lock(digest):
+            count = Record.objects.filter(photo=name).count()
+            if count:
+                PhotoBlob.objects.update_or_create(
+                    name=name,
+                    defaults={"refcount": count},
+                    create_defaults={"digest": digest, "size": _size(name), "refcount": count},
+                )
+                continue
+            deleted, _ = PhotoBlob.objects.filter(name=name).delete()
+        if deleted:
+            _schedule_purge(digest)
@@ -0,0 +1,66 @@
+# diary/testing.py
+"""テスト用ヘルパー"""
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from . import db_router
+from .instrumentation import QueryBudgetExceeded
+
+
+def assert_within_query_budget(response, budget=None):
+    """レスポンスのクエリ数が上限以内か確認する（上限の既定はビューの @query_budget）"""
+    count = getattr(response, "query_count", None)
+    if count is None:
+        raise AssertionError("QueryInstrumentationMiddleware が MIDDLEWARE にありません")
+    limit = budget if budget is not None else getattr(response, "query_budget", None)
+    if limit is None:
+        raise AssertionError("ビューにクエリ数の上限（@query_budget）が宣言されていません")
+    if count > limit:
+        raise QueryBudgetExceeded(f"{count} queries issued, budget is {limit}")
+
+
+def assert_within_latency_budget(response, budget_ms=None):
+    """レスポンスの処理時間が上限以内か確認する（上限の既定はビューの @latency_budget）"""
+    elapsed = getattr(response, "latency_ms", None)
+    if elapsed is None:
+        raise AssertionError("QueryInstrumentationMiddleware が MIDDLEWARE にありません")
+    limit = budget_ms if budget_ms is not None else getattr(response, "latency_budget", None)
+    if limit is None:
+        raise AssertionError("ビューに処理時間の上限（@latency_budget）が宣言されていません")
+    if elapsed > limit:
+        raise AssertionError(f"took {elapsed:.1f} ms, budget is {limit} ms")
+
+
+class QueryBudgetTestMixin:
+    """TestCase に混ぜて使う：self.assertWithinQueryBudget(self.client.get(url))"""
+
+    def assertWithinQueryBudget(self, response, budget=None):
+        assert_within_query_budget(response, budget)
+
+    def assertWithinLatencyBudget(self, response, budget_ms=None):
+        assert_within_latency_budget(response, budget_ms)
+
+
+def sync_replicas(aliases=None):
+    """SQLite のレプリカ（別ファイル）をプライマリの内容で丸ごと上書きする（テストでの複製の代わり）
+
+    レプリカを MIRROR にせず別ファイルにしたテストで、「まだ複製されていない」状態を作ってから呼ぶ。
+    """
+    source = connections[DEFAULT_DB_ALIAS]
+    if source.vendor != "sqlite":
+        raise AssertionError("sync_replicas は SQLite のみ対応しています")
+    source.ensure_connection()
+    for alias in aliases or db_router.REPLICAS:
+        target = connections[alias]
+        if target.in_atomic_block:
+            raise AssertionError(f"{alias} がトランザクション中です")
+        target.ensure_connection()
+        source.connection.backup(target.connection)
+
+
+class ReplicaTestMixin:
+    """TransactionTestCase に混ぜて使う：self.syncReplicas() でレプリカを追いつかせる"""
+
+    databases = "__all__"
+
+    def syncReplicas(self, aliases=None):
+        sync_replicas(aliases)
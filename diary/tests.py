@@ -1,3 +1,943 @@
-from django.test import TestCase
+import gzip
+import importlib
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import date, timedelta
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import identify_hasher
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.template import engines
+from django.template.loaders import cached as cached_loader
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, reverse
+from django.utils import timezone
+from django.utils.crypto import pbkdf2
+from myapp import urls as project_urls
+from PIL import Image
+
+from . import (
+    async_views, calendar_grid, db_router, file_serving, instrumentation, jobs, month_cache, mood_stats, photo_tasks, photo_upload,
+    recorded_days, sessions, static_files, thumbnails, throttle, transfer, uploads, year_heatmap,
+)
+from . import moods as mood_registry
+from . import search as note_search
+from . import storage as photo_store
+from . import urls as diary_urls
+from .forms import RecordForm
+from .hashers import TunablePBKDF2PasswordHasher
+from .management.commands.check_query_plans import COVER_INDEX
+from .models import Job, MonthlyMoodSummary, Mood, PhotoBlob, Record
+from .month_cache import month_window, window_queryset
+from .testing import QueryBudgetTestMixin, ReplicaTestMixin
+
+
+class RecordedDaysTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("alice", "alice@example.com", "pass1234x")
+        self.mood = Mood.objects.first()
+
+    def test_bitmap_follows_create_and_delete(self):
+        day = date(2025, 3, 1)
+        self.assertFalse(recorded_days.is_recorded(recorded_days.year_bitmap(self.user.pk, 2025), day))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            record = Record.objects.create(user=self.user, date=day, mood=self.mood)
+        self.assertTrue(recorded_days.is_recorded(recorded_days.year_bitmap(self.user.pk, 2025), day))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            record.delete()
+        self.assertFalse(recorded_days.is_recorded(recorded_days.year_bitmap(self.user.pk, 2025), day))
+
+    def test_save_drops_cached_bitmap_instead_of_rewriting_it(self):
+        # 保存時はビットを書き換えず（同時保存で書き換えが消えるため）、キャッシュごと捨てる
+        recorded_days.year_bitmap(self.user.pk, 2025)
+        with self.captureOnCommitCallbacks(execute=True):
+            Record.objects.create(user=self.user, date=date(2025, 3, 1), mood=self.mood)
+        self.assertIsNone(cache.get(recorded_days._key(self.user.pk, 2025)))
+
+
+class CommitInvalidationTests(TestCase):
+    """キャッシュはコミット後に捨てる（コミット前に別リクエストが作り直した内容を残さない）"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("mallory", "mallory@example.com", "pass1234x")
+
+    def test_caches_filled_before_commit_are_dropped_after_it(self):
+        day = date(2025, 10, 9)
+        month_key = month_cache._key(self.user.pk, 2025, 10, month_cache._generation())
+        heatmap_key = year_heatmap._key(self.user.pk, 2025, year_heatmap._generation())
+        with self.captureOnCommitCallbacks() as callbacks:
+            Record.objects.create(user=self.user, date=day, mood=Mood.objects.first())
+            # 書き込みからコミットまでの間に読まれてキャッシュされた
+            month_cache.get_month_state(self.user.pk, 2025, 10)
+            recorded_days.year_bitmap(self.user.pk, 2025)
+            year_heatmap.render_fragment(self.user.pk, 2025)
+        self.assertIsNotNone(cache.get(month_key))
+
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(cache.get(month_key))
+        self.assertIsNone(cache.get(recorded_days._key(self.user.pk, 2025)))
+        self.assertIsNone(cache.get(heatmap_key))
+
+
+class RecordTableIndexTests(TestCase):
+    """diary_record が作り直されても（SQLite の AlterField）索引と検索用トリガーが残っているか"""
+
+    def setUp(self):
+        self.user = User.objects.create_user("bob", "bob@example.com", "pass1234x")
+
+    def test_calendar_window_uses_cover_index(self):
+        _, first_display, last_display = month_window(2025, 10)
+        plan = window_queryset(self.user.pk, first_display, last_display).explain()
+        self.assertIn(COVER_INDEX, plan)
+
+    def test_cover_index_uses_include_where_supported(self):
+        index = next(i for i in Record._meta.indexes if i.name == COVER_INDEX)
+        # SQL を組み立てるだけなので、スキーマエディタには入らない（SQLite はトランザクション中に入れない）
+        editor = connection.schema_editor(collect_sql=True)
+        composite = str(index.create_sql(Record, editor))
+        with mock.patch.object(type(connection.features), "supports_covering_indexes", True), \
+                mock.patch.object(connection, "vendor", "postgresql"):
+            covering = str(index.create_sql(Record, editor))
+        if connection.vendor == "sqlite":
+            self.assertIn('("user_id", "date", "mood_id", "photo", "photo_renditions")', composite)
+        self.assertIn('("user_id", "date") INCLUDE ("mood_id", "photo", "photo_renditions")', covering)
+
+    def test_search_finds_records_saved_after_migrations(self):
+        Record.objects.create(user=self.user, date=date(2025, 10, 1), note="朝から美味しいパンを焼いた")
+        page = note_search.search(self.user.pk, "美味しいパン")
+        self.assertEqual(page.total, 1)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("carol", "carol@example.com", "pass1234x")
+        self.addCleanup(setattr, note_search, "_fts_available", None)
+
+    def test_falls_back_to_like_when_sync_triggers_are_missing(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("FTS5 は SQLite のみ")
+        with connection.cursor() as cursor:
+            for name in note_search.FTS_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        note_search._fts_available = None
+        Record.objects.create(user=self.user, date=date(2025, 10, 2), note="夕方に美味しいパンを買った")
+
+        with self.assertLogs("diary.search", "WARNING"):
+            self.assertFalse(note_search.fts_available())
+        self.assertEqual(note_search.search(self.user.pk, "美味しいパン").total, 1)
+
+
+class ReplicaRoutingTests(ReplicaTestMixin, TransactionTestCase):
+    """別ファイルの SQLite をレプリカにし、syncReplicas() の後の書き込みを「まだ複製されていない」状態にする"""
+
+    serialized_rollback = True
+    replica = "replica_lagging"
+
+    @classmethod
+    def setUpClass(cls):
+        if connection.vendor != "sqlite":
+            raise unittest.SkipTest("sync_replicas は SQLite のみ")
+        # databases = "__all__" に入るよう、TransactionTestCase の準備より先に登録する
+        cls.directory = tempfile.mkdtemp()
+        connections.settings[cls.replica] = connections.configure_settings({
+            DEFAULT_DB_ALIAS: {"ENGINE": "django.db.backends.sqlite3", "NAME": f"{cls.directory}/replica.sqlite3"},
+        })[DEFAULT_DB_ALIAS]
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[cls.replica].close()
+        del connections.settings[cls.replica]
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def setUp(self):
+        patcher = mock.patch.object(db_router, "REPLICAS", [self.replica])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+
+        self.user = User.objects.create_user("dave", "dave@example.com", "pass1234x")
+        self.client.force_login(self.user)
+        self.syncReplicas()
+        # ここからの書き込みはレプリカに届いていない
+        self.day = date(2025, 10, 5)
+        Record.objects.create(user=self.user, date=self.day, mood=Mood.objects.first(), note="複製待ち")
+
+    def test_unpinned_get_reads_the_lagging_replica(self):
+        with db_router.replica_reads():
+            self.assertFalse(Record.objects.filter(user=self.user, date=self.day).exists())
+        response = self.client.get(reverse("record"), {"date": self.day.isoformat()})
+        self.assertIsNone(response.context["form"].instance.pk)
+
+    def test_cache_fills_read_the_primary(self):
+        # 遅れたレプリカの内容をキャッシュに入れると、TTL の間その記録が出なくなる
+        response = self.client.get(reverse("month_summary_api", args=[2025, 10]))
+        self.assertIn(self.day.isoformat(), response.json()["records_by_date"])
+        with db_router.replica_reads():
+            bits = recorded_days.year_bitmap(self.user.pk, 2025)
+        self.assertTrue(recorded_days.is_recorded(bits, self.day))
+
+    def test_write_pins_the_user_to_the_primary(self):
+        response = self.client.post(reverse("record"), {
+            "date": "2025-10-06", "mood": Mood.objects.first().pk, "note": "保存直後",
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(db_router.PIN_COOKIE, response.cookies)
+
+        response = self.client.get(reverse("record"), {"date": "2025-10-06"})
+        self.assertEqual(response.context["form"].instance.note, "保存直後")
+
+
+@override_settings(DIARY_THROTTLE_ENABLED=True, DIARY_THROTTLE_RATES={"login:ip": (2, 60), "login:email": (1, 600)})
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def login(self, email):
+        return self.client.post(reverse("login"), {"email": email, "password": "wrong-pass-1"})
+
+    def test_rates_are_read_at_request_time(self):
+        self.assertEqual(self.login("a@example.com").status_code, 200)
+        response = self.login("a@example.com")
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+
+    def test_rejected_attempt_counts_against_no_rule(self):
+        self.login("a@example.com")
+        self.assertEqual(self.login("a@example.com").status_code, 429)  # login:email で断る
+        # 断った試行は login:ip にも数えていないので、IP の上限（2回）にはまだ届かない
+        self.assertEqual(self.login("b@example.com").status_code, 200)
+        self.assertEqual(self.login("c@example.com").status_code, 429)
+        self.assertEqual(throttle.stats()["login:ip"], 1)
+
+    @override_settings(DIARY_THROTTLE_ENABLED=False)
+    def test_can_be_disabled(self):
+        for _ in range(3):
+            self.assertEqual(self.login("a@example.com").status_code, 200)
+
+
+@mock.patch.object(photo_upload, "MAX_UPLOAD_BYTES", 1024)
+class UploadLimitTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("erin", "erin@example.com", "pass1234x")
+        self.client.force_login(self.user)
+
+    def test_oversize_photo_is_rejected(self):
+        response = self.client.post(reverse("record"), {
+            "date": "2025-10-07", "mood": Mood.objects.first().pk,
+            "photo": SimpleUploadedFile("big.jpg", b"x" * 4096, content_type="image/jpeg"),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["form"].errors["photo"], [photo_upload.too_large_message()])
+        self.assertFalse(Record.objects.filter(user=self.user).exists())
+
+    def test_other_uploads_are_not_limited(self):
+        color = Mood.objects.exclude(color=None).first().color
+        rows = "".join(f"2025-01-{day:02d},{color},{'メモ' * 20},\n" for day in range(1, 29))
+        csv_file = SimpleUploadedFile("records.csv", ("date,mood,note,photo\n" + rows).encode())
+        self.assertGreater(csv_file.size, photo_upload.MAX_UPLOAD_BYTES)
+        self.client.post(reverse("records_import"), {"records_file": csv_file})
+        self.assertEqual(Record.objects.filter(user=self.user).count(), 28)
+
+
+class ViewBudgetTests(QueryBudgetTestMixin, TestCase):
+    """ビューが @query_budget / @latency_budget の上限内で返るか（キャッシュが空のときと温まったとき）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("frank", "frank@example.com", "pass1234x")
+        moods = list(Mood.objects.all())
+        Record.objects.bulk_create([
+            Record(user=cls.user, date=date(2025, 10, day), mood=moods[day % len(moods)], note=f"{day}日のメモ")
+            for day in range(1, 29)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        # ログイン画面を通ったときと同じく、延長した時刻を載せておく（最初のリクエストで延長の保存をさせない）
+        session = self.client.session
+        session[sessions.REFRESHED_AT_KEY] = int(time.time())
+        session.save()
+
+    def test_calendar_view(self):
+        for _ in range(2):
+            response = self.client.get(reverse("calendar"), {"year": 2025, "month": 10})
+            self.assertEqual(response.status_code, 200)
+            self.assertWithinQueryBudget(response)
+
+    def test_month_summary_api(self):
+        for _ in range(2):
+            response = self.client.get(reverse("month_summary_api", args=[2025, 10]))
+            self.assertEqual(response.status_code, 200)
+            self.assertWithinQueryBudget(response)
+        response = self.client.get(reverse("month_summary_api", args=[2025, 10]), HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertWithinQueryBudget(response)
+
+    def test_record_view(self):
+        response = self.client.get(reverse("record"), {"date": "2025-10-03"})
+        self.assertEqual(response.context["form"].instance.note, "3日のメモ")
+        self.assertWithinQueryBudget(response)
+
+        response = self.client.post(reverse("record"), {
+            "date": "2025-10-30", "mood": Mood.objects.first().pk, "note": "新しい記録",
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertWithinQueryBudget(response)
+
+    def test_year_view(self):
+        response = self.client.get(reverse("year_view"), {"year": 2025})
+        self.assertWithinQueryBudget(response)
+        self.assertWithinLatencyBudget(response)
+
+    def test_streaming_response_is_counted_after_the_body(self):
+        instrumentation.reset()
+        response = self.client.get(reverse("records_export"), {"format": "csv"})
+        self.assertNotIn("records_export", instrumentation.snapshot())
+        before_body = response.query_count
+        body = b"".join(response.streaming_content)
+        self.assertIn("28日のメモ".encode(), body)
+        self.assertGreater(response.query_count, before_body)
+        self.assertEqual(instrumentation.snapshot()["records_export"]["requests"], 1)
+
+
+class RecordFormTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("grace", "grace@example.com", "pass1234x")
+        self.mood = mood_registry.all_moods()[1]
+
+    def test_mood_is_validated_without_queries(self):
+        form = RecordForm({"date": "2025-10-01", "mood": str(self.mood.pk)}, instance=Record(user=self.user))
+        with self.assertNumQueries(0):
+            self.assertTrue(form.is_valid())
+        self.assertEqual(form.instance.mood, self.mood)
+
+    def test_unknown_mood_is_rejected(self):
+        form = RecordForm({"date": "2025-10-01", "mood": "999999"})
+        self.assertFalse(form.is_valid())
+        self.assertIn("mood", form.errors)
+
+    def test_initial_mood_comes_from_instance(self):
+        record = Record.objects.create(user=self.user, date=date(2025, 10, 1), mood=self.mood)
+        self.assertEqual(RecordForm(instance=record)["mood"].value(), self.mood.pk)
+
+
+class RecordErrorRenderTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("heidi", "heidi@example.com", "pass1234x")
+        self.client.force_login(self.user)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        patcher = mock.patch.object(uploads, "staging_storage", FileSystemStorage(location=directory))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_preview_keeps_pointing_at_the_saved_photo(self):
+        # 加工ジョブ前（サイズ違いなし）の写真がある記録に、気分を選ばずに新しい写真を送る
+        record = Record.objects.create(user=self.user, date=date(2025, 10, 1), photo="photos/ab/cd/saved.jpg")
+        buf = BytesIO()
+        Image.new("RGB", (64, 48), "blue").save(buf, "JPEG")
+        response = self.client.post(reverse("record_with_date", args=["2025-10-01"]), {
+            "date": "2025-10-01", "mood": "",
+            "photo": SimpleUploadedFile("new.jpg", buf.getvalue(), content_type="image/jpeg"),
+        })
+        self.assertEqual(response.status_code, 200)
+        form = response.context["form"]
+        self.assertIn("mood", form.errors)
+        self.assertEqual(form.instance.photo.name, "photos/ab/cd/saved.jpg")
+        self.assertEqual(form.instance.photo_preview_url, record.photo.url)
+        self.assertTrue(response.context["staged_photo_url"])
+
+
+class ImportPhotoRefcountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("ivan", "ivan@example.com", "pass1234x")
+        self.mood = mood_registry.all_moods()[0]
+        self.old, self.new = (f"photos/{c * 2}/{c * 2}/{c * 64}.webp" for c in "ab")
+        Record.objects.create(user=self.user, date=date(2025, 1, 1), mood=self.mood, photo=self.old)
+        Record.objects.create(user=self.user, date=date(2025, 1, 2), mood=self.mood, photo=self.new)
+
+    def test_overwritten_photo_is_recounted(self):
+        rows = [(2, {"date": "2025-01-01", "mood": self.mood.color, "note": "", "photo": self.new})]
+        transfer.import_records(self.user, rows)
+        self.assertFalse(PhotoBlob.objects.filter(name=self.old).exists())
+        self.assertEqual(PhotoBlob.objects.get(name=self.new).refcount, 2)
+
+
+class MonthCacheStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("judy", "judy@example.com", "pass1234x")
+
+    def test_not_counted_by_default(self):
+        month_cache.get_month_state(self.user.pk, 2025, 10)
+        month_cache.get_month_state(self.user.pk, 2025, 10)
+        stats = month_cache.cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["enabled"]), (0, 0, False))
+
+    @override_settings(DIARY_MONTH_CACHE_STATS=True)
+    def test_counted_when_enabled(self):
+        month_cache.get_month_state(self.user.pk, 2025, 10)
+        month_cache.get_month_state(self.user.pk, 2025, 10)
+        stats = month_cache.cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["hit_ratio"]), (1, 1, 0.5))
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_patch = override_settings(MEDIA_ROOT=directory)
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+        patcher = mock.patch.object(jobs, "EAGER", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.storage = photo_store.photo_storage()
+        self.user = User.objects.create_user("kate", "kate@example.com", "pass1234x")
+        buf = BytesIO()
+        Image.new("RGB", (32, 24), "green").save(buf, "JPEG")
+        self.content = buf.getvalue()
+
+    def add_record(self, day):
+        return Record.objects.create(
+            user=self.user, date=date(2025, 11, day), photo=ContentFile(self.content, name="green.jpg"),
+        )
+
+    def test_same_photo_is_stored_once(self):
+        first, second = self.add_record(1), self.add_record(2)
+        self.assertEqual(first.photo.name, second.photo.name)
+        self.assertTrue(photo_store.is_blob_name(first.photo.name))
+        self.assertEqual(PhotoBlob.objects.get(name=first.photo.name).refcount, 2)
+
+    def test_reupload_to_the_same_record_is_counted_once(self):
+        record = self.add_record(1)
+        record.photo = ContentFile(self.content, name="again.jpg")
+        record.save()
+        self.assertEqual(PhotoBlob.objects.get(name=record.photo.name).refcount, 1)
+
+    def test_file_is_purged_after_the_last_release(self):
+        first, second = self.add_record(1), self.add_record(2)
+        name = first.photo.name
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(PhotoBlob.objects.get(name=name).refcount, 1)
+        self.assertTrue(self.storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(PhotoBlob.objects.filter(name=name).exists())
+        self.assertFalse(self.storage.exists(name))
+
+    def test_upload_during_pending_purge_keeps_the_file(self):
+        record = self.add_record(1)
+        name = record.photo.name
+        with self.captureOnCommitCallbacks() as purges:
+            record.delete()
+        # 参照 0 で消す予定のファイルと同じ内容が、消す前にもう一度アップロードされた
+        saved = self.storage.save("photos/again.jpg", ContentFile(self.content))
+        self.assertEqual(saved, name)
+        self.assertEqual(PhotoBlob.objects.get(name=name).refcount, 1)
+
+        for callback in purges:
+            callback()
+        self.assertTrue(self.storage.exists(name))
+
+
+class EagerJobBudgetTests(QueryBudgetTestMixin, TransactionTestCase):
+    """DIARY_JOBS_EAGER でコミット後にその場で動くジョブのクエリは、ビューのクエリ数に入れない"""
+
+    serialized_rollback = True
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_patch = override_settings(MEDIA_ROOT=directory)
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+        patcher = mock.patch.object(jobs, "EAGER", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+
+        self.user = User.objects.create_user("leo", "leo@example.com", "pass1234x")
+        self.client.force_login(self.user)
+        session = self.client.session
+        session[sessions.REFRESHED_AT_KEY] = int(time.time())
+        session.save()
+
+    def post_photo(self, color):
+        buf = BytesIO()
+        Image.new("RGB", (640, 480), color).save(buf, "JPEG")
+        return self.client.post(reverse("record_with_date", args=["2025-10-08"]), {
+            "date": "2025-10-08", "mood": Mood.objects.first().pk, "note": "写真つき",
+            "photo": SimpleUploadedFile(f"{color}.jpg", buf.getvalue(), content_type="image/jpeg"),
+        })
+
+    def test_photo_posts_stay_within_budget(self):
+        for color in ("orange", "purple"):  # 新しい記録 → 写真の差し替え
+            response = self.post_photo(color)
+            self.assertEqual(response.status_code, 302)
+            self.assertWithinQueryBudget(response)
+            # ジョブ（正規化・サイズ違いの生成）はこのリクエストの中で終わっている
+            record = Record.objects.get(user=self.user)
+            self.assertEqual(record.photo_renditions["source"], record.photo.name)
+
+
+def _reload_urls():
+    # DIARY_ASYNC_VIEWS は diary.urls の読み込み時に見るので、設定を変えたら読み直す
+    importlib.reload(diary_urls)
+    importlib.reload(project_urls)
+    clear_url_caches()
+
+
+class AsyncViewTests(TestCase):
+    """DJANGO_ASYNC_VIEWS=true（ASGI）のときのカレンダー・記録画面"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.addClassCleanup(_reload_urls)  # 設定を戻した後に読み直す
+        cls.enterClassContext(override_settings(DIARY_ASYNC_VIEWS=True))
+        _reload_urls()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("nina", "nina@example.com", "pass1234x")
+        cls.mood = Mood.objects.exclude(color=None).first()
+        Record.objects.create(user=cls.user, date=date(2025, 10, 10), mood=cls.mood, note="非同期")
+
+    def setUp(self):
+        cache.clear()
+        self.async_client.force_login(self.user)
+
+    async def test_calendar_view(self):
+        response = await self.async_client.get(reverse("calendar"), {"year": 2025, "month": 10})
+        self.assertEqual(response.status_code, 200)
+        self.assertIs(response.resolver_match.func, async_views.calendar_view)
+        self.assertEqual(response.context["records_by_date"]["2025-10-10"]["color"], self.mood.color)
+
+    async def test_record_view_get(self):
+        response = await self.async_client.get(reverse("record"), {"date": "2025-10-10"})
+        self.assertIs(response.resolver_match.func, async_views.record_view)
+        self.assertEqual(response.context["form"].instance.note, "非同期")
+
+    async def test_record_view_post(self):
+        response = await self.async_client.post(reverse("record"), {
+            "date": "2025-10-11", "mood": self.mood.pk, "note": "保存",
+        })
+        self.assertEqual(response.status_code, 302)
+        record = await Record.objects.aget(user=self.user, date=date(2025, 10, 11))
+        self.assertEqual((record.mood_id, record.note), (self.mood.pk, "保存"))
+
+    async def test_record_view_post_without_mood(self):
+        response = await self.async_client.post(reverse("record"), {"date": "2025-10-11", "note": "気分なし"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["form"].errors["mood"], ["気分を選択してください"])
+        self.assertFalse(await Record.objects.filter(user=self.user, date=date(2025, 10, 11)).aexists())
+
+
+def failing_job(**payload):
+    raise RuntimeError("boom")
+
+
+@mock.patch.object(jobs, "EAGER", False)
+@mock.patch.dict(jobs.HANDLERS, {"test.fail": "diary.tests.failing_job"})
+class JobQueueTests(TestCase):
+    def test_enqueue_skips_an_active_job_with_the_same_key(self):
+        jobs.enqueue("photo.purge", {"digest": "a" * 64}, key="photo.purge:a")
+        jobs.enqueue("photo.purge", {"digest": "a" * 64}, key="photo.purge:a")
+        jobs.enqueue("photo.purge", {"digest": "b" * 64}, key="photo.purge:b")
+        self.assertEqual(Job.objects.count(), 2)
+
+    def test_a_claimed_job_is_not_claimed_again(self):
+        jobs.enqueue("photo.purge", {"digest": "a" * 64})
+        first = jobs.claim()
+        self.assertEqual([job.status for job in first], [Job.RUNNING])
+        self.assertEqual(jobs.claim(), [])
+        # ワーカーが落ちてロックが切れたものは取り直す
+        later = timezone.now() + timedelta(seconds=jobs.LOCK_TIMEOUT + 1)
+        self.assertEqual([job.pk for job in jobs.claim(now=later)], [first[0].pk])
+
+    def test_failed_job_is_retried_with_backoff_then_given_up(self):
+        jobs.enqueue("test.fail", {}, key="fail")
+        Job.objects.update(max_attempts=3)
+        delays = []
+        for _ in range(3):
+            job = Job.objects.get()
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            started = timezone.now()
+            with self.assertLogs("diary.jobs", "ERROR"):
+                self.assertEqual(jobs.run_pending(), (0, 1))
+            job.refresh_from_db()
+            delays.append(round((job.run_after - started).total_seconds() / jobs.RETRY_DELAY))
+        self.assertEqual(delays[:2], [1, 2])
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 3))
+        self.assertIn("boom", job.last_error)
+        self.assertEqual(jobs.claim(), [])
+
+        self.assertEqual(jobs.retry_failed(), 1)
+        self.assertEqual(Job.objects.get().status, Job.PENDING)
+
+
+@mock.patch.object(jobs, "EAGER", False)
+class PhotoTaskTests(TestCase):
+    """ジョブは再試行・重複実行されても同じ結果になる"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_patch = override_settings(MEDIA_ROOT=directory)
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+        self.storage = photo_store.photo_storage()
+        self.user = User.objects.create_user("oscar", "oscar@example.com", "pass1234x")
+
+    def test_process_photo_twice(self):
+        buf = BytesIO()
+        Image.new("RGB", (800, 600), "teal").save(buf, "JPEG")
+        record = Record.objects.create(
+            user=self.user, date=date(2025, 10, 12), photo=ContentFile(buf.getvalue(), name="teal.jpg"),
+        )
+        job = Job.objects.get(kind="photo.process")
+
+        photo_tasks.process_photo(**job.payload)
+        record.refresh_from_db()
+        first = (record.photo.name, record.photo_renditions)
+        photo_tasks.process_photo(**job.payload)
+        record.refresh_from_db()
+
+        self.assertEqual((record.photo.name, record.photo_renditions), first)
+        self.assertEqual(record.photo_renditions["source"], record.photo.name)
+        for rendition in ("cell", "preview", "full"):
+            self.assertTrue(self.storage.exists(record.photo_renditions[rendition]))
+        self.assertEqual(PhotoBlob.objects.get(name=record.photo.name).refcount, 1)
+
+    def test_delete_files_twice(self):
+        unused = self.storage.save_derived("photos/legacy.jpg", ContentFile(b"old"))
+        used = self.storage.save_derived("photos/kept.jpg", ContentFile(b"kept"))
+        Record.objects.create(user=self.user, date=date(2025, 10, 13), photo=used)
+
+        for _ in range(2):
+            photo_tasks.delete_files([unused, used])
+        self.assertFalse(self.storage.exists(unused))
+        self.assertTrue(self.storage.exists(used))
+
+
+@mock.patch.object(jobs, "EAGER", False)
+class RenditionTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_patch = override_settings(MEDIA_ROOT=directory)
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+        cache.clear()
+        self.storage = photo_store.photo_storage()
+        buf = BytesIO()
+        Image.new("RGB", (1200, 900), "navy").save(buf, "JPEG")
+        self.name = self.storage.save("photos/wide.jpg", ContentFile(buf.getvalue()))
+
+    def test_renditions_fit_their_boxes_and_are_stable(self):
+        renditions = thumbnails.generate_renditions(self.storage, self.name)
+        self.assertEqual(renditions["source"], self.name)
+        for kind, (width, height) in thumbnails.RENDITIONS.items():
+            with self.storage.open(renditions[kind], "rb") as f:
+                size = Image.open(f).size
+            self.assertLessEqual(size[0], width)
+            self.assertLessEqual(size[1], height)
+            self.assertEqual(thumbnails.source_stem(renditions[kind]), self.name.rsplit(".", 1)[0])
+        self.assertEqual(thumbnails.generate_renditions(self.storage, self.name), renditions)
+
+    def test_calendar_cell_uses_the_small_rendition(self):
+        user = User.objects.create_user("rita", "rita@example.com", "pass1234x")
+        renditions = thumbnails.generate_renditions(self.storage, self.name)
+        Record.objects.create(user=user, date=date(2025, 10, 14), photo=self.name, photo_renditions=renditions)
+        summary = month_cache.get_month_summary(user.pk, 2025, 10)
+        self.assertEqual(summary["2025-10-14"]["photo"], renditions["cell"])
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "SQLite の接続設定")
+class SQLiteTuningTests(TestCase):
+    def pragma(self, conn, name):
+        with conn.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_connection_pragmas(self):
+        self.assertEqual(self.pragma(connection, "synchronous"), 1)  # NORMAL
+        self.assertEqual(self.pragma(connection, "cache_size"), -16000)
+        self.assertEqual(self.pragma(connection, "temp_store"), 2)  # MEMORY
+        self.assertEqual(connection.transaction_mode, "IMMEDIATE")
+
+    def test_file_database_uses_wal(self):
+        # テスト DB はメモリ上なので、同じ設定でファイルの DB を開いて確かめる
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_dict = {**connection.settings_dict, "NAME": f"{directory}/wal.sqlite3"}
+        conn = type(connections[DEFAULT_DB_ALIAS])(settings_dict, alias="wal_check")
+        self.addCleanup(conn.close)
+        self.assertEqual(self.pragma(conn, "journal_mode"), "wal")
+
+
+class StaticFilesTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_patch = override_settings(STATIC_ROOT=directory)
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+        call_command("collectstatic", interactive=False, verbosity=0)
+        self.url = staticfiles_storage.url("diary/css/base.css")
+        with open(finders.find("diary/css/base.css"), "rb") as f:
+            self.source = f.read()
+
+    def test_collectstatic_writes_hashed_and_compressed_files(self):
+        self.assertRegex(self.url, r"^/static/diary/css/base\.[0-9a-f]{12}\.css$")
+        name = self.url[len("/static/"):]
+        with open(staticfiles_storage.path(name + ".gz"), "rb") as f:
+            self.assertEqual(gzip.decompress(f.read()), self.source)
+
+    def test_middleware_serves_precompressed_immutable_file(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, br;q=0")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Cache-Control"], static_files.IMMUTABLE_PUBLIC)
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), self.source)
+
+        plain = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip;q=0")
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertEqual(b"".join(plain.streaming_content), self.source)
+
+
+class CalendarGridTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_fragment_is_rendered_once_per_month_and_day(self):
+        today = date(2025, 10, 15)
+        with mock.patch.object(calendar_grid, "_render", wraps=calendar_grid._render) as render:
+            html = calendar_grid.render_fragment(2025, 10, today)
+            self.assertEqual(calendar_grid.render_fragment(2025, 10, today), html)
+            self.assertEqual(render.call_count, 1)
+            # 今日の印が動くので日付が変われば描き直す
+            calendar_grid.render_fragment(2025, 10, today + timedelta(days=1))
+            self.assertEqual(render.call_count, 2)
+        self.assertIn('data-date="2025-09-29"', html)  # 月曜始まりの前月分
+        self.assertRegex(html, r'is-today"\s+data-date="2025-10-15"')
+
+    def test_templates_use_the_cached_loader(self):
+        loader = engines["django"].engine.template_loaders[0]
+        self.assertIsInstance(loader, cached_loader.Loader)
+
+
+class FileServingTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.path = f"{self.directory}/doc.pdf"
+        with open(self.path, "wb") as f:
+            f.write(b"0123456789")
+        self.factory = RequestFactory()
+
+    def serve(self, **headers):
+        return file_serving.serve_file(self.factory.get("/doc.pdf", headers=headers), self.path)
+
+    def test_full_response(self):
+        response = self.serve()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"0123456789")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["Content-Type"], "application/pdf")
+
+    def test_range(self):
+        response = self.serve(Range="bytes=2-5")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), b"2345")
+        self.assertEqual((response["Content-Range"], response["Content-Length"]), ("bytes 2-5/10", "4"))
+
+        response = self.serve(Range="bytes=-3")
+        self.assertEqual(b"".join(response.streaming_content), b"789")
+        self.assertEqual(response["Content-Range"], "bytes 7-9/10")
+
+    def test_unsatisfiable_range(self):
+        response = self.serve(Range="bytes=10-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */10")
+
+    def test_if_range(self):
+        etag = self.serve()["ETag"]
+        self.assertEqual(self.serve(Range="bytes=0-1", If_Range=etag).status_code, 206)
+        # 検証子が変わっていれば（ファイルが更新された）全体を返す
+        self.assertEqual(self.serve(Range="bytes=0-1", If_Range='"stale"').status_code, 200)
+
+    def test_not_modified(self):
+        first = self.serve()
+        self.assertEqual(self.serve(If_None_Match=first["ETag"]).status_code, 304)
+        self.assertEqual(self.serve(If_Modified_Since=first["Last-Modified"]).status_code, 304)
+        self.assertEqual(self.serve(If_None_Match='"other"').status_code, 200)
+
+    def test_offload_headers(self):
+        with mock.patch.object(file_serving, "SENDFILE", "xsendfile"):
+            response = self.serve(Range="bytes=2-5")
+        self.assertEqual((response.status_code, response["X-Sendfile"]), (200, self.path))
+        self.assertEqual(response.content, b"")
+
+        locations = {self.directory: "/_protected/media/"}
+        with mock.patch.object(file_serving, "SENDFILE", "xaccel"), \
+                mock.patch.object(file_serving, "SENDFILE_LOCATIONS", locations):
+            response = self.serve()
+        self.assertEqual(response["X-Accel-Redirect"], "/_protected/media/doc.pdf")
+        self.assertIn("ETag", response)
+
+    def test_portfolio_paths_are_resolved_at_startup(self):
+        with mock.patch.object(finders, "find") as find:
+            response = self.client.get(reverse("pdf_er"))
+        self.assertEqual(response.status_code, 200)
+        find.assert_not_called()
+
+
+@override_settings(DIARY_PBKDF2_ITERATIONS=1000)
+class LoginTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("peggy", "Peggy@example.com", "pass1234x")
+        patcher = mock.patch("django.contrib.auth.hashers.pbkdf2", wraps=pbkdf2)
+        self.pbkdf2 = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_tunable_hasher_handles_stored_hashes(self):
+        hasher = identify_hasher(self.user.password)
+        self.assertIsInstance(hasher, TunablePBKDF2PasswordHasher)
+        self.assertFalse(hasher.must_update(self.user.password))
+
+    def test_one_query_and_one_hash_per_login(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(authenticate(email="peggy@EXAMPLE.com", password="pass1234x"), self.user)
+        self.assertEqual(self.pbkdf2.call_count, 1)
+
+    def test_unknown_email_still_hashes_once(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(authenticate(email="nobody@example.com", password="pass1234x"))
+        self.assertEqual(self.pbkdf2.call_count, 1)
+
+    @override_settings(DIARY_PBKDF2_ITERATIONS=2000)
+    def test_changed_iterations_rehash_on_login(self):
+        self.assertTrue(authenticate(email="peggy@example.com", password="pass1234x"))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password.split("$")[1], "2000")
+
+
+class MoodSummaryTests(TestCase):
+    """Record の保存/削除で MonthlyMoodSummary のビットだけを付け替える"""
+
+    def setUp(self):
+        self.user = User.objects.create_user("quinn", "quinn@example.com", "pass1234x")
+        self.red, self.blue = (Mood.objects.get(color=c) for c in ("red", "blue"))
+
+    def masks(self):
+        rows = MonthlyMoodSummary.objects.filter(user=self.user).values_list("year", "month", "mood_id", "day_mask")
+        return {(y, m, mood): mask for y, m, mood, mask in rows if mask}
+
+    def assertMatchesRebuild(self):
+        incremental = self.masks()
+        mood_stats.rebuild_user(self.user.pk)
+        self.assertEqual(incremental, self.masks())
+
+    def test_create_update_delete(self):
+        record = Record.objects.create(user=self.user, date=date(2025, 3, 5), mood=self.red)
+        Record.objects.create(user=self.user, date=date(2025, 3, 1), mood=self.red)
+        self.assertEqual(self.masks(), {(2025, 3, self.red.pk): 0b10001})
+
+        record = Record.objects.get(pk=record.pk)
+        record.mood = self.blue
+        record.save()
+        self.assertEqual(self.masks(), {(2025, 3, self.red.pk): 0b1, (2025, 3, self.blue.pk): 0b10000})
+
+        record.delete()
+        self.assertEqual(self.masks(), {(2025, 3, self.red.pk): 0b1})
+        self.assertMatchesRebuild()
+
+    def test_moving_across_a_month_boundary(self):
+        record = Record.objects.create(user=self.user, date=date(2025, 1, 31), mood=self.red)
+        self.assertEqual(self.masks(), {(2025, 1, self.red.pk): 1 << 30})
+
+        record = Record.objects.get(pk=record.pk)
+        record.date = date(2025, 2, 1)
+        record.mood = None
+        record.save()
+        self.assertEqual(self.masks(), {(2025, 2, None): 0b1})
+        self.assertMatchesRebuild()
+
+    def test_streaks(self):
+        for day in (date(2025, 1, 30), date(2025, 1, 31), date(2025, 2, 1), date(2025, 2, 3)):
+            Record.objects.create(user=self.user, date=day, mood=self.red)
+        streaks = mood_stats.user_stats(self.user.pk, today=date(2025, 2, 4))["streaks"]
+        self.assertEqual(streaks, {"longest": 3, "longest_end": "2025-02-01", "current": 1})
+
+        # 丸ごと記録した月（2月）をまたぐ連続記録
+        Record.objects.bulk_create([
+            Record(user=self.user, date=date(2025, 2, day), mood=self.blue) for day in (2, *range(4, 29))
+        ] + [Record(user=self.user, date=date(2025, 3, 1), mood=self.blue)])
+        mood_stats.rebuild_user(self.user.pk)
+        streaks = mood_stats.user_stats(self.user.pk, today=date(2025, 3, 10))["streaks"]
+        self.assertEqual(streaks, {"longest": 31, "longest_end": "2025-03-01", "current": 0})
+
+
+class SlidingSessionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("rupert", "rupert@example.com", "pass1234x")
+        self.client.force_login(self.user)
+        self.start = int(time.time())
+        session = self.client.session
+        session[sessions.REFRESHED_AT_KEY] = self.start
+        session.save()
+
+    def get_at(self, offset):
+        with mock.patch("diary.sessions.time") as clock, CaptureQueriesContext(connection) as queries:
+            clock.time.return_value = self.start + offset
+            self.client.get(reverse("calendar"))
+        return [q["sql"] for q in queries if q["sql"].startswith("UPDATE") and "django_session" in q["sql"]]
+
+    def test_refreshed_at_most_once_per_interval(self):
+        self.assertEqual(self.get_at(10), [])
+        expire_before = Session.objects.get().expire_date
+
+        self.assertEqual(len(self.get_at(sessions.REFRESH_INTERVAL)), 1)
+        self.assertGreater(Session.objects.get().expire_date, expire_before)
+        self.assertEqual(self.client.session[sessions.REFRESHED_AT_KEY], self.start + sessions.REFRESH_INTERVAL)
+
+        self.assertEqual(self.get_at(sessions.REFRESH_INTERVAL + 10), [])
+
+
+class PurgeSessionsTests(TestCase):
+    def test_batched_purge_deletes_only_expired_sessions(self):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            [Session(session_key=f"old{i}", session_data="", expire_date=now - timedelta(days=i + 1)) for i in range(5)]
+            + [Session(session_key=f"new{i}", session_data="", expire_date=now + timedelta(days=1)) for i in range(3)]
+        )
+        deleted = sessions.purge_expired(batch_size=2, engine="django.contrib.sessions.backends.db")
+        self.assertEqual(deleted, 5)
+        self.assertEqual(sorted(Session.objects.values_list("session_key", flat=True)), ["new0", "new1", "new2"])
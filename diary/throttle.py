@@ -0,0 +1,217 @@
+# diary/throttle.py
+"""ログイン・登録・パスワード変更の試行回数の制限（パスワードのハッシュ計算で CPU を使い切らせない）
+
+@throttle("login", "ip", "email") のように付けると、POST ごとに scope:キー（IP・メールアドレス・ユーザー）の
+カウンタを Django のキャッシュで atomic に増やし、上限を超えたらビュー本体（認証・DB 検索）に入る前に 429 を返す。
+
+数え方は直近 period 秒のスライディングウィンドウ（今の窓の件数＋前の窓の件数×残り割合）。
+キャッシュの add / incr だけで済み、複数プロセスでも数えもれない。
+断った試行は数に含めない（攻撃が続いても、断られている側の回復が遅れないように）。
+
+上限は RATES（DIARY_THROTTLE_RATES で上書き）に {"scope:キー": (回数, 秒)} で書く。
+設定は呼ばれるたびに読む（override_settings やテストで切り替えられる）。
+1回の試行で複数のキーを数えるときは、全部の上限を確かめてから数える（断った試行で一部だけ増やさない）。
+断った件数は scope:キーごとに数えてあり、manage.py throttle_stats で見られる。
+"""
+import hashlib
+import ipaddress
+import logging
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.shortcuts import render
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "diary:throttle"
+STATS_PREFIX = f"{KEY_PREFIX}:stats"
+
+RATES = {
+    "login:ip": (30, 60),
+    "login:email": (10, 600),
+    "signup:ip": (10, 3600),
+    "password:user": (10, 600),
+    "password:ip": (30, 60),
+}
+
+MESSAGE = "試行回数が多すぎます。しばらくしてからもう一度お試しください"
+
+
+def rates():
+    """{scope:キー: (回数, 秒)}（RATES を DIARY_THROTTLE_RATES で上書きしたもの）"""
+    return {**RATES, **getattr(settings, "DIARY_THROTTLE_RATES", {})}
+
+
+def enabled():
+    return getattr(settings, "DIARY_THROTTLE_ENABLED", True)
+
+
+def trusted_proxy_count():
+    # 前段のプロキシの数（X-Forwarded-For の右から何番目をクライアントとみなすか）。0 なら REMOTE_ADDR
+    return getattr(settings, "DIARY_TRUSTED_PROXY_COUNT", 0)
+
+
+def client_ip(request):
+    """クライアントの IP（IPv6 は /64 単位。同じ回線の別アドレスで回数を分けさせない）"""
+    address = request.META.get("REMOTE_ADDR", "")
+    proxies = trusted_proxy_count()
+    if proxies:
+        forwarded = [a.strip() for a in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",") if a.strip()]
+        if len(forwarded) >= proxies:
+            address = forwarded[-proxies]
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return address or "unknown"
+    if ip.version == 6:
+        return str(ipaddress.ip_network(f"{ip}/64", strict=False).network_address)
+    return str(ip)
+
+
+def _ident(request, key):
+    if key == "ip":
+        return client_ip(request)
+    if key == "email":
+        # ログイン・登録と同じ正規化（前後の空白を除いて小文字）
+        return (request.POST.get("email") or "").strip().lower() or None
+    if key == "user":
+        return str(request.user.pk) if request.user.is_authenticated else None
+    raise ValueError(f"unknown throttle key: {key}")
+
+
+def _cache_key(rule, ident, window):
+    # メールアドレス等をそのままキーにしない（長さ・文字種・キャッシュの中身から読めないように）
+    digest = hashlib.sha256(ident.encode()).hexdigest()[:32]
+    return f"{KEY_PREFIX}:{rule}:{digest}:{window}"
+
+
+def _window(period, now):
+    window, offset = divmod(now, period)
+    return int(window), offset
+
+
+def _retry_after(previous, current, offset, limit, period):
+    # current はこの試行を含めた件数
+    estimate = previous * (1 - offset / period) + current
+    if estimate <= limit:
+        return 0
+    if previous and current <= limit:
+        # 前の窓の重みが減れば通る
+        retry_after = (estimate - limit) / previous * period
+    else:
+        retry_after = period - offset
+    return max(1, math.ceil(retry_after))
+
+
+def peek(rule, ident, now=None):
+    """数えずに、もう1回数えたら上限内か確かめる（上限内なら 0、超えるなら再試行までの秒数）"""
+    limit, period = rates()[rule]
+    now = time.time() if now is None else now
+    window, offset = _window(period, now)
+    key, previous_key = _cache_key(rule, ident, window), _cache_key(rule, ident, window - 1)
+    counts = cache.get_many([key, previous_key])
+    return _retry_after(counts.get(previous_key, 0), counts.get(key, 0) + 1, offset, limit, period)
+
+
+def hit(rule, ident, now=None):
+    """1回数えて、上限内なら 0、超えたら（数えたぶんを戻して）再試行までの秒数を返す"""
+    limit, period = rates()[rule]
+    now = time.time() if now is None else now
+    window, offset = _window(period, now)
+    key = _cache_key(rule, ident, window)
+    # 前の窓も重みつきで数えるので 2 窓ぶん残す
+    if cache.add(key, 1, timeout=period * 2):
+        current = 1
+    else:
+        try:
+            current = cache.incr(key)
+        except ValueError:
+            # 期限切れと競合した
+            cache.set(key, 1, timeout=period * 2)
+            current = 1
+    previous = cache.get(_cache_key(rule, ident, window - 1), 0)
+    retry_after = _retry_after(previous, current, offset, limit, period)
+    if retry_after:
+        _undo(rule, ident, now)
+    return retry_after
+
+
+def _undo(rule, ident, now):
+    _, period = rates()[rule]
+    try:
+        cache.decr(_cache_key(rule, ident, _window(period, now)[0]))
+    except ValueError:
+        pass
+
+
+def _count_rejected(rule):
+    key = f"{STATS_PREFIX}:{rule}"
+    if cache.add(key, 1, timeout=None):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def _reject(request, rule, retry_after):
+    _count_rejected(rule)
+    logger.warning("throttled %s (%s)", rule, client_ip(request))
+    return retry_after
+
+
+def check(request, scope, keys):
+    """scope の各キーで1回数える。どれかが上限を超えたら再試行までの秒数（超えなければ 0）
+
+    先に全部のキーの上限を確かめ、断るときはどのキーも数えない。
+    確かめてから数えるまでの間に他のリクエストが数えて上限を超えたら、数えたぶんを戻して断る。
+    """
+    now = time.time()
+    counted = []
+    for key in keys:
+        ident = _ident(request, key)
+        if ident is not None:
+            counted.append((f"{scope}:{key}", ident))
+    for rule, ident in counted:
+        retry_after = peek(rule, ident, now)
+        if retry_after:
+            return _reject(request, rule, retry_after)
+    for i, (rule, ident) in enumerate(counted):
+        retry_after = hit(rule, ident, now)
+        if retry_after:
+            for done_rule, done_ident in counted[:i]:
+                _undo(done_rule, done_ident, now)
+            return _reject(request, rule, retry_after)
+    return 0
+
+
+def throttle(scope, *keys, template=None, methods=("POST",)):
+    """ビューの試行回数を制限する。超えたら template を 429 で返す（ビュー本体は呼ばない）"""
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if enabled() and request.method in methods:
+                retry_after = check(request, scope, keys)
+                if retry_after:
+                    messages.error(request, MESSAGE)
+                    response = render(request, template, status=429)
+                    response["Retry-After"] = str(retry_after)
+                    return response
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def stats():
+    """{scope:キー: 断った件数}"""
+    keys = {rule: f"{STATS_PREFIX}:{rule}" for rule in rates()}
+    values = cache.get_many(list(keys.values()))
+    return {rule: values.get(key, 0) for rule, key in keys.items()}
+
+
+def reset_stats():
+    cache.delete_many([f"{STATS_PREFIX}:{rule}" for rule in rates()])
@@ -0,0 +1,170 @@
+# diary/thumbnails.py
+"""Record.photo のサイズ違い（レンディション）生成
+
+元写真と同じディレクトリに「元名.<内容ハッシュ>.<種類>.jpg」で保存する。
+内容ハッシュ付きの名前なので、同じ写真なら再生成しても同じファイルになる。
+"""
+import hashlib
+import logging
+import posixpath
+import re
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .storage import digest_of
+
+logger = logging.getLogger(__name__)
+
+# 種類 → 最大サイズ（幅, 高さ）。縦横比は保つ
+RENDITIONS = getattr(settings, "DIARY_PHOTO_RENDITIONS", {
+    "cell": (160, 160),       # カレンダーのマス
+    "preview": (960, 640),    # 記録画面のプレビュー
+    "full": (2048, 2048),     # 拡大表示用
+})
+JPEG_QUALITY = getattr(settings, "DIARY_PHOTO_RENDITION_QUALITY", 82)
+HASH_LENGTH = 12
+ORIENTATION_TAG = 0x0112
+# 向きを直すときの再圧縮の品質（元写真なので高め）
+NORMALIZED_QUALITY = getattr(settings, "DIARY_PHOTO_NORMALIZED_QUALITY", 92)
+CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(storage, name):
+    digest = hashlib.sha256()
+    with storage.open(name, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def rendition_name(name, digest, rendition):
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, f"{stem}.{digest}.{rendition}.jpg")
+
+
+RENDITION_RE = re.compile(rf"^(.+)\.[0-9a-f]{{{HASH_LENGTH}}}\.(?:{'|'.join(map(re.escape, RENDITIONS))})\.jpg$")
+
+
+def source_stem(name):
+    """サイズ違いの名前なら元写真の拡張子を除いた名前、違えば None"""
+    m = RENDITION_RE.match(name or "")
+    return m.group(1) if m else None
+
+
+def _encode(image, size):
+    copy = image.copy()
+    copy.thumbnail(size, Image.Resampling.LANCZOS)
+    buf = BytesIO()
+    copy.save(buf, format="JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buf.getvalue()
+
+
+def normalize_photo(storage, name, upload_name):
+    """向き（EXIF Orientation）を画素に反映し、EXIF（撮影位置など）を落として upload_name で保存し直す
+
+    EXIF がなければ name をそのまま返す。保存し直したら新しい名前（内容アドレスなら別のハッシュ）を返す。
+    """
+    try:
+        with storage.open(name, "rb") as f:
+            image = Image.open(f)
+            exif = image.getexif()
+            if not exif:
+                return name
+            fmt = image.format
+            params = {"exif": b""}
+            if image.info.get("icc_profile"):
+                params["icc_profile"] = image.info["icc_profile"]
+            if exif.get(ORIENTATION_TAG, 1) == 1 and fmt == "JPEG":
+                # 向きはそのままなので画素は再圧縮しない
+                params["quality"] = "keep"
+                target = image
+            else:
+                target = ImageOps.exif_transpose(image)
+                if fmt == "JPEG":
+                    params["quality"] = NORMALIZED_QUALITY
+            buf = BytesIO()
+            target.save(buf, format=fmt, **params)
+    except (OSError, UnidentifiedImageError, ValueError):
+        logger.exception("failed to normalize %s", name)
+        return name
+    return storage.save(upload_name, ContentFile(buf.getvalue()))
+
+
+def generate_renditions(storage, name):
+    """name の写真からレンディションを作り、{"source": name, 種類: 保存名} を返す"""
+    result = {"source": name}
+    try:
+        digest = content_hash(storage, name)
+        with storage.open(name, "rb") as f:
+            image = Image.open(f)
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            # 内容アドレス保存（storage.py）でもサイズ違いは元写真に並べた名前のまま置く
+            save = getattr(storage, "save_derived", storage.save)
+            for rendition, size in RENDITIONS.items():
+                target = rendition_name(name, digest, rendition)
+                if not storage.exists(target):
+                    saved = save(target, ContentFile(_encode(image, size)))
+                    if saved != target:
+                        logger.warning("rendition saved under unexpected name: %s", saved)
+                    target = saved
+                result[rendition] = target
+    except (OSError, UnidentifiedImageError):
+        # 壊れた画像などは元写真をそのまま使う（毎回再試行しないよう source は記録する）
+        logger.exception("failed to build renditions for %s", name)
+    return result
+
+
+def delete_renditions(storage, renditions, force=False):
+    """サイズ違いを消す
+
+    内容アドレス保存（storage.py）のサイズ違いは写真の参照が 0 になったときに一緒に消えるので、
+    ここでは消さない（force なら参照数を見ずに消す：作り直し用）。
+    """
+    delete = getattr(storage, "purge_file", storage.delete) if force else storage.delete
+    for rendition, target in (renditions or {}).items():
+        if rendition == "source" or not target:
+            continue
+        if not force and digest_of(target):
+            continue
+        try:
+            delete(target)
+        except OSError:
+            logger.warning("failed to delete rendition %s", target)
+
+
+def sync_renditions(record):
+    """record.photo に合わせてレンディションを作り直す（変化がなければ何もしない）"""
+    from .models import Record
+
+    current = record.photo_renditions or {}
+    name = record.photo.name if record.photo else ""
+    if current.get("source", "") == name:
+        return False
+
+    storage = record.photo.storage
+    delete_renditions(storage, current)
+    renditions = generate_renditions(storage, name) if name else {}
+
+    # save() を呼ぶとシグナルが再帰するので update で書き込む
+    Record.objects.filter(pk=record.pk).update(photo_renditions=renditions)
+    record.photo_renditions = renditions
+    return True
+
+
+def backfill_record(pk, force=False):
+    """1件分のレンディションを作る（プロセスプールのワーカーからも呼ばれる）"""
+    from .models import Record
+
+    record = Record.objects.filter(pk=pk).first()
+    if record is None or not record.photo:
+        return False
+    if force:
+        delete_renditions(record.photo.storage, record.photo_renditions, force=True)
+        record.photo_renditions = {}
+    return sync_renditions(record)
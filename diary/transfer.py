@@ -0,0 +1,204 @@
+# diary/transfer.py
+"""記録（Record）の書き出し・取り込み（CSV / JSON Lines）
+
+書き出しは .iterator(chunk_size=...) で少しずつ読み、まとめた行を順に返すのでメモリは一定。
+取り込みは batch_size 件ずつ bulk_create(update_conflicts=True) で
+uniq_record_user_date（user, date）に対して upsert する。
+bulk_create はシグナルを送らないので、月キャッシュ・記録済みビットマップは最後にまとめて破棄し、
+気分の集計は取り込んだ月だけ（多ければユーザー全体を）作り直す。
+写真の参照数（storage.PhotoBlob）も取り込んだ写真の分だけ数え直す。
+"""
+import csv
+import io
+import json
+from datetime import date
+
+from . import month_cache
+from . import mood_stats
+from . import moods as mood_registry
+from . import recorded_days
+from . import storage as photo_store
+from .models import Record
+
+FIELDS = ["date", "mood", "note", "photo"]
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+}
+CHUNK_SIZE = 2000
+BATCH_SIZE = 1000
+# これより多くの月を取り込んだら、気分の集計は月ごとでなくユーザー全体で作り直す
+REBUILD_ALL_MONTHS = 24
+
+
+def export_rows(user_id, chunk_size=CHUNK_SIZE):
+    """(date, mood の色, note, photo) を日付順に返す"""
+    return (
+        Record.objects
+        .filter(user_id=user_id)
+        .order_by("date")
+        .values_list("date", "mood__color", "note", "photo")
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def iter_csv(rows, flush_every=500):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(FIELDS)
+    for i, (day, color, note, photo) in enumerate(rows, 1):
+        writer.writerow([day.isoformat(), color or "", note, photo or ""])
+        if i % flush_every == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def iter_jsonl(rows, flush_every=500):
+    lines = []
+    for day, color, note, photo in rows:
+        lines.append(json.dumps(
+            {"date": day.isoformat(), "mood": color or "", "note": note, "photo": photo or ""},
+            ensure_ascii=False,
+        ))
+        if len(lines) >= flush_every:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def export_stream(user_id, fmt, chunk_size=CHUNK_SIZE):
+    rows = export_rows(user_id, chunk_size=chunk_size)
+    if fmt == "csv":
+        return iter_csv(rows)
+    if fmt == "jsonl":
+        return iter_jsonl(rows)
+    raise ValueError(f"unknown format: {fmt}")
+
+
+def read_rows(text_file, fmt):
+    """テキストのファイルから行の dict を順に返す（行番号つき）"""
+    if fmt == "csv":
+        for lineno, row in enumerate(csv.DictReader(text_file), 2):
+            yield lineno, row
+    elif fmt == "jsonl":
+        for lineno, line in enumerate(text_file, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield lineno, None
+                continue
+            yield lineno, row if isinstance(row, dict) else None
+    else:
+        raise ValueError(f"unknown format: {fmt}")
+
+
+def guess_format(filename):
+    name = (filename or "").lower()
+    if name.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    return "csv"
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.errors = []  # (行番号, 理由)
+
+    def error(self, lineno, reason):
+        self.errors.append((lineno, reason))
+
+
+def import_records(user, rows, batch_size=BATCH_SIZE, keep_photo_paths=False):
+    """read_rows の結果を upsert する。不正な行は飛ばして ImportResult.errors に残す
+
+    写真パスは、このユーザーの記録が既に使っているもの（自分の書き出しの再取り込み）だけを受け付ける。
+    keep_photo_paths=True（管理コマンド用）なら任意のパスをそのまま入れる。
+    写真の列が空の行は、既存の写真を残したまま気分・メモだけ更新する。
+    """
+    colors = {m.color: m for m in mood_registry.all_moods() if m.color}
+    photo_rows = (
+        Record.objects.filter(user=user).exclude(photo="").exclude(photo__isnull=True)
+        .values_list("date", "photo", "photo_renditions")
+    )
+    owned_photos, photo_by_date = {}, {}
+    for day, photo, renditions in photo_rows:
+        owned_photos[photo] = renditions
+        photo_by_date[day] = photo
+    today = date.today()
+    result = ImportResult()
+    touched_months, touched_years, photos = set(), set(), set()
+    pending = {}  # date -> Record（同じ日付が続いたら後の行を使う：ON CONFLICT は1文で同じ行を2回更新できない）
+
+    def flush():
+        with_photo = [r for r in pending.values() if r.photo]
+        without_photo = [r for r in pending.values() if not r.photo]
+        if with_photo:
+            Record.objects.bulk_create(
+                with_photo, update_conflicts=True, unique_fields=["user", "date"],
+                update_fields=["mood", "note", "photo", "photo_renditions"],
+            )
+        if without_photo:
+            Record.objects.bulk_create(
+                without_photo, update_conflicts=True, unique_fields=["user", "date"],
+                update_fields=["mood", "note"],
+            )
+        result.imported += len(pending)
+        pending.clear()
+
+    for lineno, row in rows:
+        if row is None:
+            result.error(lineno, "行を読み取れません")
+            continue
+        try:
+            day = date.fromisoformat(str(row.get("date") or "").strip())
+        except ValueError:
+            result.error(lineno, "日付が不正です")
+            continue
+        if day > today:
+            result.error(lineno, "未来の日付は記録できません")
+            continue
+        color = str(row.get("mood") or "").strip()
+        mood = colors.get(color)
+        if mood is None:
+            result.error(lineno, f"気分の色が不正です: {color!r}")
+            continue
+        photo = str(row.get("photo") or "").strip()
+        if photo and not keep_photo_paths and photo not in owned_photos:
+            result.error(lineno, "写真のパスが不正です")
+            continue
+
+        record = Record(user=user, date=day, mood=mood, note=str(row.get("note") or ""))
+        if photo:
+            record.photo = photo
+            record.photo_renditions = owned_photos.get(photo) or {}
+            photos.add(photo)
+            # この行で上書きされる写真（参照が減る）
+            if day in photo_by_date:
+                photos.add(photo_by_date[day])
+        pending[day] = record
+        touched_months.add((day.year, day.month))
+        touched_years.add(day.year)
+        if len(pending) >= batch_size:
+            flush()
+    flush()
+
+    # 月初・月末の日は前後の月の表示にも出るので、隣の月もまとめて破棄する（行ごとに判定すると遅い）
+    shown_in = set()
+    for year, month in touched_months:
+        shown_in.add((year, month))
+        shown_in.add((year - 1, 12) if month == 1 else (year, month - 1))
+        shown_in.add((year + 1, 1) if month == 12 else (year, month + 1))
+    month_cache.invalidate_months(user.pk, shown_in)
+    if len(touched_months) > REBUILD_ALL_MONTHS:
+        mood_stats.rebuild_user(user.pk)
+    else:
+        mood_stats.rebuild_months(user.pk, touched_months)
+    recorded_days.invalidate_years(user.pk, touched_years)
+    # 参照が増えた写真と、上書きで参照が減った写真を数え直す（どこからも使われなくなれば消す）
+    photo_store.recount(photos)
+    return result
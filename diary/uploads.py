@@ -0,0 +1,89 @@
+# diary/uploads.py
+"""入力エラーで再表示するときの写真の一時置き場
+
+失敗した POST の写真をチャンク単位で一時ファイルに書き出し、トークンで参照する。
+次の POST でトークンが送られてきたら、そのファイルを Record.photo に昇格させる。
+一時置き場は MEDIA_ROOT の外に置き、本人だけが staged_photo ビュー経由で見られる。
+"""
+import os
+import re
+import secrets
+import shutil
+import time
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.text import get_valid_filename
+
+STAGING_ROOT = getattr(settings, "DIARY_UPLOAD_STAGING_ROOT", settings.BASE_DIR / "staged_uploads")
+MAX_AGE = getattr(settings, "DIARY_UPLOAD_STAGING_MAX_AGE", 60 * 60 * 6)
+
+TOKEN_RE = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+staging_storage = FileSystemStorage(location=STAGING_ROOT)
+
+
+def _user_dir(user):
+    return str(user.pk)
+
+
+def stage_upload(user, uploaded):
+    """アップロードを一時置き場に保存してトークンを返す"""
+    token = secrets.token_urlsafe(16)
+    filename = get_valid_filename(os.path.basename(uploaded.name or "")) or "photo"
+    uploaded.seek(0)
+    # FileSystemStorage はチャンクごとに書き込む（一時ファイルなら移動のみ）
+    staging_storage.save(f"{_user_dir(user)}/{token}/{filename}", uploaded)
+    return token
+
+
+def staged_name(user, token):
+    """トークンに対応する一時ファイル名（なければ None）"""
+    if not token or not TOKEN_RE.match(token):
+        return None
+    directory = f"{_user_dir(user)}/{token}"
+    try:
+        _, files = staging_storage.listdir(directory)
+    except FileNotFoundError:
+        return None
+    if not files:
+        return None
+    return f"{directory}/{files[0]}"
+
+
+def open_staged(user, token):
+    """一時ファイルを File として開く（Record.photo への代入用）"""
+    name = staged_name(user, token)
+    if name is None:
+        return None
+    return File(staging_storage.open(name, "rb"), name=os.path.basename(name))
+
+
+def discard(user, token):
+    if not token or not TOKEN_RE.match(token):
+        return
+    shutil.rmtree(os.path.join(staging_storage.location, _user_dir(user), token), ignore_errors=True)
+
+
+def purge_stale(max_age=None, now=None):
+    """max_age 秒より古い一時ファイルを削除し、削除したトークン数を返す"""
+    max_age = MAX_AGE if max_age is None else max_age
+    now = time.time() if now is None else now
+    root = staging_storage.location
+    if not os.path.isdir(root):
+        return 0
+
+    removed = 0
+    for user_dir in os.scandir(root):
+        if not user_dir.is_dir():
+            continue
+        for token_dir in os.scandir(user_dir.path):
+            if token_dir.is_dir() and now - token_dir.stat().st_mtime > max_age:
+                shutil.rmtree(token_dir.path, ignore_errors=True)
+                removed += 1
+        try:
+            os.rmdir(user_dir.path)  # 空になったユーザーディレクトリも片付ける
+        except OSError:
+            pass
+    return removed
@@ -1,20 +1,36 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 from diary import views
+from diary import async_views
+
+# ASGI で動かすときはカレンダー・記録画面を async 版にする
+page_views = async_views if getattr(settings, "DIARY_ASYNC_VIEWS", False) else views
 
 
 urlpatterns = [
-    path('', views.calendar_view, name='calendar'),  # カレンダー画面（ホーム）
+    path('', page_views.calendar_view, name='calendar'),  # カレンダー画面（ホーム）
     path('settings/', views.settings_view, name='settings'), #設定画面
-    path('record/', views.record_view, name='record'), #記録する画面
-    path('record/<str:selected_date>/', views.record_view, name='record_with_date'),
-    path("records/<int:pk>/delete/", views.record_delete, name="record_delete"),
-    path("records/<int:pk>/photo_delete/", views.photo_delete, name="photo_delete"),
+    path('stats/', views.instrumentation_stats, name='instrumentation_stats'), #計測値（スタッフのみ）
+    path('record/', page_views.record_view, name='record'), #記録する画面
+    path('record/<str:selected_date>/', page_views.record_view, name='record_with_date'),
+    path('record/staged/<str:token>/', views.staged_photo, name='staged_photo'),
+    path('media/<path:name>', views.photo_file, name='photo_file'),  # 記録の写真（本人のみ）
+    path("records/<int:pk>/delete/", page_views.record_delete, name="record_delete"),
+    path("records/<int:pk>/photo_delete/", page_views.photo_delete, name="photo_delete"),
+    path("api/month/<int:year>/<int:month>/", views.month_summary_api, name="month_summary_api"),
+    path("api/recorded/", views.recorded_days_api, name="recorded_days_api"),
+    path("year/", views.year_view, name="year_view"),
+    path("search/", views.search_view, name="search"),
+    path("mood-stats/", views.mood_stats_view, name="mood_stats"),
+    path("api/mood-stats/", views.mood_stats_api, name="mood_stats_api"),
 
     #設定関連
     path('settings/username/', views.change_username, name='change_username'),
     path('settings/email/', views.change_email, name='change_email'),
     path('settings/password/', views.change_password, name='change_password'),
+    path('settings/export/', views.records_export, name='records_export'),
+    path('settings/import/', views.records_import, name='records_import'),
 
 
     #ポートフォリオ各資料へアクセス
@@ -1,22 +1,39 @@
 from django.shortcuts import render, redirect
 from django.shortcuts import get_object_or_404
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import update_session_auth_hash, authenticate, login, logout
 from django.contrib.auth.models import User
-from django.contrib.auth.hashers import check_password
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.password_validation import validate_password
-from django.contrib.staticfiles import finders
-from django.http import FileResponse, Http404
-from django.db.models import Case, When, IntegerField
-from django.core.exceptions import ValidationError
-from datetime import date, timedelta
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.urls import reverse
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.db.models import Q
+from datetime import date, timedelta, MINYEAR, MAXYEAR
 from datetime import date as dt_date
-import calendar
+from .auth_backends import users_with_email
 from .forms import RecordForm
-from .models import Record, Mood
+from .models import Record
+from .month_cache import get_month_state, get_month_summary, month_window
+from . import uploads
+from . import moods as mood_registry
+from . import instrumentation, month_cache
+from .instrumentation import latency_budget, query_budget
+from .throttle import throttle
+from . import recorded_days as recorded_days_store
+from . import transfer
+from . import mood_stats
+from . import year_heatmap
+from . import search as note_search
+from . import calendar_grid, file_serving, photo_upload, thumbnails
+from .storage import digest_of
+import calendar
+import csv
+import io
 import re
-import base64
 
 
 @login_required
@@ -55,7 +72,7 @@ def change_email(request):
         elif new_email.lower() != confirm_email.lower():
             messages.error(request, "新しいメールアドレスが一致しません")
         # 他ユーザーと重複（大文字小文字を無視）
-        elif User.objects.filter(email__iexact=new_email).exclude(pk=request.user.pk).exists():
+        elif users_with_email(new_email).exclude(pk=request.user.pk).exists():
             messages.error(request, "このメールアドレスは既に使用されています")
         else:
             request.user.email = (new_email or "").strip().lower()
@@ -65,6 +82,7 @@ def change_email(request):
     return render(request, "diary/change_email.html")
 
 @login_required
+@throttle("password", "user", "ip", template="diary/change_password.html")
 def change_password(request):
     if request.method == "POST":
         current_password = request.POST.get("current_password", "").strip()
@@ -104,6 +122,8 @@ def change_password(request):
 
 
 # ログイン
+@query_budget(10)
+@throttle("login", "ip", "email", template="diary/login.html")
 def login_view(request):
     if request.user.is_authenticated:
         return redirect("home")
@@ -112,20 +132,9 @@ def login_view(request):
         email = (request.POST.get("email") or "").strip().lower()
         password = (request.POST.get("password") or "").strip()
         
-        qs = User.objects.filter(email__iexact=email).only("id", "username", "password", "is_active").order_by("-id")
-        user = qs.first()
         err_msg = "メールアドレスまたはパスワードが間違っています"
 
-        if not user or not user.is_active:
-            messages.error(request, err_msg)
-            return render(request, "diary/login.html")
-
-        # パスワード検証
-        if not check_password(password, user.password):
-            messages.error(request, err_msg)
-            return render(request, "diary/login.html")
-
-        # 認証 & ログイン
+        # 認証（ユーザー検索1回・パスワードのハッシュ計算1回）
         user = authenticate(request, email=email, password=password)
         if user is None:
             messages.error(request, err_msg)
@@ -140,6 +149,7 @@ def login_view(request):
 
 
 #ログイン後操作可
+@query_budget(6)
 @login_required
 def calendar_view(request):
     year = request.GET.get('year')
@@ -153,36 +163,9 @@ def calendar_view(request):
         year = today.year
         month = today.month
 
-    # 月曜始まり
-    cal = calendar.Calendar(firstweekday=0)
-    month_days = cal.monthdatescalendar(year, month)
-
-    # 表示範囲（前後月を含む最初〜最後）
-    first_display = month_days[0][0]
-    last_display  = month_days[-1][-1]
-
-    # このユーザーの「記録がある日」を一括取得
-    recorded_qs = (
-        Record.objects
-        .filter(user=request.user, date__gte=first_display, date__lte=last_display)
-        .values_list("date", flat=True)
-    )
-    recorded_dates = list(set(recorded_qs))
-    
-    records = (
-        Record.objects
-        .filter(user=request.user, date__gte=first_display, date__lte=last_display)
-        .select_related("mood")
-        .values("date", "mood__color", "photo")
-    )
-
-    records_by_date = {
-        r["date"].isoformat(): {
-            "color": r["mood__color"],   
-            "photo": r["photo"], 
-        }
-        for r in records
-    }
+    # このユーザーの表示範囲の記録（色・写真）を1クエリ＋キャッシュで取得
+    records_by_date = get_month_summary(request.user.pk, year, month)
+    recorded_dates = [dt_date.fromisoformat(d) for d in records_by_date]
 
     # 前月・次月
     first_day  = date(year, month, 1)
@@ -192,12 +175,15 @@ def calendar_view(request):
     context = {
         "year": year,
         "month": month,
-        "month_days": month_days,
+        # 日付の枠（月曜始まり）は全ユーザー共通の断片をキャッシュから
+        "grid": calendar_grid.render_fragment(year, month, today),
         "today": today,
         "prev_month": prev_month,
         "next_month": next_month,
         "recorded_dates": recorded_dates,  
         "records_by_date": records_by_date, 
+        # 写真の名前 → URL（本人確認つきの photo_file）
+        "photo_base_url": Record._meta.get_field("photo").storage.base_url,
     }
     
     #messages.success(request, "今日の気分を記録しましょう！", extra_tags="hint")
@@ -207,19 +193,212 @@ def calendar_view(request):
     return render(request, "diary/calendar.html", context)
 
 
+# 月表示の JSON（クライアント側での月切り替え用）。ETag で未変更なら 304
+@query_budget(5)
+@login_required
+def month_summary_api(request, year, month):
+    if not (1 <= month <= 12 and MINYEAR < year < MAXYEAR):
+        raise Http404("Invalid month")
+
+    today = date.today()
+    month_days, _, _ = month_window(year, month)
+    records_by_date, state_etag = get_month_state(request.user.pk, year, month)
+
+    # 未来日の判定に today を使うので、日付が変わったら別物として扱う
+    etag = f'"{state_etag}-{today:%Y%m%d}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    first_day  = date(year, month, 1)
+    prev_month = first_day - timedelta(days=1)
+    next_month = date(year + (month // 12), (month % 12) + 1, 1)
+
+    resp = JsonResponse({
+        "year": year,
+        "month": month,
+        "today": today.isoformat(),
+        "weeks": [[d.isoformat() for d in week] for week in month_days],
+        "prev": {
+            "year": prev_month.year,
+            "month": prev_month.month,
+            "url": reverse("month_summary_api", args=[prev_month.year, prev_month.month]),
+        },
+        "next": {
+            "year": next_month.year,
+            "month": next_month.month,
+            "url": reverse("month_summary_api", args=[next_month.year, next_month.month]),
+        },
+        "records_by_date": records_by_date,
+    })
+    resp["ETag"] = etag
+    # 毎回 ETag で再検証させる（ブラウザのキャッシュは使うが古い月は見せない）
+    patch_cache_control(resp, private=True, no_cache=True)
+    return resp
+
+
+# 上書き確認用：指定年の記録済み日のビットマップ（base64）
+@query_budget(5)
+@login_required
+def recorded_days_api(request):
+    try:
+        year = int(request.GET.get("year", ""))
+    except ValueError:
+        raise Http404("Invalid year")
+    if not (MINYEAR <= year <= MAXYEAR):
+        raise Http404("Invalid year")
+
+    bits = recorded_days_store.year_bitmap(request.user.pk, year)
+    resp = JsonResponse({"year": year, "bitmap": recorded_days_store.encode(bits)})
+    patch_cache_control(resp, private=True, no_cache=True)
+    return resp
+
+
+# メモの検索（?q=語 語&page=n）。SQLite は FTS5、PostgreSQL は trigram インデックスで引く
+@query_budget(6)
+@login_required
+def search_view(request):
+    query = (request.GET.get("q") or "").strip()
+    try:
+        page = int(request.GET.get("page") or 1)
+    except ValueError:
+        page = 1
+    result = note_search.search(request.user.pk, query, page=page) if query else None
+    return render(request, "diary/search.html", {"query": query, "result": result})
+
+
+# 年表示（ヒートマップ）。描画済みの断片をキャッシュから返す
+@query_budget(4)
+@latency_budget(getattr(settings, "DIARY_YEAR_VIEW_LATENCY_BUDGET_MS", 150))
+@login_required
+def year_view(request):
+    today = date.today()
+    try:
+        year = int(request.GET.get("year") or today.year)
+    except ValueError:
+        raise Http404("Invalid year")
+    if not (MINYEAR < year < MAXYEAR):
+        raise Http404("Invalid year")
+
+    heatmap, recorded = year_heatmap.render_fragment(request.user.pk, year, today)
+    return render(request, "diary/year.html", {
+        "year": year,
+        "heatmap": heatmap,
+        "recorded": recorded,
+        "moods": mood_registry.all_moods(),
+        "today": today,
+    })
+
+
+WEEKDAY_LABELS = ["月", "火", "水", "木", "金", "土", "日"]
+
+
+# 気分の統計（集計表 MonthlyMoodSummary だけを読む）
+@query_budget(4)
+@login_required
+def mood_stats_view(request):
+    stats = mood_stats.user_stats(request.user.pk)
+    colors = stats["colors"]
+    years = [y["year"] for y in stats["years"]]
+
+    try:
+        year = int(request.GET.get("year") or (years[-1] if years else date.today().year))
+    except ValueError:
+        raise Http404("Invalid year")
+    if not (MINYEAR <= year <= MAXYEAR):
+        raise Http404("Invalid year")
+
+    # 選択した年の月ごとの分布（横棒は月の日数に対する割合）
+    by_month = {m["month"]: m for m in stats["months"] if m["year"] == year}
+    month_rows = []
+    for month in range(1, 13):
+        days = calendar.monthrange(year, month)[1]
+        counts = by_month.get(month, {}).get("moods", {})
+        month_rows.append({
+            "month": month,
+            "total": by_month.get(month, {}).get("total", 0),
+            "segments": [
+                {"color": c, "days": counts.get(c, 0), "pct": round(counts.get(c, 0) / days * 100, 2)}
+                for c in colors if counts.get(c)
+            ],
+        })
+
+    weekday_rows = [
+        {"color": c, "counts": stats["weekdays"][c]} for c in colors
+    ]
+    year_rows = [
+        {
+            "year": y["year"],
+            "total": y["total"],
+            "cells": [
+                {"color": c, "days": y["moods"][c], "share": y["share"][c],
+                 "change": (y["change"] or {}).get(c)}
+                for c in colors
+            ],
+        }
+        for y in stats["years"]
+    ]
+
+    return render(request, "diary/stats.html", {
+        "year": year,
+        "years": years,
+        "colors": colors,
+        "month_rows": month_rows,
+        "weekday_labels": WEEKDAY_LABELS,
+        "weekday_rows": weekday_rows,
+        "year_rows": year_rows,
+        "streaks": stats["streaks"],
+    })
+
+
+@query_budget(4)
+@login_required
+def mood_stats_api(request):
+    resp = JsonResponse(mood_stats.user_stats(request.user.pk))
+    patch_cache_control(resp, private=True, no_cache=True)
+    return resp
+
+
+def record_error_context(request, form, existing, extra):
+    """入力エラーで記録画面を出し直すときの context（record_view の同期版・async 版で共通）"""
+    # 検証で form.instance.photo に未保存のアップロードが入るので、DB 上の写真に戻す
+    # （プレビューの URL が保存されていないファイルを指さないように。新しい写真は一時置き場の URL で見せる）
+    form.instance.photo = getattr(form.instance, "_photo_key", "") or None
+    return {
+        "form": form,
+        "selected_mood_id": request.POST.get("mood") or None,
+        "has_record": bool(existing),
+        "reset_photo": False,
+        "current_photo": (existing.photo if (existing and existing.photo) else None),
+        **extra,
+    }
+
+
+@query_budget(20)
 @login_required
 def record_view(request, selected_date=None):
-    def _make_preview_data_uri(uploaded):
-        if not uploaded:
-            return None
-        try:
-            content_type = getattr(uploaded, "content_type", "image/*")
-            data = uploaded.read()
-            uploaded.seek(0)
-            b64 = base64.b64encode(data).decode("ascii")
-            return f"data:{content_type};base64,{b64}"
-        except Exception:
-            return None
+    def _stage_photo(form):
+        """入力エラー時：写真を一時置き場へ移し、再表示画面からトークンで参照する"""
+        token = (request.POST.get("staged_photo") or "").strip()
+        # 一時置き場にも正規化（縮小・再圧縮）した写真を置く
+        uploaded = form.cleaned_data.get("photo") if "photo" in request.FILES else None
+        if uploaded and "photo" not in form.errors:
+            uploads.discard(request.user, token)
+            token = uploads.stage_upload(request.user, uploaded)
+        if not uploads.staged_name(request.user, token):
+            return {}
+        return {
+            "staged_photo_token": token,
+            "staged_photo_url": reverse("staged_photo", args=[token]),
+        }
+
+    def _render_error(form):
+        return render(request, "diary/record.html", record_error_context(request, form, existing, {
+            "moods": moods,
+            "display_date": initial_date,
+            "recorded_days": recorded_days,
+            **_stage_photo(form),
+        }))
 
     # --- 日付の取得（?date=YYYY-MM-DD） ---
     date_str = request.GET.get("date", "") or selected_date or ""
@@ -235,33 +414,26 @@ def record_view(request, selected_date=None):
     if initial_date:
         existing = Record.objects.filter(user=request.user, date=initial_date).first()
 
-    # --- 気分（5色） ---
-    DEFAULT_COLORS = ["red", "orange", "yellow", "green", "blue"]
-    if not Mood.objects.exists():
-        Mood.objects.bulk_create([Mood(color=c) for c in DEFAULT_COLORS])
-
-    order = Case(
-        *[When(color=c, then=idx) for idx, 
-          c in enumerate(DEFAULT_COLORS)],
-        default=len(DEFAULT_COLORS),
-        output_field=IntegerField(),
-    )
-    moods = Mood.objects.order_by(order, "id")
-    
-    # 上書き確認用：記録済み日付全て
-    recorded_dates = list(
-        Record.objects.filter(user=request.user).values_list("date", flat=True)
-    )
-    recorded_dates = [d.isoformat() for d in recorded_dates]
+    # --- 気分（5色）：プロセス内レジストリから（DB 問い合わせなし） ---
+    moods = mood_registry.all_moods()
+
+    # 上書き確認用：表示中の年の記録済み日（ビットマップ）。他の年は画面側から API で取得
+    recorded_year = (initial_date or date.today()).year
+    recorded_days = {
+        "years": {
+            str(recorded_year): recorded_days_store.encode(
+                recorded_days_store.year_bitmap(request.user.pk, recorded_year)
+            ),
+        },
+        "url": reverse("recorded_days_api"),
+    }
 
 
     if request.method == "POST":
         # ★ 記録削除処理
         if "delete_record" in request.POST:
             if existing:
-                if existing.photo:
-                    existing.photo.delete(save=False)
-                existing.delete()
+                existing.delete()  # 写真ファイルはジョブで消す（signals / photo_tasks）
                 messages.success(request, "記録を削除しました")
             else:
                 messages.info(request, "削除する記録はありません")
@@ -270,7 +442,6 @@ def record_view(request, selected_date=None):
         # ★ 写真削除処理
         if "remove_photo" in request.POST:
             if existing and existing.photo:
-                existing.photo.delete(save=False)
                 existing.photo = None
                 existing.save(update_fields=["photo"])
                 messages.success(request, "写真を削除しました")
@@ -281,49 +452,31 @@ def record_view(request, selected_date=None):
 
         # 通常の保存処理
         form = RecordForm(request.POST, request.FILES, instance=existing)
+        # 大きすぎて受信中に捨てた写真（photo_upload.MaxSizeUploadHandler）
+        for field, message in photo_upload.rejected_uploads(request).items():
+            form.add_error(field, message)
 
         # “日付未入力”を検出
         post_date_str = (request.POST.get("date") or "").strip()
         if not post_date_str:
             form.add_error("date", "日付を入力してください")
-            selected_mood_id = request.POST.get("mood") or None
-            preview_data_uri = _make_preview_data_uri(request.FILES.get("photo"))
             messages.error(request, "入力内容にエラーがあります")
-            return render(request, "diary/record.html", {
-                "form": form,  
-                "moods": moods,
-                "selected_mood_id": selected_mood_id,
-                "has_record": bool(existing),
-                "display_date": initial_date,
-                "reset_photo": False,
-                "current_photo": (existing.photo if (existing and existing.photo) else None), 
-                "preview_data_uri": preview_data_uri,
-                "recorded_dates": recorded_dates,
-            })
+            return _render_error(form)
             
         #  気分必須チェック
         mood_id = (request.POST.get("mood") or "").strip()
         if not mood_id:
             form.add_error("mood", "気分を選択してください")
-        elif not Mood.objects.filter(pk=mood_id).exists():
+        elif mood_registry.get_mood(mood_id) is None:
             form.add_error("mood", "もう一度選び直してください")
                     
         if not form.is_valid():
-            selected_mood_id = request.POST.get("mood") or None
-            preview_data_uri = _make_preview_data_uri(request.FILES.get("photo"))
             messages.error(request, "入力内容にエラーがあります")
-            return render(request, "diary/record.html", {
-                "form": form,
-                "moods": moods,
-                "selected_mood_id": selected_mood_id,
-                "has_record": bool(existing),
-                "display_date": initial_date,
-                "reset_photo": False,
-                "current_photo": (existing.photo if (existing and existing.photo) else None),
-                "recorded_dates": recorded_dates,  
-            })
+            return _render_error(form)
         # ここで必ず存在するMoodを取得（なければ404）
-        mood_obj = get_object_or_404(Mood, pk=mood_id)
+        mood_obj = mood_registry.get_mood(mood_id)
+        if mood_obj is None:
+            raise Http404("Mood not found")
 
 
         data = form.cleaned_data
@@ -334,57 +487,25 @@ def record_view(request, selected_date=None):
         if save_date and save_date > date.today():
                 form.add_error("date", "未来の日付は記録できません")
                 messages.error(request, "未来の日付は記録できません", extra_tags="modal future-date")
-                selected_mood_id = request.POST.get("mood") or None
-                preview_data_uri = _make_preview_data_uri(request.FILES.get("photo"))
-                return render(request, "diary/record.html", {
-                    "form": form,
-                    "moods": moods,
-                    "selected_mood_id": selected_mood_id,
-                    "has_record": bool(existing),
-                    "display_date": initial_date,
-                    "reset_photo": False,
-                    "current_photo": (existing.photo if (existing and existing.photo) else None),
-                    "recorded_dates": recorded_dates,
-                })
+                return _render_error(form)
         if not save_date:
                 form.add_error("date", "日付を入力してください")
-                selected_mood_id = request.POST.get("mood") or None
-                preview_data_uri = _make_preview_data_uri(request.FILES.get("photo"))
-                return render(request, "diary/record.html", {
-                    "form": form,
-                    "moods": moods,
-                    "selected_mood_id": selected_mood_id,
-                    "has_record": bool(existing),
-                    "display_date": initial_date,
-                    "reset_photo": False,
-                    "current_photo": (existing.photo if (existing and existing.photo) else None),
-                    "recorded_dates": recorded_dates,
-                })
+                return _render_error(form)
 
         mood_value = data.get("mood")
         note_value = (data.get("note") or "").strip()
-        uploaded   = request.FILES.get("photo")                         # ← ここでだけ参照
+        uploaded   = data.get("photo") if "photo" in request.FILES else None  # 正規化済み（RecordForm.clean_photo）
+        staged_token = (request.POST.get("staged_photo") or "").strip()
+        if not uploaded and staged_token:
+            # 前回エラー時に一時保存した写真を再アップロードなしで使う
+            uploaded = uploads.open_staged(request.user, staged_token)
         removing   = bool(request.POST.get("remove_photo"))
 
         
         if existing and existing.date and save_date != existing.date:
             form.add_error("date", "日付は変更できません（別日で記録したい場合は、その日付を開いて記録してください）")
             messages.error(request, "入力内容にエラーがあります")
-            selected_mood_id = request.POST.get("mood") or None
-            return render(request, "diary/record.html", {
-                "form": form,
-                "moods": moods,
-                "selected_mood_id": selected_mood_id,
-                "has_record": bool(existing),
-                "display_date": initial_date,
-                "reset_photo": False,
-                "current_photo": (existing.photo if (existing and existing.photo) else None),
-                "recorded_dates": recorded_dates,
-            })
-
-        # POSTの日付で既存を取り直す
-        existing_for_date = Record.objects.filter(user=request.user, date=save_date).first()
-        old_photo = existing_for_date.photo if (existing_for_date and existing_for_date.photo) else None
+            return _render_error(form)
 
         # DBを更新or新規作成
         instance, created = Record.objects.update_or_create(
@@ -397,14 +518,14 @@ def record_view(request, selected_date=None):
         )
 
         if uploaded:
+            # 写真ファイルの書き込みだけ行い、加工と古い写真の削除はジョブに回す（signals / photo_tasks）
             instance.photo = uploaded
             instance.save(update_fields=["photo"])
 
-            if old_photo and old_photo.name != instance.photo.name:
-                try:
-                    old_photo.delete(save=False)
-                except Exception:
-                    pass
+        if staged_token:
+            if uploaded:
+                uploaded.close()
+            uploads.discard(request.user, staged_token)
 
         messages.success(request, "記録を保存しました")
         return redirect("calendar")
@@ -426,23 +547,22 @@ def record_view(request, selected_date=None):
         "has_record": bool(existing),
         "display_date": initial_date,
         "current_photo": (existing.photo if (existing and existing.photo) else None),
-        "recorded_dates": recorded_dates,
+        "recorded_days": recorded_days,
     })
 
+@query_budget(12)
 @login_required
 def record_delete(request, pk):
     record = get_object_or_404(Record, pk=pk, user=request.user)
-    if record.photo:
-        record.photo.delete(save=False)
     record.delete()
     messages.success(request, "記録を削除しました")
     return redirect("calendar")
 
+@query_budget(12)
 @login_required
 def photo_delete(request, pk):
     record = get_object_or_404(Record, pk=pk, user=request.user)
     if record.photo:
-        record.photo.delete(save=False)
         record.photo = None
         record.save()
         messages.success(request, "写真を削除しました")
@@ -451,17 +571,111 @@ def photo_delete(request, pk):
     return redirect("calendar")
 
 
+# 入力エラー時に一時保存した写真（本人のみ）
+@login_required
+def staged_photo(request, token):
+    name = uploads.staged_name(request.user, token)
+    if name is None:
+        raise Http404("Photo not found")
+    return file_serving.serve_file(
+        request, uploads.staging_storage.path(name), cache_control="private, no-store",
+    )
+
+
+def _owns_photo(user, name):
+    # 元写真か、元写真から作ったサイズ違い（元名.<hash>.<種類>.jpg）
+    cond = Q(photo=name)
+    stem = thumbnails.source_stem(name)
+    if stem:
+        cond |= Q(photo__startswith=stem + ".")
+    return Record.objects.filter(cond, user=user).exists()
+
+
+# 記録の写真（元写真・サイズ違い）：自分の記録の写真だけを返す。中身は file_serving で送る
+@query_budget(6)
+@login_required
+def photo_file(request, name):
+    if not _owns_photo(request.user, name):
+        raise Http404("Photo not found")
+    storage = Record._meta.get_field("photo").storage
+    try:
+        path = storage.path(name)
+    except (SuspiciousFileOperation, NotImplementedError):
+        raise Http404("Photo not found")
+    # 内容ハッシュ入りの名前は中身が変わらない
+    immutable = digest_of(name) or thumbnails.source_stem(name)
+    try:
+        return file_serving.serve_file(
+            request, path, cache_control=file_serving.IMMUTABLE_PRIVATE if immutable else "private, no-cache",
+        )
+    except FileNotFoundError:
+        raise Http404("Photo not found")
+
+
+# 計測値（URL 名ごとの処理時間・DB時間・クエリ数）：スタッフのみ
+@staff_member_required
+def instrumentation_stats(request):
+    return JsonResponse({
+        "views": instrumentation.snapshot(),
+        "month_cache": month_cache.cache_stats(),
+    })
+
+
 @login_required
 def settings_view(request):
     return render(request, "diary/settings.html")
 
 
+# 記録の書き出し（?format=csv|jsonl）。全件を少しずつ読みながら送る
+@login_required
+def records_export(request):
+    fmt = request.GET.get("format", "csv")
+    if fmt not in transfer.FORMATS:
+        raise Http404("unknown format")
+    response = StreamingHttpResponse(
+        transfer.export_stream(request.user.pk, fmt), content_type=transfer.FORMATS[fmt],
+    )
+    response["Content-Disposition"] = f'attachment; filename="diary-{date.today():%Y%m%d}.{fmt}"'
+    patch_cache_control(response, private=True, no_store=True)
+    return response
+
+
+# 記録の取り込み（書き出したファイルをそのまま戻せる。同じ日付は上書き）
+@login_required
+def records_import(request):
+    if request.method != "POST":
+        return redirect("settings")
+    uploaded = request.FILES.get("records_file")
+    if not uploaded:
+        messages.error(request, "ファイルを選択してください")
+        return redirect("settings")
+
+    fmt = transfer.guess_format(uploaded.name)
+    text = io.TextIOWrapper(uploaded.file, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        result = transfer.import_records(request.user, transfer.read_rows(text, fmt))
+    except csv.Error:
+        messages.error(request, "ファイルを読み取れませんでした")
+        return redirect("settings")
+    finally:
+        text.detach()
+
+    messages.success(request, f"{result.imported} 件の記録を取り込みました")
+    if result.errors:
+        lines = "、".join(f"{lineno}行目" for lineno, _ in result.errors[:5])
+        more = " ほか" if len(result.errors) > 5 else ""
+        messages.error(request, f"{len(result.errors)} 行を取り込めませんでした（{lines}{more}）")
+    return redirect("settings")
+
+
 def logout_view(request):
     logout(request)
     messages.success(request, "ログアウトしました")
     return redirect("login")
 
 
+@query_budget(12)
+@throttle("signup", "ip", template="diary/signup.html")
 def signup_view(request):
     if request.method == "POST":
         username = (request.POST.get("username") or "").strip()
@@ -488,7 +702,7 @@ def signup_view(request):
         if User.objects.filter(username__iexact=username).exists():
              messages.error(request, "このユーザー名は既に使用されています")
              return redirect("signup")
-        if User.objects.filter(email__iexact=email).exists():
+        if users_with_email(email).exists():
             messages.error(request, "このメールアドレスは既に使用されています")
             return redirect("signup")
         
@@ -516,43 +730,33 @@ def portfolio(request):
     return render(request, 'diary/portfolio.html')
 
 
+# ポートフォリオの PDF（パスは起動時に探しておく。ETag / Range / X-Sendfile は file_serving）
+PORTFOLIO_PDFS = ("proposal.pdf", "userflow.pdf", "er.pdf", "screen.pdf")
+
+
+def _portfolio_pdf(request, filename):
+    path = file_serving.static_path(f"portfolio/{filename}")
+    if not path:
+        raise Http404("PDF not found")
+    return file_serving.serve_file(
+        request, path, content_type="application/pdf", filename=filename,
+        cache_control=file_serving.PDF_CACHE_CONTROL,
+    )
+
+
 #企画書リンク
 def pdf_proposal(request):
-    fp = finders.find('portfolio/proposal.pdf')
-    if not fp:
-        raise Http404("PDF not found")
-    f = open(fp, 'rb')
-    resp = FileResponse(f, content_type='application/pdf')
-    resp["Content-Disposition"] = 'inline; filename="proposal.pdf"'
-    return resp
+    return _portfolio_pdf(request, "proposal.pdf")
 
 #画面遷移図リンク
 def pdf_userflow(request):
-    fp = finders.find('portfolio/userflow.pdf')
-    if not fp:
-        raise Http404("PDF not found")
-    f = open(fp, 'rb')
-    resp = FileResponse(f, content_type='application/pdf')
-    resp["Content-Disposition"] = 'inline; filename="userflow.pdf"'
-    return resp
+    return _portfolio_pdf(request, "userflow.pdf")
 
 #ER図リンク
 def pdf_er(request):
-    fp = finders.find('portfolio/er.pdf')
-    if not fp:
-        raise Http404("PDF not found")
-    f = open(fp, 'rb')
-    resp = FileResponse(f, content_type='application/pdf')
-    resp["Content-Disposition"] = 'inline; filename="er.pdf"'
-    return resp
+    return _portfolio_pdf(request, "er.pdf")
 
 #画面設計図リンク
 def pdf_screen(request):
-    fp = finders.find('portfolio/screen.pdf')
-    if not fp:
-        raise Http404("PDF not found")
-    f = open(fp, 'rb')
-    resp = FileResponse(f, content_type='application/pdf')
-    resp["Content-Disposition"] = 'inline; filename="screen.pdf"'
-    return resp
+    return _portfolio_pdf(request, "screen.pdf")
 
@@ -0,0 +1,125 @@
+# diary/year_heatmap.py
+"""1年分の気分を1枚に並べるヒートマップ（年表示）
+
+日ごとの気分は MonthlyMoodSummary（月×気分の日付ビット）から1クエリで読む（最大 12×気分数 行）。
+描画済みの HTML 断片を (ユーザー, 年) ごとにキャッシュし、集計が変わったらコミット後に破棄する。
+"""
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+
+from . import db_router
+from . import moods as mood_registry
+from .models import MonthlyMoodSummary
+
+KEY_PREFIX = "diary:heatmap"
+GENERATION_KEY = "diary:heatmap:gen"
+CACHE_TIMEOUT = getattr(settings, "DIARY_HEATMAP_CACHE_TIMEOUT", 60 * 60 * 24)
+
+
+def _generation():
+    gen = cache.get(GENERATION_KEY)
+    if gen is None:
+        cache.add(GENERATION_KEY, 1, timeout=None)
+        gen = cache.get(GENERATION_KEY, 1)
+    return gen
+
+
+def _key(user_id, year, gen=None):
+    if gen is None:
+        gen = _generation()
+    return f"{KEY_PREFIX}:{gen}:{user_id}:{year}"
+
+
+def year_colors(user_id, year):
+    """{date: 気分の色}（1クエリ）"""
+    colors = {m.pk: m.color for m in mood_registry.all_moods()}
+    result = {}
+    rows = MonthlyMoodSummary.objects.filter(user_id=user_id, year=year).values_list(
+        "month", "mood_id", "day_mask",
+    )
+    for month, mood_id, mask in rows:
+        color = colors.get(mood_id) or ""
+        while mask:
+            low = mask & -mask
+            mask ^= low
+            result[date(year, month, low.bit_length())] = color
+    return result
+
+
+def build_grid(year, colors, today):
+    """週（月曜始まり）ごとの列。年の前後のはみ出しは None"""
+    first = date(year, 1, 1)
+    last = date(year, 12, 31)
+    start = first - timedelta(days=first.weekday())
+    weeks, labels = [], []
+    day = start
+    while day <= last:
+        week = []
+        label = None
+        for _ in range(7):
+            if day.year != year:
+                week.append(None)
+            else:
+                if day.day == 1:
+                    label = day.month
+                week.append({
+                    "date": day,
+                    "color": colors.get(day),
+                    "recorded": day in colors,
+                    "future": day > today,
+                    "today": day == today,
+                })
+            day += timedelta(days=1)
+        weeks.append(week)
+        labels.append(label)
+    return weeks, labels
+
+
+def render_fragment(user_id, year, today=None):
+    """年表示の HTML 断片（キャッシュ済みならクエリなし）と記録日数"""
+    today = today or date.today()
+    key = _key(user_id, year)
+    cached = cache.get(key)
+    # 今日の印・未来日の表示があるので、描画した日付が変わったら作り直す
+    if cached is not None and cached[0] == today.isoformat():
+        return cached[1], cached[2]
+
+    # キャッシュに入れるのでプライマリから読む（レプリカの遅れた内容を配り続けない）
+    with db_router.use_primary():
+        colors = year_colors(user_id, year)
+    weeks, labels = build_grid(year, colors, today)
+    html = render_to_string("diary/_year_heatmap.html", {
+        "year": year,
+        # 表は曜日ごとの行で組む（列が週）
+        "rows": [
+            {"label": label, "cells": [week[i] for week in weeks]}
+            for i, label in enumerate(["月", "火", "水", "木", "金", "土", "日"])
+        ],
+        "month_labels": labels,
+    })
+    cache.set(key, (today.isoformat(), html, len(colors)), CACHE_TIMEOUT)
+    return html, len(colors)
+
+
+def invalidate(user_id, years):
+    if user_id and years:
+        years = list(years)
+        transaction.on_commit(lambda: cache.delete_many([_key(user_id, y, _generation()) for y in years]))
+
+
+def invalidate_all():
+    """全ユーザー・全年を無効化（コミット後に世代番号を進める）"""
+    transaction.on_commit(_bump_generation)
+
+
+def _bump_generation():
+    if cache.add(GENERATION_KEY, 2, timeout=None):
+        return
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 2, timeout=None)
@@ -53,8 +53,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "diary.instrumentation.QueryInstrumentationMiddleware",  # 処理時間・クエリ数の計測（最初に置く）
     "django.middleware.security.SecurityMiddleware",
+    "diary.static_files.StaticFilesMiddleware",  # STATIC_ROOT の配信（セッション等より前で返す）
+    "diary.db_router.ReplicaRoutingMiddleware",  # 読み取りのレプリカ振り分け（セッション保存より外側に置く）
     "django.contrib.sessions.middleware.SessionMiddleware",
+    "diary.sessions.SlidingSessionMiddleware",  # セッション期限の延長を間引く（SessionMiddleware の後ろ）
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -68,8 +72,15 @@ TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
-        "APP_DIRS": True,
         "OPTIONS": {
+            # DEBUG に関係なく、読み込んだテンプレートはプロセス内に持っておく
+            # （開発中は runserver の自動リロードがテンプレートの変更で破棄する）
+            "loaders": [
+                ("django.template.loaders.cached.Loader", [
+                    "django.template.loaders.filesystem.Loader",
+                    "django.template.loaders.app_directories.Loader",
+                ]),
+            ],
             "context_processors": [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
@@ -80,6 +91,10 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "myapp.wsgi.application"
+ASGI_APPLICATION = "myapp.asgi.application"
+
+# ASGI（uvicorn 等）で動かすときは True：カレンダー・記録画面を async 版ビューにする
+DIARY_ASYNC_VIEWS = os.getenv("DJANGO_ASYNC_VIEWS", "False").lower() == "true"
 
 # =========================
 # DB（開発: SQLite）
@@ -88,9 +103,59 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # 同時アクセス向けの設定（manage.py bench_sqlite で既定設定と比べられる）
+        "OPTIONS": {
+            # 書き込み中も読み取りを止めない（WAL）。fsync はチェックポイント時だけ
+            "init_command": (
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                "PRAGMA cache_size=-16000;"       # 16MB（負の値は KiB）
+                "PRAGMA mmap_size=134217728;"     # 128MB
+                "PRAGMA temp_store=MEMORY"
+            ),
+            # atomic() は最初に書き込みロックを取る（読んでから書くときのロック昇格の失敗を防ぐ）
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 20,  # ロック待ちの秒数（busy timeout）
+        },
+        # 接続をリクエストごとに開き直さない
+        "CONN_MAX_AGE": int(os.getenv("DJANGO_CONN_MAX_AGE", 600)),
+        "CONN_HEALTH_CHECKS": True,
+    }
+}
+
+# 読み取り専用のレプリカ（任意・カンマ区切り）。例: DJANGO_DB_REPLICA_NAMES=/srv/replica/db.sqlite3
+# 複製は DB の外（Litestream / LiteFS など）で行う。テストではプライマリと同じ DB を使う（MIRROR）
+for _i, _name in enumerate(n.strip() for n in os.getenv("DJANGO_DB_REPLICA_NAMES", "").split(",") if n.strip()):
+    DATABASES[f"replica{_i + 1}"] = {
+        **DATABASES["default"],
+        "NAME": _name,
+        "TEST": {"MIRROR": "default"},
+    }
+DATABASE_ROUTERS = ["diary.db_router.PrimaryReplicaRouter"]
+DIARY_DB_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+# 書き込んだ利用者を読み取りもプライマリに固定する秒数（レプリカの遅れより長く）
+DIARY_DB_PIN_SECONDS = int(os.getenv("DJANGO_DB_PIN_SECONDS", 10))
+
+# =========================
+# キャッシュ（開発: locmem / 本番: 環境変数で共有バックエンドを指定）
+# 例: DJANGO_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+#     DJANGO_CACHE_LOCATION=redis://127.0.0.1:6379/1
+# =========================
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("DJANGO_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("DJANGO_CACHE_LOCATION", "diary"),
     }
 }
 
+# カレンダー月サマリーのキャッシュ保持秒数（記録の保存/削除で即時破棄される）
+DIARY_MONTH_CACHE_TIMEOUT = 60 * 60 * 24
+# 月サマリーキャッシュのヒット/ミスを数える（calendar_cache_stats で見る。1リクエストごとにキャッシュへ書くので調査時だけ）
+DIARY_MONTH_CACHE_STATS = os.getenv("DJANGO_MONTH_CACHE_STATS", "False").lower() == "true"
+
+# Server-Timing ヘッダ（total / db）を付ける。処理時間・クエリ数が外から見えるので既定は DEBUG のときだけ
+DIARY_SERVER_TIMING = os.getenv("DJANGO_SERVER_TIMING", str(DEBUG)).lower() == "true"
+
 # =========================
 # 認証
 # =========================
@@ -110,6 +175,27 @@ AUTHENTICATION_BACKENDS = [
     "diary.auth_backends.EmailBackend", 
 ]
 
+# パスワードハッシュ：PBKDF2 の反復回数を環境変数で調整できるようにする
+# 回数を変えると、既存ユーザーは次回ログイン時に自動で再ハッシュされる
+# 標準の PBKDF2PasswordHasher は並べない（アルゴリズム名 "pbkdf2_sha256" が同じで、後ろにあるほうが
+# 既存ハッシュの判定に使われ、反復回数の調整が効かなくなる。標準形式のハッシュもこちらで検証できる）
+PASSWORD_HASHERS = [
+    "diary.hashers.TunablePBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+]
+DIARY_PBKDF2_ITERATIONS = int(os.getenv("DIARY_PBKDF2_ITERATIONS", "1000000"))
+
+# ログイン・登録・パスワード変更の試行回数の制限（diary/throttle.py）。ハッシュ計算の前に 429 で断る
+# 上限は {"scope:キー": (回数, 秒)} で一部だけ上書きできる（例: {"login:email": (5, 300)}）
+# 複数プロセスで数えるので CACHES は共有のバックエンド（Redis 等）にする
+DIARY_THROTTLE_ENABLED = os.getenv("DJANGO_THROTTLE_ENABLED", "True").lower() == "true"
+DIARY_THROTTLE_RATES = {}
+# 前段のプロキシの数（X-Forwarded-For からクライアントの IP を取る。直接受けるなら 0）
+DIARY_TRUSTED_PROXY_COUNT = int(os.getenv("DJANGO_TRUSTED_PROXY_COUNT", 0))
+
 
 # =========================
 # 静的/メディア
@@ -123,8 +209,56 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# 写真は内容ハッシュの名前で保存し、同じ写真を1つにまとめる（diary/storage.py）
+# 既存の photos/ は manage.py migrate_photo_storage で移行する
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    # collectstatic でハッシュ入りの名前と .gz / .br を作る（diary/static_files.py）
+    "staticfiles": {"BACKEND": "diary.static_files.CompressedManifestStaticFilesStorage"},
+    # URL は本人確認つきの diary の photo_file ビュー（MEDIA_URL は公開しない）
+    "photos": {
+        "BACKEND": "diary.storage.ContentAddressedStorage",
+        "OPTIONS": {"base_url": "/diary/media/"},
+    },
+}
+
+# 前段のプロキシが /static/ を返す構成なら False（StaticFilesMiddleware を外す）
+DIARY_SERVE_STATIC = os.getenv("DJANGO_SERVE_STATIC", "True").lower() == "true"
+
+# 写真・PDF の中身を前段のサーバーに送らせる（"" なら Django から送る / "xsendfile" / "xaccel"）
+DIARY_SENDFILE = os.getenv("DJANGO_SENDFILE", "")
+# X-Accel-Redirect 用：実ディレクトリ → nginx の internal な location
+DIARY_SENDFILE_LOCATIONS = {
+    str(MEDIA_ROOT): "/_protected/media/",
+    str(STATIC_ROOT): "/_protected/static/",
+}
+
+# 入力エラー時の写真の一時置き場（公開しないので MEDIA_ROOT の外）と保持秒数
+DIARY_UPLOAD_STAGING_ROOT = BASE_DIR / "staged_uploads"
+DIARY_UPLOAD_STAGING_MAX_AGE = 60 * 60 * 6
+
+# アップロード写真の正規化（diary/photo_upload.py）
+# 上限を超えた写真は受信中に捨てる（メモリにも一時ファイルにも溜めない）
+FILE_UPLOAD_HANDLERS = [
+    "diary.photo_upload.MaxSizeUploadHandler",
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
+DIARY_PHOTO_MAX_UPLOAD_BYTES = int(os.getenv("DJANGO_PHOTO_MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
+DIARY_PHOTO_MAX_DIMENSION = int(os.getenv("DJANGO_PHOTO_MAX_DIMENSION", 2048))  # 長辺の px
+DIARY_PHOTO_QUALITY = int(os.getenv("DJANGO_PHOTO_QUALITY", 80))
+# 先頭から、この Pillow で書ける形式を使う（"AVIF,WEBP,JPEG" なども可）
+DIARY_PHOTO_FORMATS = os.getenv("DJANGO_PHOTO_FORMATS", "WEBP,JPEG").upper().split(",")
+
+# 写真の加工・削除はジョブ（diary/jobs.py）で行う。本番は False にして manage.py run_jobs を動かす
+# True ならワーカーなしでコミット後にその場で実行する
+DIARY_JOBS_EAGER = os.getenv("DJANGO_JOBS_EAGER", str(DEBUG)).lower() == "true"
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# SQLite は INCLUDE がない警告。diary.models.CoveringIndex が列をキーの末尾に足して作るので不要
+SILENCED_SYSTEM_CHECKS = ["models.W040"]
+
 # =========================
 # ログイン遷移
 # =========================
@@ -136,7 +270,10 @@ LOGIN_URL = "login"
 # =========================
 SESSION_COOKIE_AGE = 60 * 60 * 24 * 14         # 2週間
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False  # ブラウザを閉じても期限までは維持
-SESSION_SAVE_EVERY_REQUEST = True        # アクセスの度に延長
+SESSION_SAVE_EVERY_REQUEST = False       # 毎回は保存しない（延長は SlidingSessionMiddleware）
+DIARY_SESSION_REFRESH_INTERVAL = int(os.getenv("DJANGO_SESSION_REFRESH_INTERVAL", 60 * 60))  # 延長は最大でもこの秒数に1回
+# 保存先：db（既定）/ cached_db（読み込みをキャッシュから）/ signed_cookies（サーバー側に書かない）
+SESSION_ENGINE = os.getenv("DJANGO_SESSION_ENGINE", "django.contrib.sessions.backends.db")
 SESSION_COOKIE_SAMESITE = "Lax"
 
 # セキュアクッキー/HTTPSリダイレクト
@@ -0,0 +1,234 @@
+document.addEventListener('DOMContentLoaded', () => {
+
+    // --- ログアウトモーダル ---
+    const logoutLink = document.getElementById('logout-link');
+    const modal = document.getElementById('logout-modal');
+    const confirmBtn = document.getElementById('confirm-logout');
+    const dismissEls = modal.querySelectorAll('[data-dismiss]');
+    let targetHref = null;
+
+    function openModal(href){
+        targetHref = href;
+        modal.classList.add('show');
+        modal.setAttribute('aria-hidden','false');
+    }
+    function closeModal(){
+        modal.classList.remove('show');
+        modal.setAttribute('aria-hidden','true');
+        targetHref = null;
+    }
+
+    if (logoutLink) {
+        logoutLink.addEventListener('click', (e) => {
+            e.preventDefault();
+            openModal(logoutLink.getAttribute('href'));
+        });
+    }
+
+    confirmBtn.addEventListener('click', () => {
+        if (targetHref) window.location.href = targetHref;
+    });
+
+    dismissEls.forEach(el => el.addEventListener('click', closeModal));
+    document.addEventListener('keydown', (e) => { if (e.key === 'Escape') closeModal(); });
+
+    // --- 記録削除モーダル ---
+    const deleteModal = document.getElementById('delete-modal');
+    const confirmDeleteBtn = document.getElementById('confirm-delete');
+    const dismissDeleteEls = deleteModal.querySelectorAll('[data-dismiss]');
+    let deleteTargetUrl = null;
+
+    document.querySelectorAll('[data-delete-url]').forEach(btn => {
+        btn.addEventListener('click', (e) => {
+            e.preventDefault();
+            deleteTargetUrl = btn.getAttribute('data-delete-url');
+            deleteModal.classList.add('show');
+            deleteModal.setAttribute('aria-hidden','false');
+        });
+    });
+
+    confirmDeleteBtn.addEventListener('click', () => {
+        if (deleteTargetUrl) window.location.href = deleteTargetUrl;
+    });
+    dismissDeleteEls.forEach(el => el.addEventListener('click', () => {
+        deleteModal.classList.remove('show');
+        deleteModal.setAttribute('aria-hidden','true');
+        deleteTargetUrl = null;
+    }));
+
+    // --- 写真削除モーダル ---
+    const photoDeleteModal = document.getElementById('photo-delete-modal');
+    const photoDeleteForm = document.getElementById('photo-delete-form');
+    const dismissPhotoEls = photoDeleteModal.querySelectorAll('[data-dismiss]');
+
+    // record.html のボタンを拾う
+    document.querySelectorAll('[data-photo-delete]').forEach(btn => {
+        btn.addEventListener('click', (e) => {
+            e.preventDefault();
+            // 今のURLをそのまま form の action に設定
+            photoDeleteForm.action = window.location.href;
+            // モーダルを開く
+            photoDeleteModal.classList.add('show');
+            photoDeleteModal.setAttribute('aria-hidden','false');
+        });
+    });
+
+    // モーダル閉じる
+    function closePhotoDeleteModal(){
+        photoDeleteModal.classList.remove('show');
+        photoDeleteModal.setAttribute('aria-hidden','true');
+    }
+    dismissPhotoEls.forEach(el => el.addEventListener('click', closePhotoDeleteModal));
+    document.addEventListener('keydown', (e) => { if (e.key === 'Escape') closePhotoDeleteModal(); });
+
+    // --- タイトルだけ自動縮小（項目は常に表示） ---
+    (function(){
+        const ul = document.querySelector('.app-header .header-list');
+        if (!ul) return;
+
+        // 基準値（最大画面時）：文字28px／箱260px
+        const BASE_FS = 28;   // px
+        const BASE_BOX = 260; // px
+        const MIN_FS  = 14;   // px（これ未満にはしない）
+        const MIN_BOX = 80;   // px（これ未満にはしない）
+
+        function getGaps(){
+            const cs = getComputedStyle(ul);
+            const gap  = parseFloat(cs.columnGap || cs.gap || '0') || 0;
+            const padL = parseFloat(cs.paddingLeft  || '0') || 0;
+            const padR = parseFloat(cs.paddingRight || '0') || 0;
+            return { gap, padL, padR };
+        }
+
+        function sumNonTitleWidth(){
+            const items = [...ul.children].filter(li => !li.classList.contains('site-title'));
+            return items.reduce((acc, li) => acc + li.getBoundingClientRect().width, 0);
+        }
+
+        function layout(){
+            const { gap, padL, padR } = getGaps();
+            const liCount   = ul.children.length;
+            const gapsTotal = gap * Math.max(liCount - 1, 0);
+
+            const containerW = ul.clientWidth;     // ULの内側幅
+            const nonTitleW  = sumNonTitleWidth(); // 非タイトル合計幅
+
+            // タイトルに割り当て可能な幅
+            let available = Math.max(0, containerW - nonTitleW - gapsTotal - padL - padR);
+
+            // 箱幅：最大260、availableまで縮小※MIN_BOX未満にしない
+            let box = Math.min(BASE_BOX, available);
+            box = Math.max(box, MIN_BOX);
+
+            // 文字サイズ：箱幅に比例して縮小※MIN_FS未満にしない
+            let fs = (box / BASE_BOX) * BASE_FS;
+            fs = Math.max(fs, MIN_FS);
+
+            // さらに狭いとき
+            if (available < MIN_BOX){
+            box = MIN_BOX;
+            fs  = Math.max((box / BASE_BOX) * BASE_FS, MIN_FS);
+            }
+
+            document.documentElement.style.setProperty('--hdr-title-box', box + 'px');
+            document.documentElement.style.setProperty('--hdr-title-fs',  fs  + 'px');
+        } // ←←← ここが抜けてた（関数を閉じる）
+
+        // 初回 & リサイズで適用（軽いデバウンス）
+        let rafId = null;
+        function onResize(){
+            if (rafId) cancelAnimationFrame(rafId);
+            rafId = requestAnimationFrame(() => {
+            rafId = null;
+            layout();
+            });
+        }
+
+        window.addEventListener('resize', onResize, { passive: true });
+        layout();
+        })();
+    });
+
+    /* Django messages → toast / modal */
+    (() => {
+    const msgs = window.__DJ_MESSAGES__ || [];
+    if (!msgs.length) return;
+
+    const toastArea = document.getElementById('toast-area');
+    const msgModal = document.getElementById('message-modal');
+    const msgModalBody = document.getElementById('message-modal-body');
+    const msgDismiss = msgModal ? msgModal.querySelectorAll('[data-msg-dismiss]') : [];
+
+    let prevFocusEl = null;
+
+    function openMsgModal(html){
+        if (!msgModal || !msgModalBody) return;
+
+        prevFocusEl = document.activeElement;
+
+        msgModalBody.innerHTML = html;
+        msgModal.classList.add('show');
+        msgModal.setAttribute('aria-hidden','false');
+
+        const closeBtn = msgModal.querySelector('[data-msg-dismiss]');
+        closeBtn?.focus();
+    }
+
+    function closeMsgModal(){
+        if (!msgModal) return;
+        const active = document.activeElement;
+        if (active && msgModal.contains(active) && active.blur) active.blur();
+
+        const main = document.getElementById('main');
+        if (main) main.focus();
+
+        requestAnimationFrame(() => {
+            msgModal.classList.remove('show');
+            msgModal.setAttribute('aria-hidden','true');
+        });
+    }
+    msgDismiss.forEach(el => el.addEventListener('click', closeMsgModal));
+
+    function pushToast(text, tags){
+        if (!toastArea) return;
+        const kind =
+        (tags.includes('error') && 'error') ||
+        (tags.includes('success') && 'success') ||
+        (tags.includes('warning') && 'warning') ||
+        (tags.includes('info') && 'info') ||
+        '';
+
+        const div = document.createElement('div');
+        div.className = 'toast';
+        if (kind) div.setAttribute('data-kind', kind);
+        div.textContent = text;
+        toastArea.appendChild(div);
+
+        setTimeout(() => div.classList.add('show'), 20);
+        setTimeout(() => {
+        div.classList.remove('show');
+        setTimeout(() => div.remove(), 250);
+        }, 3500);
+    }
+
+    // modal タグ付き → モーダル、それ以外 → トースト
+    const modalMsgs = [];
+    const toastMsgs = [];
+
+    msgs.forEach(m => {
+        const tags = (m.tags || '');
+        if (tags.includes('modal')) modalMsgs.push(m);
+        else toastMsgs.push(m);
+    });
+
+    // 通常はトーストで流す
+    toastMsgs.forEach(m => pushToast(m.text, m.tags));
+
+    // モーダルはまとめて1回表示
+    if (modalMsgs.length) {
+        const html = '<p style="margin:0; text-align:center;">' +
+            modalMsgs.map(x => x.text).join('<br>') +
+            '</p>';
+        openMsgModal(html);
+    }
+    })();
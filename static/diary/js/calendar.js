@@ -0,0 +1,195 @@
+document.addEventListener("DOMContentLoaded", function() {
+  const table    = document.querySelector(".calendar-table");
+  const body     = document.getElementById("calendar-body");
+  const title    = document.querySelector(".calendar-header .ym");
+  const prevLink = document.getElementById("prev-month");
+  const nextLink = document.getElementById("next-month");
+  const yearLink = document.getElementById("year-link");
+  const RECORD_URL = window.CALENDAR_CONFIG.recordUrl;
+  const PHOTO_BASE_URL = window.CALENDAR_CONFIG.photoBaseUrl;
+
+  // === 未来日ブロック用 ===
+  let TODAY = window.CALENDAR_CONFIG.today;  // サーバ時点の本日
+  const isFuture = iso => (iso && iso > TODAY);
+
+  //  色付き●と写真の描画
+  function paint(dataMap) {
+    body.querySelectorAll(".calendar-day").forEach(td => {
+      const iso = td.dataset.date;
+      const rec = dataMap[iso];
+
+      const color = rec && (typeof rec === "string" ? rec : rec.color);
+      const photo = rec && (typeof rec === "object" ? rec.photo : null);
+
+      // ●（色）
+      const slot = td.querySelector(".dot-slot");
+      if (slot && color) {
+        const a = document.createElement("a");
+        a.className = "dot";
+        a.href = RECORD_URL + "?date=" + iso;
+        a.textContent = "●";
+        a.style.color = color;
+        slot.replaceChildren(a);
+      }
+
+      // 写真
+      const box = td.querySelector(".cell-photo");
+      if (box) {
+        box.innerHTML = "";
+        if (photo) {
+          const img = document.createElement("img");
+          img.src = PHOTO_BASE_URL + photo;
+          img.alt = "";
+          box.appendChild(img);
+        }
+      }
+
+      // 未来日
+      if (isFuture(iso)) {
+        td.classList.add("is-future");
+        td.setAttribute("aria-disabled", "true");
+        const a = td.querySelector("a.dot");
+        if (a) a.setAttribute("aria-disabled", "true");
+      }
+      td.tabIndex = 0;
+    });
+  }
+
+  // 月切り替え：JSON からマス目を組み直す（サーバ描画と同じ構造）
+  function buildGrid(data) {
+    const rows = data.weeks.map((week, i) => {
+      const tr = document.createElement("tr");
+      tr.className = "week-row" + (i === 0 ? " first-week" : "");
+      week.forEach(iso => {
+        const td = document.createElement("td");
+        td.className = "calendar-day"
+          + (Number(iso.slice(5, 7)) !== data.month ? " is-outside" : "")
+          + (iso === data.today ? " is-today" : "");
+        td.dataset.date = iso;
+        td.innerHTML = '<div class="cell-top"><span class="day-number"></span><span class="dot-slot"></span></div>'
+                     + '<div class="cell-photo"></div>';
+        td.querySelector(".day-number").textContent = Number(iso.slice(8, 10));
+        tr.appendChild(td);
+      });
+      return tr;
+    });
+    body.replaceChildren(...rows);
+  }
+
+  function setNav(a, m) {
+    if (!a) return;
+    a.href = `?year=${m.year}&month=${m.month}`;
+    a.dataset.api = m.url;
+  }
+
+  // 取得できなければ false（通常のページ遷移にフォールバック）
+  // ブラウザが ETag で再検証するので、変更のない月は 304 で済む
+  async function loadMonth(url, push) {
+    let data;
+    try {
+      const res = await fetch(url, { credentials: "same-origin", headers: { "Accept": "application/json" } });
+      if (!res.ok) return false;
+      data = await res.json();
+    } catch (err) {
+      return false;
+    }
+    TODAY = data.today;
+    title.textContent = `${data.year}年 ${data.month}月`;
+    setNav(prevLink, data.prev);
+    setNav(nextLink, data.next);
+    if (yearLink) {
+      yearLink.href = `${yearLink.dataset.base}?year=${data.year}`;
+      yearLink.textContent = `${data.year}年をまとめて見る`;
+    }
+    buildGrid(data);
+    paint(data.records_by_date || {});
+    if (push) history.pushState({ api: url }, "", `?year=${data.year}&month=${data.month}`);
+    return true;
+  }
+
+  const mapEl = document.getElementById("records-by-date");
+  paint(mapEl ? JSON.parse(mapEl.textContent) : {});
+
+  [prevLink, nextLink].forEach(a => {
+    if (!a) return;
+    a.addEventListener("click", async (e) => {
+      if (!a.dataset.api || !window.fetch) return;
+      e.preventDefault();
+      if (!(await loadMonth(a.dataset.api, true))) window.location.href = a.href;
+    });
+  });
+  history.replaceState({ api: table.dataset.api }, "");
+  window.addEventListener("popstate", (e) => {
+    if (e.state && e.state.api) loadMonth(e.state.api, false);
+  });
+
+  function openRecord(e, td) {
+    const iso = td.dataset.date;
+    if (!iso) return;
+
+    if (isFuture(iso)) {
+      e.preventDefault();
+      e.stopPropagation();
+      showErrorMessageOnce("未来の日付はまだ記録できません");
+      return;
+    }
+
+    // a.dot をクリックした場合は通常遷移
+    if (e.target.closest("a.dot")) return;
+
+    // セルクリックで遷移
+    window.location.href = RECORD_URL + "?date=" + iso;
+  }
+
+  // クリック（委譲）
+  table.addEventListener("click", (e) => {
+    const td = e.target.closest("td.calendar-day");
+    if (td) openRecord(e, td);
+  });
+
+  // キーボード操作（Enter/Space）
+  table.addEventListener("keydown", (e) => {
+    if (!(e.key === "Enter" || e.key === " ")) return;
+    const td = e.target.closest("td.calendar-day");
+    if (!td) return;
+    if (!isFuture(td.dataset.date)) e.preventDefault();
+    openRecord(e, td);
+  });
+});
+
+// エラーメッセージ
+function ensureMessagesContainer() {
+  let box =
+    document.querySelector('.messages') ||
+    document.getElementById('messages');
+
+  if (!box) {
+    box = document.createElement('div');
+    box.className = 'messages';
+    
+    const main = document.querySelector('main') || document.body.firstElementChild;
+    if (main && main.parentNode) {
+      main.parentNode.insertBefore(box, main);
+    } else {
+      document.body.prepend(box);
+    }
+  }
+  return box;
+}
+
+function showErrorMessageOnce(text, key = 'generic') {
+  const wrap = ensureMessagesContainer();
+  const existing = wrap.querySelector(`.message.error[data-key="${key}"]`);
+  if (existing) return existing;
+
+  const item = document.createElement('div');
+  item.className = 'message error';
+  item.dataset.key = key;
+  item.setAttribute('role', 'alert');
+  item.setAttribute('aria-live', 'assertive');
+  item.innerHTML = `
+    <span class="message__text">${text}</span>
+  `;
+  wrap.prepend(item);
+  return item;
+}
@@ -0,0 +1,314 @@
+document.addEventListener("DOMContentLoaded", () => {
+  /* ================================
+ * 5-1) 写真プレビュー（未登録→新規選択時）
+ * ================================ */
+  const input     = document.getElementById("photo-input");
+  const wrap      = document.getElementById("photo-preview-wrap");
+  const img       = document.getElementById("photo-preview");
+  const actions   = document.getElementById("photo-new-actions");
+  const removeBtn = document.getElementById("btn-remove-photo");
+  const reselect  = document.getElementById("photo-reselect");
+  const sel = document.getElementById("mood");
+  const noteEl = document.getElementById(window.RECORD_FIELD_IDS.note);
+  if (noteEl) noteEl.placeholder = "（例）今日の気分の理由や出来事などを書いてみてください";
+
+  const closePreview = () => {
+    if (img) {
+      img.removeAttribute("src");
+    }
+    if (wrap) {
+      wrap.classList.remove("is-open");
+      wrap.setAttribute("aria-hidden", "true");
+      wrap.style.removeProperty("display");
+    }
+    if (actions) actions.style.removeProperty("display");
+    if (input) input.style.display = "block";
+  };
+
+  const staged = document.getElementById("staged_photo");
+  const clearStaged = () => { if (staged) staged.value = ""; };
+
+  const openPreview = (file, url) => {
+    if (!file && !url) return closePreview();
+    if (img) {
+      img.src = url || URL.createObjectURL(file);
+    }
+    if (wrap) {
+      wrap.classList.add("is-open");
+      wrap.setAttribute("aria-hidden", "false");
+      wrap.style.removeProperty("display");
+    }
+    if (actions) actions.style.removeProperty("display");
+    if (input) input.style.display = "none";
+  };
+
+  if (window.RESET_UPLOAD) {
+    if (input) input.value = "";
+    if (reselect) reselect.value = "";
+    closePreview();
+  }
+
+  if (wrap) closePreview();
+  const initialFile = (input && input.files && input.files[0]) ? input.files[0] : null;
+  const stagedUrl = (wrap && staged && staged.value) ? wrap.dataset.stagedUrl : "";
+  if (initialFile) openPreview(initialFile);
+  else if (stagedUrl) openPreview(null, stagedUrl);
+
+  if (input) {
+    input.addEventListener("change", () => {
+      const file = (input.files && input.files[0]) ? input.files[0] : null;
+      if (file) { clearStaged(); openPreview(file); }
+      else closePreview();
+    });
+  }
+
+  // 写真削除：全部クリア、閉じる
+  if (removeBtn) {
+    removeBtn.addEventListener("click", () => {
+      if (input)    input.value = "";
+      if (reselect) reselect.value = "";
+      clearStaged();
+      closePreview();
+    });
+  }
+
+  // 写真変更
+  if (reselect) {
+    reselect.addEventListener("change", () => {
+      const file = (reselect.files && reselect.files[0]) ? reselect.files[0] : null;
+      if (!file || !input) return;
+      const dt = new DataTransfer();
+      dt.items.add(file);
+      input.files = dt.files; 
+      clearStaged();
+      openPreview(file);
+    });
+  }
+
+
+  /* ================================
+   * 5-2) 気分セレクト：色反映
+   * ================================ */
+  (function(){
+    const sel = document.getElementById("mood");
+    const root = document.querySelector('[data-enhance="mood"]');
+    if (!sel || !root) return;
+
+    const trigger = root.querySelector('.mood-trigger');
+    const panel   = root.querySelector('.mood-panel');
+    const labelEl = trigger.querySelector('.mood-label');
+    const dotEl   = trigger.querySelector('.mood-dot');
+    const opts    = [...panel.querySelectorAll('.mood-option')];
+
+    // ネイティブselectは視覚的に隠す（送信用に残す）
+    sel.classList.add('u-vh');
+
+    // value→color 逆引き
+    const val2color = new Map(
+      [...sel.options].map(o => [o.value, o.dataset.color || ""])
+    );
+
+    function apply(val){
+      // セレクト更新
+      sel.value = val || "";
+      // トリガー表示更新
+      const color = val2color.get(sel.value) || "";
+      dotEl.style.setProperty('--c', color || 'transparent');
+
+      const txt = (() => {
+        if (!sel.value) return '選択してください';
+        const o = [...sel.options].find(o => o.value === sel.value);
+        return (o && (o.textContent || o.innerText)) || '色';
+      })();
+      labelEl.textContent = "";
+
+      // リストの選択表示
+      opts.forEach(b => b.setAttribute('aria-selected', b.dataset.value === sel.value ? 'true' : 'false'));
+
+      // ラベルと見た目（未選択→文言、選択後→ラベル非表示）
+      if (!sel.value) {
+        labelEl.textContent = '色を選択してください（必須）';
+        trigger.classList.remove('is-chosen');
+      } else {
+        labelEl.textContent = ''; // テキストは消す（●だけ見せる）
+        trigger.classList.add('is-chosen');
+      }
+
+      // 他の処理と連動させたい
+      sel.dispatchEvent(new Event('change', {bubbles:true}));
+    }
+
+    // 開閉
+    function open(){ panel.hidden = false; trigger.setAttribute('aria-expanded','true'); }
+    function close(){ panel.hidden = true; trigger.setAttribute('aria-expanded','false'); }
+    function toggle(){ (panel.hidden ? open : close)(); }
+
+    trigger.addEventListener('click', toggle);
+    document.addEventListener('click', (e) => {
+      if (!root.contains(e.target)) close();
+    });
+
+    // 選択
+    opts.forEach(b => {
+      b.addEventListener('click', () => { apply(b.dataset.value || ""); close(); });
+    });
+
+    // 初期状態
+    apply(sel.value || "");
+
+    // もし外部でselectが書き換わった時も同期
+    sel.addEventListener('change', () => apply(sel.value || ""));
+  })();
+
+  /* ================================
+   * 5-3) 既存写真の削除モーダル（右カラム）
+   * ================================ */
+  document.querySelectorAll('[data-photo-delete]').forEach(btn => {
+    btn.addEventListener('click', (e) => {
+      e.preventDefault();
+      const m = document.getElementById('photo-delete-modal');
+      if (!m) return;
+      m.classList.add('show');
+      m.setAttribute('aria-hidden','false');
+      const f = document.getElementById('photo-delete-form');
+      if (f) f.action = window.location.href;
+    });
+  });
+});
+
+/* ================================
+ * 5-4) 気分説明モーダル open/close
+ * ================================ */
+function openMoodModal() {
+  const moodModal = document.getElementById("moodModal");
+  if (!moodModal) return;
+  moodModal.classList.add("show");
+  moodModal.setAttribute("aria-hidden", "false");
+}
+function closeMoodModal() {
+  const moodModal = document.getElementById("moodModal");
+  if (!moodModal) return;
+  moodModal.classList.remove("show");
+  moodModal.setAttribute("aria-hidden", "true");
+}
+
+document.addEventListener("DOMContentLoaded", () => {
+  // 写真変更で選んだファイルに反映
+  const existingInput = document.getElementById("photo-input-existing");
+  const existingImg   = document.querySelector(".current-photo .cp-img");
+
+  if (existingInput && existingImg) {
+    existingInput.addEventListener("change", () => {
+      const file = existingInput.files && existingInput.files[0];
+      if (!file) return;
+
+      // 新しく選んだ写真を優先（一時保存分は使わない）
+      const stagedInput = document.getElementById("staged_photo");
+      if (stagedInput) stagedInput.value = "";
+
+      // 画像即時プレビュー
+      const url = URL.createObjectURL(file);
+      existingImg.src = url;
+      existingImg.style.display = "block";
+      existingImg.onload = () => URL.revokeObjectURL(url);
+    });
+  }
+
+  // 上書き確認（記録済み日付を選んだ時）
+  const form = document.querySelector('form.record-form');
+  if (!form) return;
+
+  const ovModal    = document.getElementById('overwrite-modal');
+  const confirmBtn = document.getElementById('confirm-overwrite');
+  const hidden     = document.getElementById('confirm_overwrite');
+  if (!ovModal || !confirmBtn || !hidden) return;
+
+  const dateInput = document.getElementById(window.RECORD_FIELD_IDS.date);
+
+  // 記録済み日：年ごとのビットマップ（1ビット = 1日、元日から0始まり）
+  const recordedInfo = JSON.parse(document.getElementById('recorded-days')?.textContent || "{}");
+  const recordedYears = new Map(
+    Object.entries(recordedInfo.years || {}).map(([y, b64]) => [y, decodeBitmap(b64)])
+  );
+
+  function decodeBitmap(b64){
+    const bin = atob(b64 || "");
+    return Uint8Array.from(bin, c => c.charCodeAt(0));
+  }
+
+  // true / false / null（その年をまだ読み込んでいない）
+  function recordedState(d){
+    const bits = recordedYears.get(d.slice(0, 4));
+    if (!bits) return null;
+    const y = Number(d.slice(0, 4)), m = Number(d.slice(5, 7)), day = Number(d.slice(8, 10));
+    const i = Math.round((Date.UTC(y, m - 1, day) - Date.UTC(y, 0, 1)) / 86400000);
+    return Boolean(bits[i >> 3] & (1 << (i & 7)));
+  }
+
+  async function loadYear(y){
+    const res = await fetch(`${recordedInfo.url}?year=${encodeURIComponent(y)}`, {
+      credentials: "same-origin", headers: { "Accept": "application/json" },
+    });
+    if (!res.ok) throw new Error(res.status);
+    const data = await res.json();
+    recordedYears.set(String(data.year), decodeBitmap(data.bitmap));
+  }
+
+  function openOv(){
+    ovModal.classList.add('show');
+    ovModal.setAttribute('aria-hidden','false');
+    confirmBtn.focus();
+  }
+
+  function closeOv(){
+    const active = document.activeElement;
+    if (active && ovModal.contains(active) && active.blur) active.blur();
+
+    ovModal.classList.remove('show');
+    ovModal.setAttribute('aria-hidden','true');
+  }
+
+  // 閉じる
+  ovModal.querySelectorAll('[data-ov-dismiss]').forEach(el => el.addEventListener('click', closeOv));
+  document.addEventListener('keydown', (e)=>{ if(e.key==='Escape' && ovModal.classList.contains('show')) closeOv(); });
+
+  // 日付を変えたら確認フラグ
+  if (dateInput) {
+    dateInput.addEventListener('change', () => {
+      hidden.value = "0";
+    });
+  }
+
+  // 日付が記録済なら止めて確認モーダル
+  let checked = false;
+  form.addEventListener('submit', (e) => {
+    // 2回目（確認済み）なら通す
+    if (hidden.value === "1" || checked) { checked = false; return; }
+
+    const d = dateInput ? dateInput.value : "";
+    if (!/^\d{4}-\d{2}-\d{2}$/.test(d)) return;
+
+    const state = recordedState(d);
+    // 記録済じゃない → そのまま送信（新規作成）
+    if (state === false) return;
+
+    e.preventDefault();
+    if (state === true) { openOv(); return; }
+
+    // 別の年：その年のビットマップを取ってから判定（取れなければそのまま送信）
+    loadYear(d.slice(0, 4))
+      .then(() => recordedState(d))
+      .catch(() => false)
+      .then((recorded) => {
+        if (recorded) { openOv(); return; }
+        checked = true;
+        form.requestSubmit();
+      });
+  });
+
+  confirmBtn.addEventListener('click', () => {
+    hidden.value = "1";
+    closeOv();
+    form.requestSubmit();
+  });
+});